@@ -0,0 +1,150 @@
+"""
+Офлайн-бенчмарк загрузки и поиска RagDB на синтетическом корпусе.
+
+    python benchmarks/bench_rag.py --sizes 1000 5000 --output results.json
+    python benchmarks/bench_rag.py --real-model            # с настоящей моделью эмбеддингов
+    python benchmarks/compare.py old.json new.json          # сравнить два прогона
+
+Каждый размер корпуса прогоняется в отдельном процессе, чтобы пик памяти
+не зависел от предыдущих прогонов. Результат — JSON, который можно сравнивать между версиями.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src" / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+DEFAULT_SIZES = (500, 2000, 8000)
+QUERY_COUNT = 200
+INGEST_BATCH_SIZE = 32
+REAL_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def run_size(size: int, queries: int, real_model: bool, seed: int) -> dict:
+    """Один прогон: корпус из size постов во временной базе Chroma"""
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("unidb").setLevel(logging.WARNING)
+
+    import rag_database
+    from fakes import FakeEmbedder, synthetic_posts, synthetic_queries
+
+    posts = synthetic_posts(size, seed=seed)
+    query_texts = synthetic_queries(queries, seed=seed + 1)
+
+    started = time.perf_counter()
+    for post in posts:
+        rag_database.split_chunks(rag_database.clean(post))
+    clean_split_seconds = time.perf_counter() - started
+    chars = sum(len(post) for post in posts)
+
+    with tempfile.TemporaryDirectory(prefix="ragbench_") as directory:
+        db = rag_database.RagDB(
+            db=directory,
+            name="bench",
+            model=REAL_MODEL,
+            embedder=None if real_model else FakeEmbedder()
+        )
+        ids = [f"bench_{i}" for i in range(len(posts))]
+        metadatas = [{"source": f"channel_{i % 20}", "post_id": i} for i in range(len(posts))]
+
+        started = time.perf_counter()
+        chunks = db.add_texts(posts, metadatas, ids=ids, batch_size=INGEST_BATCH_SIZE)
+        ingest_seconds = time.perf_counter() - started
+
+        db.query(query_texts[0])  # прогрев
+        latencies = []
+        for text in query_texts:
+            started = time.perf_counter()
+            db.query(text, topk=5)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        index_bytes = _dir_size(Path(directory))
+
+    return {
+        "corpus_posts": size,
+        "corpus_chars": chars,
+        "chunks": chunks,
+        "clean_split_chars_per_sec": chars / clean_split_seconds if clean_split_seconds else None,
+        "ingest_seconds": ingest_seconds,
+        "ingest_chunks_per_sec": chunks / ingest_seconds if ingest_seconds else None,
+        "query_count": len(latencies),
+        "query_p50_ms": _percentile(latencies, 50),
+        "query_p99_ms": _percentile(latencies, 99),
+        "query_mean_ms": statistics.fmean(latencies),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "index_bytes": index_bytes,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк загрузки и поиска RagDB")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Размеры корпуса (постов)")
+    parser.add_argument("--queries", type=int, default=QUERY_COUNT)
+    parser.add_argument("--real-model", action="store_true", help=f"Настоящая модель {REAL_MODEL} вместо заглушки")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Куда записать JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_size, (size, args.queries, args.real_model, args.seed))
+        print(
+            f"{size:>7} постов: {result['ingest_chunks_per_sec']:.0f} чанков/с, "
+            f"p50 {result['query_p50_ms']:.1f} мс, p99 {result['query_p99_ms']:.1f} мс, "
+            f"RSS {result['peak_rss_mb']:.0f} МБ, индекс {result['index_bytes'] / 1e6:.1f} МБ",
+            file=sys.stderr
+        )
+        results.append(result)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embedder": REAL_MODEL if args.real_model else "fake",
+            "seed": args.seed,
+            "queries": args.queries,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import json
+import sys
+
+# Для этих метрик больше — лучше, для остальных — меньше
+HIGHER_IS_BETTER = {"clean_split_chars_per_sec", "ingest_chunks_per_sec"}
+METRICS = (
+    "clean_split_chars_per_sec",
+    "ingest_chunks_per_sec",
+    "query_p50_ms",
+    "query_p99_ms",
+    "peak_rss_mb",
+    "index_bytes",
+)
+
+
+def main(old_path: str, new_path: str):
+    """Сравнить два JSON-отчёта bench_rag.py по совпадающим размерам корпуса"""
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["corpus_posts"]: r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["corpus_posts"]: r for r in json.load(f)["results"]}
+
+    for size in sorted(old.keys() & new.keys()):
+        print(f"Корпус {size} постов:")
+        for metric in METRICS:
+            before, after = old[size].get(metric), new[size].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            mark = "✅" if better and abs(change) >= 5 else ("❌" if abs(change) >= 5 else "  ")
+            print(f"  {mark} {metric:<28} {before:>14.2f} → {after:>14.2f} ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise SystemExit("Использование: python benchmarks/compare.py old.json new.json")
+    main(sys.argv[1], sys.argv[2])
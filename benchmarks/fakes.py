@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import random
+from typing import List
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+
+WORDS = (
+    "рынок биткоин курс новости анализ прогноз инвестиции акции рост падение компания отчёт "
+    "выручка прибыль технологии нейросеть модель данные обновление релиз безопасность сеть "
+    "пользователи платформа запуск проект команда разработка сервер облако стартап раунд "
+    "market bitcoin ethereum release update model data growth report launch team cloud"
+).split()
+EMOJI = ("🚀", "📈", "📉", "🔥", "💡", "⚡", "✅", "❗")
+
+
+class FakeEmbedder:
+    """
+    Детерминированная замена SentenceTransformer: вектор текста — сумма псевдослучайных
+    векторов его слов (зерно — хэш слова), нормированная. Похожие тексты дают близкие
+    векторы, поэтому поиск в Chroma ведёт себя правдоподобно, а модель не нужна.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._word_vectors = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                result[i] += self._word_vector(word)
+            norm = np.linalg.norm(result[i])
+            if norm:
+                result[i] /= norm
+        return result
+
+
+class FakeLLMResult:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """Замена ChatMistralAI: фиксированная задержка и детерминированный ответ"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, prompt: str) -> FakeLLMResult:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        digest = hashlib.sha1(str(prompt).encode("utf-8")).hexdigest()[:8]
+        return FakeLLMResult(f"Ответ {digest} на основе {len(str(prompt))} символов контекста")
+
+
+def synthetic_posts(count: int, seed: int = 0) -> List[str]:
+    """Корпус, похожий на посты Telegram-каналов: длина по лог-нормальному закону, эмодзи, ссылки, хэштеги"""
+    rng = random.Random(seed)
+    posts = []
+    for number in range(count):
+        length = min(int(rng.lognormvariate(4.0, 0.9)) + 5, 1500)
+        words = [rng.choice(WORDS) for _ in range(length)]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(EMOJI))
+        if rng.random() < 0.3:
+            words.append(f"https://t.me/channel_{rng.randint(1, 50)}/{number}")
+        if rng.random() < 0.4:
+            words.append(f"#{rng.choice(WORDS)}")
+        sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        posts.append(" ".join(sentences))
+    return posts
+
+
+def synthetic_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))) + "?" for _ in range(count)]
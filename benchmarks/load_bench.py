@@ -0,0 +1,369 @@
+"""
+Нагрузочный тест одного процесса бота: синтетические обновления Telegram подаются в настоящий
+Dispatcher с обработчиками из bot.bot.register_handlers, ответы уходят в заглушку Bot API,
+RAG и LLM заменены заглушками с настраиваемыми задержками.
+
+    python benchmarks/load_bench.py --users 10 50 100 200 --duration 30
+    python benchmarks/load_bench.py --llm-latency 3 --retrieval-latency 0.2 --output load.json
+
+Число одновременных пользователей растёт ступенями; на каждой ступени каждый пользователь
+в замкнутом цикле шлёт сообщение, ждёт ответа и делает паузу. Для каждой ступени — перцентили
+задержки ответа по типам запросов, таймауты и задержка event loop.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncGenerator, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src" / "scripts"))
+sys.path.insert(0, str(ROOT / "src" / "bot"))
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# bot.bot_instance создаёт Bot при импорте; пул Postgres тест не создаёт — пользователи живут в памяти
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST")
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message, Update
+
+DEFAULT_USERS = (10, 25, 50, 100, 200)
+DEFAULT_MIX = "ask=0.8,add_channel=0.1,stats=0.1"
+USER_ID_BASE = 10_000_000
+LAG_INTERVAL = 0.05
+# Сколько sendMessage приходит в ответ на запрос (без Postgres /add_channel грузит канал сам)
+EXPECTED_REPLIES = {"ask": 1, "add_channel": 2, "stats": 1}
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeTelegramSession(BaseSession):
+    """Заглушка Bot API: запросы не уходят в сеть, тексты sendMessage складываются в очередь чата"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+        self._replies: Dict[int, asyncio.Queue] = {}
+
+    def replies(self, chat_id: int) -> asyncio.Queue:
+        queue = self._replies.get(chat_id)
+        if queue is None:
+            queue = self._replies[chat_id] = asyncio.Queue()
+        return queue
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None) -> TelegramType:
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, SendMessage):
+            self._message_id += 1
+            self.replies(method.chat_id).put_nowait(method.text)
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text
+            )
+        return True
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class FakeRAGSystem:
+    """
+    Замена RealRAGBot с теми же методами. Поиск и загрузка канала имитируются сном
+    в asyncio.to_thread (как RagDB в настоящей системе), статистика — блокирующим сном
+    в event loop (get_stats синхронный), LLM — FakeLLM.
+    """
+
+    def __init__(self, llm, retrieval_latency: float, ingest_latency: float, stats_latency: float):
+        self.llm = llm
+        self.retrieval_latency = retrieval_latency
+        self.ingest_latency = ingest_latency
+        self.stats_latency = stats_latency
+
+    async def query_rag(self, question: str, user_id: int, dialog_context: str = "") -> str:
+        await asyncio.to_thread(time.sleep, self.retrieval_latency)
+        result = await self.llm.ainvoke(f"{dialog_context}\n\n{question}")
+        return result.content
+
+    async def parse_and_add_channel(self, channel_link: str, limit: int = 30) -> str:
+        await asyncio.to_thread(time.sleep, self.ingest_latency)
+        return f"✅ Канал {channel_link}: загружено {limit} постов"
+
+    async def parse_and_add_channels(self, channel_links: List[str], limit: int = 30) -> str:
+        results = await asyncio.gather(*(self.parse_and_add_channel(link, limit) for link in channel_links))
+        return "\n".join(results)
+
+    async def summarize_dialog(self, previous_summary: str, dialog: str) -> Optional[str]:
+        result = await self.llm.ainvoke(f"{previous_summary}\n\n{dialog}")
+        return result.content
+
+    async def sync_all_channels(self) -> Dict[str, int]:
+        return {}
+
+    def get_stats(self) -> str:
+        time.sleep(self.stats_latency)
+        return "📊 Статистика RAG базы данных (нагрузочный тест)"
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in EXPECTED_REPLIES:
+            raise ValueError(f"Неизвестный тип запроса: {kind} (есть {', '.join(EXPECTED_REPLIES)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    """Ступенчатый рост числа пользователей поверх одного Dispatcher"""
+
+    def __init__(self, bot: Bot, session: FakeTelegramSession, mix: Dict[str, float], think_time: float, reply_timeout: float):
+        self.bot = bot
+        self.session = session
+        self.mix = mix
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.dp = Dispatcher()
+        self._update_id = 0
+        self._tasks = set()
+
+        from bot.bot import register_handlers
+        register_handlers(self.dp)
+
+    def _update(self, user_id: int, text: str) -> Update:
+        self._update_id += 1
+        return Update.model_validate({
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text
+            }
+        }, context={"bot": self.bot})
+
+    def _text(self, kind: str, rng: random.Random, queries: List[str]) -> str:
+        if kind == "add_channel":
+            return f"/add_channel https://t.me/load_channel_{rng.randint(1, 50)} 30"
+        if kind == "stats":
+            return "/stats"
+        return rng.choice(queries)
+
+    async def _send(self, user_id: int, text: str, replies: int) -> float:
+        """Подать обновление как при polling (отдельной задачей) и дождаться всех ответов"""
+        queue = self.session.replies(user_id)
+        while not queue.empty():
+            queue.get_nowait()  # опоздавшие ответы на запрос, упавший по таймауту
+
+        started = time.perf_counter()
+        task = asyncio.get_running_loop().create_task(self.dp.feed_update(self.bot, self._update(user_id, text)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        for _ in range(replies):
+            await asyncio.wait_for(queue.get(), timeout=self.reply_timeout)
+        return time.perf_counter() - started
+
+    async def _user(self, user_id: int, deadline: float, queries: List[str], result: Dict[str, list], timeouts: Dict[str, int]):
+        from bot import db_pool
+
+        rng = random.Random(user_id)
+        db_pool.registered_users.add(user_id)
+        await self._send(user_id, "/session", 1)
+
+        kinds, weights = list(self.mix), list(self.mix.values())
+        loop = asyncio.get_running_loop()
+        while loop.time() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            try:
+                latency = await self._send(user_id, self._text(kind, rng, queries), EXPECTED_REPLIES[kind])
+                result[kind].append(latency * 1000)
+            except asyncio.TimeoutError:
+                timeouts[kind] += 1
+            if self.think_time:
+                await asyncio.sleep(rng.expovariate(1 / self.think_time))
+
+    async def _monitor_lag(self, samples: list):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            samples.append(max(0.0, loop.time() - started - LAG_INTERVAL) * 1000)
+
+    async def run_step(self, users: int, duration: float, first_user_id: int, queries: List[str]) -> dict:
+        result = {kind: [] for kind in self.mix}
+        timeouts = {kind: 0 for kind in self.mix}
+        lag = []
+        monitor = asyncio.get_running_loop().create_task(self._monitor_lag(lag))
+        deadline = asyncio.get_running_loop().time() + duration
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(self._user(first_user_id + i, deadline, queries, result, timeouts) for i in range(users)),
+            return_exceptions=True
+        )
+        elapsed = time.perf_counter() - started
+        monitor.cancel()
+        failed = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+
+        latencies = [value for values in result.values() for value in values]
+        return {
+            "users": users,
+            "seconds": elapsed,
+            "requests": len(latencies),
+            "requests_per_sec": len(latencies) / elapsed if elapsed else None,
+            "timeouts": sum(timeouts.values()),
+            "failed_users": len(failed),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "by_kind": {
+                kind: {
+                    "count": len(values),
+                    "timeouts": timeouts[kind],
+                    "p50_ms": _percentile(values, 50),
+                    "p95_ms": _percentile(values, 95),
+                    "p99_ms": _percentile(values, 99),
+                }
+                for kind, values in result.items()
+            },
+            "loop_lag_p50_ms": _percentile(lag, 50),
+            "loop_lag_p99_ms": _percentile(lag, 99),
+            "loop_lag_max_ms": max(lag) if lag else None,
+            "loop_lag_mean_ms": statistics.fmean(lag) if lag else None,
+        }
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return "—" if value is None else f"{value:.0f}"
+
+
+async def run(args) -> dict:
+    import rag_integration
+    from bot.dialog_writer import dialog_writer
+    from bot.handlers.llm_session import request_coalescer
+    from fakes import FakeLLM, synthetic_queries
+
+    llm = FakeLLM(latency=args.llm_latency)
+    rag_integration.rag_system = FakeRAGSystem(llm, args.retrieval_latency, args.ingest_latency, args.stats_latency)
+    if args.debounce is not None:
+        request_coalescer.debounce = args.debounce
+
+    session = FakeTelegramSession(latency=args.api_latency)
+    bot = Bot(os.environ["BOT_TOKEN"], session=session)
+    test = LoadTest(bot, session, _parse_mix(args.mix), args.think_time, args.timeout)
+    queries = synthetic_queries(500, seed=args.seed)
+
+    dialog_writer.start()
+    steps = []
+    first_user_id = USER_ID_BASE
+    try:
+        for users in args.users:
+            step = await test.run_step(users, args.duration, first_user_id, queries)
+            first_user_id += users
+            steps.append(step)
+            print(
+                f"{users:>5} польз.: {step['requests_per_sec']:.1f} запр/с, "
+                f"p50 {_format_ms(step['p50_ms'])} мс, p95 {_format_ms(step['p95_ms'])} мс, "
+                f"p99 {_format_ms(step['p99_ms'])} мс, таймаутов {step['timeouts']}, "
+                f"лаг loop p99 {_format_ms(step['loop_lag_p99_ms'])} мс / макс {_format_ms(step['loop_lag_max_ms'])} мс",
+                file=sys.stderr
+            )
+        await test.drain()
+    finally:
+        await dialog_writer.stop()
+        await bot.session.close()
+
+    slo_ms = args.slo * 1000
+    within_slo = [
+        step["users"] for step in steps
+        if not step["timeouts"] and not step["failed_users"] and step["p95_ms"] is not None and step["p95_ms"] <= slo_ms
+    ]
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "duration": args.duration,
+            "mix": args.mix,
+            "think_time": args.think_time,
+            "llm_latency": args.llm_latency,
+            "retrieval_latency": args.retrieval_latency,
+            "ingest_latency": args.ingest_latency,
+            "stats_latency": args.stats_latency,
+            "api_latency": args.api_latency,
+            "debounce": request_coalescer.debounce,
+            "slo_p95_seconds": args.slo,
+            "llm_calls": llm.calls,
+            "bot_api_calls": session.calls,
+        },
+        "max_users_within_slo": max(within_slo) if within_slo else None,
+        "steps": steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера бота")
+    parser.add_argument("--users", type=int, nargs="+", default=list(DEFAULT_USERS), help="Ступени числа одновременных пользователей")
+    parser.add_argument("--duration", type=float, default=20.0, help="Длительность ступени, с")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Доли запросов: ask, add_channel, stats")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Средняя пауза пользователя между запросами, с")
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    parser.add_argument("--ingest-latency", type=float, default=2.0)
+    parser.add_argument("--stats-latency", type=float, default=0.01, help="Блокирующее время get_stats в event loop, с")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Время ответа Bot API, с")
+    parser.add_argument("--debounce", type=float, help="Пауза RequestCoalescer (по умолчанию — как в боте)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Сколько ждать ответа, с")
+    parser.add_argument("--slo", type=float, default=5.0, help="Допустимый p95 задержки ответа, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Куда записать JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Обработчики печатают отладку в stdout — на время прогона она не нужна
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = asyncio.run(run(args))
+
+    print(f"Держит с p95 ≤ {args.slo:.1f} с: {report['max_users_within_slo'] or 0} пользователей", file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import asyncio
-from bot.db_pool import create_db_pool
+from bot.db_pool import create_db_pool, close_db_pool, get_pool
 from bot.dispatcher import dp, get_dispatcher
 from bot.bot_instance import get_bot
 from bot.command_menu import set_bot_commands
+from bot.dialog_writer import dialog_writer
+from bot.instrumentation import setup_instrumentation
+from rag_integration import start_channel_refresh, stop_channel_refresh, close_telegram_clients
+from metrics import start_metrics_server
 
 from bot.handlers.registration import command_start_handler
+from bot.handlers.admin import profile_bot
 from bot.handlers.llm_session import (
     handle_llm_message,
     handle_regular_message,
@@ -12,33 +17,64 @@ from bot.handlers.llm_session import (
     stop_llm_session,
     process_start_session,
     add_telegram_channel,
-    show_rag_stats
+    add_telegram_channels,
+    show_ingest_jobs,
+    cancel_ingest_job,
+    show_rag_stats,
+    drain_llm_requests
 )
 
 from bot.states import RegistrationStates, LLMSessionStates
 from aiogram.filters import Command
-from aiogram import F
+from aiogram import Dispatcher, F
+
+metrics_runner = None
+LLM_DRAIN_TIMEOUT = 30.0
 
 async def on_startup():
+    global metrics_runner
+    metrics_runner = await start_metrics_server()
     await set_bot_commands()
+    dialog_writer.start()
+    if await get_pool() is None:
+        # С Postgres каналы загружает и обновляет отдельный процесс worker.py
+        start_channel_refresh()
 
-async def start():
-    await create_db_pool()
+async def on_shutdown():
+    await drain_llm_requests(LLM_DRAIN_TIMEOUT)
+    await stop_channel_refresh()
+    await close_telegram_clients()
+    await dialog_writer.stop()
+    await close_db_pool()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
 
-    dp = get_dispatcher()
+def register_handlers(dp: Dispatcher):
+    """Обработчики команд и сообщений — общие для polling и webhook-воркеров"""
+    setup_instrumentation(dp)
 
     dp.message.register(command_start_handler, Command("start"), F.chat.type == "private")
     dp.message.register(start_llm_session, Command("session"))
     dp.message.register(stop_llm_session, Command("stop"))
     dp.message.register(add_telegram_channel, Command("add_channel"))
+    dp.message.register(add_telegram_channels, Command("add_channels"))
+    dp.message.register(show_ingest_jobs, Command("jobs"))
+    dp.message.register(cancel_ingest_job, Command("cancel"))
     dp.message.register(show_rag_stats, Command("stats"))
+    dp.message.register(profile_bot, Command("profile"))
 
     dp.message.register(handle_llm_message, LLMSessionStates.active_session, F.text.startswith("/").is_(False))
     dp.message.register(handle_regular_message, RegistrationStates.waiting_for_llm_session, F.text.startswith("/").is_(False))
 
     dp.callback_query.register(process_start_session, F.data == "start_session")
 
+async def start():
+    await create_db_pool()
+
+    dp = get_dispatcher()
+    register_handlers(dp)
     dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     bot = get_bot()
     await dp.start_polling(bot)
 
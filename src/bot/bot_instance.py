@@ -1,7 +1,9 @@
 from aiogram import Bot
 from bot.config import TOKEN
+from bot.instrumentation import TelegramRequestTimer
 
 bot = Bot(TOKEN)
+bot.session.middleware(TelegramRequestTimer())
 
 def get_bot():
     return bot 
\ No newline at end of file
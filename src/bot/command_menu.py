@@ -7,6 +7,9 @@ async def set_bot_commands():
         BotCommand(command="session", description="Начать сессию с AI"),
         BotCommand(command="stop", description="Завершить сессию с AI"),
         BotCommand(command="add_channel", description="Добавить Telegram канал для анализа"),
+        BotCommand(command="add_channels", description="Добавить несколько каналов сразу"),
+        BotCommand(command="jobs", description="Задачи загрузки каналов"),
+        BotCommand(command="cancel", description="Отменить задачу загрузки"),
         BotCommand(command="stats", description="Статистика RAG базы данных"),
     ]
     bot = get_bot()
@@ -4,3 +4,39 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TOKEN = os.getenv('BOT_TOKEN')
+
+
+def _database_url():
+    url = os.getenv('DATABASE_URL')
+    if url or not os.getenv('DB_HOST'):
+        return url
+    return (
+        f"postgresql://{os.getenv('DB_USER', '')}:{os.getenv('DB_PASSWORD', '')}"
+        f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'llm_bot')}"
+    )
+
+
+DATABASE_URL = _database_url()
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+
+# Режим получения обновлений: polling (один процесс) или webhook (приёмник + воркеры по user_id)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', str(os.cpu_count() or 1)))
+WEBHOOK_WORKER_BASE_PORT = int(os.getenv('WEBHOOK_WORKER_BASE_PORT', '8100'))
+# Адреса воркеров на других машинах/репликах; если заданы, локальные воркеры не запускаются
+WEBHOOK_WORKER_URLS = [url for url in os.getenv('WEBHOOK_WORKER_URLS', '').split(',') if url]
+# Номер отдельно запущенного воркера (BOT_MODE=webhook_worker); воркер 0 обновляет каналы
+WEBHOOK_WORKER_INDEX = int(os.getenv('WEBHOOK_WORKER_INDEX', '0'))
+# Адрес, на котором отдельно запущенный воркер принимает обновления; 0.0.0.0 — только вместе с токеном
+WEBHOOK_WORKER_HOST = os.getenv('WEBHOOK_WORKER_HOST', '127.0.0.1')
+# Токен, которым приёмник подписывает пересылаемые воркерам обновления (по умолчанию — WEBHOOK_SECRET)
+WEBHOOK_WORKER_TOKEN = os.getenv('WEBHOOK_WORKER_TOKEN') or WEBHOOK_SECRET
+
+# Telegram id администраторов через запятую: им доступны служебные команды (/profile)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
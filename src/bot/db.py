@@ -1,17 +1,119 @@
-from bot.db_pool import registered_users
+import time
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from bot import db_pool
+
+USER_CACHE_SIZE = 10000
+# Отрицательный ответ кэшируется ненадолго: пользователь мог зарегистрироваться на другой реплике
+USER_MISS_TTL = 5.0
+
+SQL_USER_EXISTS = "SELECT EXISTS(SELECT 1 FROM users WHERE tg_id = $1)"
+SQL_REGISTER_USER = "INSERT INTO users (tg_id) VALUES ($1) ON CONFLICT (tg_id) DO NOTHING"
+SQL_SAVE_DIALOG_MESSAGE = (
+    "INSERT INTO dialog_messages (tg_id, role, content, message_id) VALUES ($1, $2, $3, $4)"
+)
+DIALOG_COLUMNS = ["tg_id", "role", "content", "message_id", "created_at"]
+# Построчная запись для пачек, на которых упал COPY: реплики удалённых пользователей пропускаются
+SQL_SAVE_DIALOG_RECORD = (
+    "INSERT INTO dialog_messages (tg_id, role, content, message_id, created_at) "
+    "SELECT $1, $2, $3, $4, $5 WHERE EXISTS (SELECT 1 FROM users WHERE tg_id = $1)"
+)
+SQL_RECENT_DIALOG = (
+    "SELECT role, content, message_id, created_at FROM dialog_messages "
+    "WHERE tg_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2"
+)
+
+# tg_id -> (зарегистрирован ли, момент истечения записи)
+_user_cache: "OrderedDict[int, tuple]" = OrderedDict()
+
+def _cache_get(tg_id: int) -> Optional[bool]:
+    entry = _user_cache.get(tg_id)
+    if entry is None:
+        return None
+    exists, expires_at = entry
+    if expires_at is not None and expires_at < time.monotonic():
+        del _user_cache[tg_id]
+        return None
+    _user_cache.move_to_end(tg_id)
+    return exists
+
+def _cache_put(tg_id: int, exists: bool):
+    expires_at = None if exists else time.monotonic() + USER_MISS_TTL
+    _user_cache[tg_id] = (exists, expires_at)
+    _user_cache.move_to_end(tg_id)
+    if len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
 
 async def register_user_simple(tg_id: int):
     """Регистрация пользователя по ID"""
-    if not await user_exists(tg_id):
-        registered_users.add(tg_id)
+    if await user_exists(tg_id):
+        return
+
+    pool = await db_pool.get_pool()
+    if pool is None:
+        db_pool.registered_users.add(tg_id)
         print(f"👤 Пользователь {tg_id} зарегистрирован в памяти")
+    else:
+        await pool.execute(SQL_REGISTER_USER, tg_id)
+        print(f"👤 Пользователь {tg_id} зарегистрирован")
+    _cache_put(tg_id, True)
 
 async def user_exists(tg_id: int) -> bool:
-    """Проверка существования пользователя"""
-    return tg_id in registered_users
+    """Проверка существования пользователя (read-through кэш поверх Postgres)"""
+    cached = _cache_get(tg_id)
+    if cached is not None:
+        return cached
+
+    pool = await db_pool.get_pool()
+    if pool is None:
+        exists = tg_id in db_pool.registered_users
+    else:
+        exists = await pool.fetchval(SQL_USER_EXISTS, tg_id)
+    _cache_put(tg_id, exists)
+    return exists
 
 async def get_user_id(tg_id: int) -> int:
     """Получение ID пользователя (упрощенно - просто tg_id)"""
     if await user_exists(tg_id):
         return tg_id
     return None
+
+async def save_dialog_message(tg_id: int, role: str, content: str, message_id: Optional[int] = None):
+    """Сохранение реплики диалога"""
+    pool = await db_pool.get_pool()
+    if pool is None:
+        return
+    await pool.execute(SQL_SAVE_DIALOG_MESSAGE, tg_id, role, content, message_id)
+
+async def save_dialog_messages(records: List[tuple]):
+    """Пакетное сохранение реплик через COPY; записи в порядке DIALOG_COLUMNS"""
+    pool = await db_pool.get_pool()
+    if pool is None or not records:
+        return
+    await pool.copy_records_to_table("dialog_messages", records=records, columns=DIALOG_COLUMNS)
+
+async def save_dialog_records_each(records: List[tuple]) -> int:
+    """
+    Запись реплик по одной, когда COPY всей пачки не прошёл.
+    Ошибка одной строки не мешает остальным; возвращает число незаписанных реплик
+    """
+    pool = await db_pool.get_pool()
+    if pool is None or not records:
+        return 0
+    failed = 0
+    for record in records:
+        try:
+            await pool.execute(SQL_SAVE_DIALOG_RECORD, *record)
+        except Exception as e:
+            failed += 1
+            print(f"Не удалось записать реплику пользователя {record[0]}: {e}")
+    return failed
+
+async def get_recent_dialog(tg_id: int, limit: int = 20) -> List[Dict]:
+    """Последние реплики диалога пользователя в хронологическом порядке"""
+    pool = await db_pool.get_pool()
+    if pool is None:
+        return []
+    rows = await pool.fetch(SQL_RECENT_DIALOG, tg_id, limit)
+    return [dict(row) for row in reversed(rows)]
@@ -1,10 +1,43 @@
+from pathlib import Path
+from typing import Optional
 
+import asyncpg
+
+from bot.config import DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE
+
+SCHEMA_PATH = Path(__file__).parent.parent / "sql" / "init.sql"
+
+pool: Optional[asyncpg.Pool] = None
+
+# Используется, только если DATABASE_URL не задан (локальный запуск без Postgres)
 registered_users = set()
 
 async def create_db_pool():
-    global registered_users
-    registered_users = set()
-    return True
+    """Создание пула соединений с Postgres и применение схемы"""
+    global pool
+    if not DATABASE_URL:
+        print("⚠️ DATABASE_URL не задан, пользователи хранятся в памяти")
+        return None
+
+    # asyncpg сам подготавливает и кэширует запросы на каждом соединении
+    # (statement_cache_size), поэтому постоянные SQL из bot.db выполняются как prepared statements
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=10
+    )
+    async with pool.acquire() as conn:
+        await conn.execute(SCHEMA_PATH.read_text(encoding="utf-8"))
+    print(f"✅ Пул соединений Postgres создан (до {DB_POOL_MAX_SIZE} соединений)")
+    return pool
+
+async def get_pool() -> Optional[asyncpg.Pool]:
+    return pool
 
-async def get_pool():
-    return True
+async def close_db_pool():
+    """Закрытие пула соединений"""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from bot.db import save_dialog_messages, save_dialog_records_each
+from metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class DialogWriter:
+    """Write-behind буфер реплик диалога: копит их в памяти и пишет в Postgres пачками"""
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 2.0):
+        """
+        Args:
+            max_queue: Максимальное число реплик, ожидающих записи
+            batch_size: Размер пачки, при достижении которого запись идёт сразу
+            flush_interval: Максимальное время (сек) жизни реплики в буфере
+        """
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            QUEUE_DEPTH.set_function(self.queue.qsize, queue="dialog_writer")
+
+    def enqueue(self, tg_id: int, role: str, content: str, message_id: Optional[int] = None) -> bool:
+        """Поставить реплику в очередь на запись, не дожидаясь базы"""
+        record = (tg_id, role, content, message_id, datetime.now(timezone.utc))
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Очередь записи диалогов переполнена, реплика отброшена (всего {self.dropped})")
+            return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and self.queue.empty()):
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                continue
+
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stopping:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            try:
+                await save_dialog_messages(batch)
+            except Exception as e:
+                # COPY атомарен: одна плохая строка (например, пользователь уже удалён) валит всю пачку
+                logger.warning(f"COPY {len(batch)} реплик диалога не прошёл ({e}), пишу по одной")
+                failed = await save_dialog_records_each(batch)
+                if failed:
+                    logger.error(f"Не записано {failed} из {len(batch)} реплик диалога")
+        except Exception as e:
+            logger.error(f"Ошибка записи {len(batch)} реплик диалога: {e}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    async def stop(self):
+        """Дописать всё, что осталось в буфере, и остановить фоновую задачу"""
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+
+dialog_writer = DialogWriter()
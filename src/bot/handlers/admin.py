@@ -0,0 +1,31 @@
+from aiogram import types
+from aiogram.filters import CommandObject
+
+from bot.config import ADMIN_IDS
+from bot.profiler import profiler, MAX_PROFILE_SECONDS
+
+DEFAULT_PROFILE_SECONDS = 30
+
+
+async def profile_bot(message: types.Message, command: CommandObject):
+    """Снять сэмплирующий профиль работающего процесса бота (только для администраторов)"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    seconds = DEFAULT_PROFILE_SECONDS
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.answer(f"📋 Использование: /profile [секунды, до {MAX_PROFILE_SECONDS}]")
+            return
+        seconds = int(command.args.strip())
+
+    if profiler.running:
+        await message.answer("⏳ Профилирование уже идёт")
+        return
+
+    await message.answer(f"🔬 Профилирую процесс {min(seconds, MAX_PROFILE_SECONDS)} с...")
+    report = await profiler.profile(seconds)
+    if report is None:
+        await message.answer("⏳ Профилирование уже идёт")
+        return
+    await message.answer(report.format())
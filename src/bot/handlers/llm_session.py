@@ -2,18 +2,57 @@ from aiogram import types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram import F
+import asyncio
 import json
+import time
+from collections import OrderedDict
 
 from bot.states import LLMSessionStates, RegistrationStates
 from bot.dispatcher import dp
 from bot.db import user_exists
 from bot.session_context import SessionContextManager
-from rag_integration import parse_telegram_channel, query_rag_system, get_rag_stats
-
-manager = SessionContextManager()
+from bot.dialog_writer import dialog_writer
+from bot.request_coalescer import RequestCoalescer
+from bot import ingest_jobs
+from rag_integration import (
+    parse_telegram_channel,
+    parse_telegram_channels,
+    query_rag_system,
+    get_rag_stats,
+    summarize_dialog,
+    remember_dialog_question,
+    drain_queries
+)
+from metrics import HANDLER_SECONDS
+
+MAX_SESSION_CONTEXTS = 10000
+
+# Менеджеры контекста по ключу FSM (бот, чат, пользователь); самые давние вытесняются,
+# их контекст восстанавливается из состояния FSM при следующем сообщении
+_session_contexts: "OrderedDict[object, SessionContextManager]" = OrderedDict()
+
+def _remember_session_context(state: FSMContext, context_manager: SessionContextManager):
+    _session_contexts[state.key] = context_manager
+    _session_contexts.move_to_end(state.key)
+    while len(_session_contexts) > MAX_SESSION_CONTEXTS:
+        _session_contexts.popitem(last=False)
 
 async def get_session_context(state: FSMContext) -> SessionContextManager:
-    return manager
+    """Менеджер контекста сессии этого пользователя"""
+    context_manager = _session_contexts.get(state.key)
+    if context_manager is None:
+        data = await state.get_data()
+        saved = data.get("session_context")
+        context_manager = SessionContextManager.from_dict(saved) if saved else SessionContextManager()
+        context_manager.summarizer = summarize_dialog
+    _remember_session_context(state, context_manager)
+    return context_manager
+
+def new_session_context(state: FSMContext) -> SessionContextManager:
+    """Пустой контекст для новой сессии пользователя"""
+    context_manager = SessionContextManager(summarizer=summarize_dialog)
+    _remember_session_context(state, context_manager)
+    return context_manager
 
 async def save_session_context(state: FSMContext, context_manager: SessionContextManager):
     """Сохранить менеджер контекста в состояние"""
@@ -41,7 +80,7 @@ async def start_llm_session(message: types.Message, state: FSMContext):
         )
         return
 
-    context_manager = SessionContextManager()
+    context_manager = new_session_context(state)
     await save_session_context(state, context_manager)
 
     await state.set_state(LLMSessionStates.active_session)
@@ -75,16 +114,52 @@ async def stop_llm_session(message: types.Message, state: FSMContext):
         await message.answer("❌ Вы не в активной сессии с AI")
 
 async def handle_llm_message(message: types.Message, state: FSMContext):
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    dialog_writer.enqueue(message.from_user.id, "user", message.text, message.message_id)
+    request_coalescer.submit(message.from_user.id, (message, state))
+
+async def answer_llm_messages(user_id: int, items: list):
+    """Один ответ LLM на серию сообщений пользователя, собранную RequestCoalescer"""
+    started = time.perf_counter()
+    messages = [message for message, _ in items]
+    state = items[-1][1]
+    last_message = messages[-1]
+
+    await last_message.bot.send_chat_action(last_message.chat.id, "typing")
 
+    question = "\n".join(message.text for message in messages)
     context_manager = await get_session_context(state)
-    context_manager.add_message("user", message.text, message.message_id)
     dialog_context = context_manager.get_context_for_llm()
-    response = await call_llm(message.text, message.from_user.id, dialog_context)
+    try:
+        response = await call_llm(question, user_id, dialog_context)
+    except Exception as e:
+        print(f"Ошибка генерации ответа для пользователя {user_id}: {e}")
+        await last_message.answer(f"❌ Ошибка при обработке запроса: {str(e)}")
+        return
+
+    # Дальше ответ сохраняется и отправляется: новое сообщение его уже не отменит и не задаст вопрос повторно
+    request_coalescer.commit(user_id, items)
+    remember_dialog_question(user_id, question)
+    context_manager.add_message("user", question, last_message.message_id)
     context_manager.add_message("assistant", response)
+    dialog_writer.enqueue(user_id, "assistant", response)
     await save_session_context(state, context_manager)
 
-    await message.answer(response)
+    await last_message.answer(response)
+    # Отменённые (вытесненные новым сообщением) генерации сюда не доходят и в метрику не попадают
+    HANDLER_SECONDS.observe(time.perf_counter() - started, handler="answer_llm_messages")
+
+request_coalescer = RequestCoalescer(answer_llm_messages)
+
+async def drain_llm_requests(timeout: float):
+    """Дождаться ответов LLM, которые ещё не отправлены пользователям (при остановке)"""
+    async def drain():
+        await request_coalescer.drain()
+        await drain_queries()
+
+    try:
+        await asyncio.wait_for(drain(), timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Не все ответы LLM завершились за {timeout:.0f} с, они будут отменены")
 
 async def handle_regular_message(message: types.Message, state: FSMContext):
     if not await user_exists(message.from_user.id):
@@ -121,7 +196,7 @@ async def process_start_session(callback: types.CallbackQuery, state: FSMContext
         await callback.answer()
         return
 
-    context_manager = SessionContextManager()
+    context_manager = new_session_context(state)
     await save_session_context(state, context_manager)
 
     await state.set_state(LLMSessionStates.active_session)
@@ -133,6 +208,27 @@ async def process_start_session(callback: types.CallbackQuery, state: FSMContext
     )
     await callback.answer()
 
+JOB_STATUS_NAMES = {
+    "queued": "⏳ в очереди",
+    "running": "🔄 выполняется",
+    "done": "✅ готово",
+    "failed": "❌ ошибка",
+    "cancelled": "🛑 отменено",
+}
+
+async def submit_ingest_jobs(message: types.Message, channel_links: list, limit: int):
+    """Поставить загрузку каналов в очередь воркера вместо выполнения в обработчике"""
+    job_ids = [
+        await ingest_jobs.submit_job(message.from_user.id, message.chat.id, link, limit)
+        for link in channel_links
+    ]
+    jobs_text = ", ".join(f"#{job_id}" for job_id in job_ids)
+    await message.answer(
+        f"📥 Загрузка поставлена в очередь: задачи {jobs_text}\n\n"
+        "Я пришлю сообщение, когда всё будет готово.\n"
+        "Прогресс: /jobs, отмена: /cancel <номер задачи>"
+    )
+
 async def add_telegram_channel(message: types.Message):
     print("add_channel")
     """Команда для добавления Telegram канала в RAG систему"""
@@ -154,6 +250,10 @@ async def add_telegram_channel(message: types.Message):
     channel_link = args[0]
     limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else 30
 
+    if await ingest_jobs.jobs_available():
+        await submit_ingest_jobs(message, [channel_link], limit)
+        return
+
     await message.answer("🔄 Загружаю посты из канала... Это может занять некоторое время.")
     await message.bot.send_chat_action(message.chat.id, "typing")
 
@@ -172,6 +272,84 @@ async def add_telegram_channel(message: types.Message):
         print(f"[DEBUG] Ошибка: {error_msg}")
         await message.answer(error_msg)
 
+async def add_telegram_channels(message: types.Message):
+    """Команда для пакетного добавления нескольких Telegram каналов"""
+    if not await user_exists(message.from_user.id):
+        await message.answer("❌ Сначала зарегистрируйтесь с помощью /start")
+        return
+
+    args = message.text.split()[1:]
+    limit = 30
+    if args and args[-1].isdigit():
+        limit = int(args.pop())
+
+    if not args:
+        await message.answer(
+            "📋 Использование: /add_channels <ссылка> <ссылка> ... [лимит]\n\n"
+            "Пример:\n"
+            "• /add_channels https://t.me/first https://t.me/second 50\n"
+            "⚡ Каналы загружаются параллельно, по умолчанию до 30 последних постов из каждого"
+        )
+        return
+
+    if await ingest_jobs.jobs_available():
+        await submit_ingest_jobs(message, list(dict.fromkeys(args)), limit)
+        return
+
+    await message.answer(f"🔄 Загружаю посты из {len(args)} каналов... Это может занять некоторое время.")
+    await message.bot.send_chat_action(message.chat.id, "typing")
+
+    try:
+        result = await parse_telegram_channels(args, limit)
+        await message.answer(result)
+    except Exception as e:
+        await message.answer(f"❌ Ошибка при загрузке каналов: {str(e)}")
+
+async def show_ingest_jobs(message: types.Message):
+    """Команда для просмотра задач загрузки каналов"""
+    if not await user_exists(message.from_user.id):
+        await message.answer("❌ Сначала зарегистрируйтесь с помощью /start")
+        return
+
+    if not await ingest_jobs.jobs_available():
+        await message.answer("⚠️ Очередь задач недоступна: каналы загружаются сразу при добавлении")
+        return
+
+    jobs = await ingest_jobs.list_user_jobs(message.from_user.id)
+    if not jobs:
+        await message.answer("📭 У вас нет задач загрузки. Добавьте канал командой /add_channel")
+        return
+
+    lines = ["📋 **Ваши задачи загрузки:**\n"]
+    for job in jobs:
+        progress = f"{job['processed']}/{job['post_limit']}" if job["post_limit"] else str(job["processed"])
+        lines.append(
+            f"#{job['id']} {JOB_STATUS_NAMES.get(job['status'], job['status'])} — {job['channel']}\n"
+            f"   сообщений: {progress}, проиндексировано: {job['indexed_count']}"
+        )
+    await message.answer("\n".join(lines))
+
+async def cancel_ingest_job(message: types.Message):
+    """Команда для отмены задачи загрузки"""
+    if not await user_exists(message.from_user.id):
+        await message.answer("❌ Сначала зарегистрируйтесь с помощью /start")
+        return
+
+    args = message.text.split()[1:]
+    if not args or not args[0].lstrip("#").isdigit():
+        await message.answer("📋 Использование: /cancel <номер задачи>\nСписок задач: /jobs")
+        return
+
+    if not await ingest_jobs.jobs_available():
+        await message.answer("⚠️ Очередь задач недоступна")
+        return
+
+    job_id = int(args[0].lstrip("#"))
+    if await ingest_jobs.cancel_job(message.from_user.id, job_id):
+        await message.answer(f"🛑 Задача #{job_id} отменяется. Уже загруженные посты останутся в базе.")
+    else:
+        await message.answer(f"❌ Активная задача #{job_id} не найдена")
+
 async def show_rag_stats(message: types.Message):
     """Команда для просмотра статистики RAG системы"""
     if not await user_exists(message.from_user.id):
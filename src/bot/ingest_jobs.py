@@ -0,0 +1,111 @@
+from typing import Dict, List, Optional
+
+from bot import db_pool
+
+# Задача, чей воркер не обновлял heartbeat дольше этого срока, считается брошенной и подхватывается заново
+STALE_JOB_SECONDS = 60
+
+SQL_SUBMIT_JOB = (
+    "INSERT INTO ingest_jobs (tg_id, chat_id, channel, post_limit) VALUES ($1, $2, $3, $4) RETURNING id"
+)
+SQL_USER_JOBS = (
+    "SELECT id, channel, status, processed, indexed_count, failed_count, post_limit, created_at "
+    "FROM ingest_jobs WHERE tg_id = $1 ORDER BY id DESC LIMIT $2"
+)
+SQL_CANCEL_QUEUED = (
+    "UPDATE ingest_jobs SET status = 'cancelled', finished_at = now() "
+    "WHERE id = $1 AND tg_id = $2 AND status = 'queued' RETURNING id"
+)
+SQL_REQUEST_CANCEL = (
+    "UPDATE ingest_jobs SET cancel_requested = TRUE "
+    "WHERE id = $1 AND tg_id = $2 AND status = 'running' RETURNING id"
+)
+SQL_CLAIM_JOB = f"""
+UPDATE ingest_jobs SET status = 'running', started_at = COALESCE(started_at, now()), heartbeat_at = now()
+WHERE id = (
+    SELECT id FROM ingest_jobs
+    WHERE status = 'queued'
+       OR (status = 'running' AND heartbeat_at < now() - interval '{STALE_JOB_SECONDS} seconds')
+    ORDER BY id
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+)
+RETURNING *
+"""
+SQL_HEARTBEAT = "UPDATE ingest_jobs SET heartbeat_at = now() WHERE id = $1 RETURNING cancel_requested"
+SQL_START_POSITION = (
+    "UPDATE ingest_jobs SET min_post_id = $2 WHERE id = $1 AND min_post_id IS NULL"
+)
+SQL_CHECKPOINT = """
+UPDATE ingest_jobs SET
+    checkpoint_post_id = $2,
+    processed = $3,
+    newest_post_id = GREATEST(newest_post_id, $4),
+    indexed_count = indexed_count + $5,
+    failed_count = failed_count + $6,
+    heartbeat_at = now()
+WHERE id = $1
+"""
+SQL_REQUEUE_JOB = "UPDATE ingest_jobs SET status = 'queued' WHERE id = $1 AND status = 'running'"
+SQL_FINISH_JOB = (
+    "UPDATE ingest_jobs SET status = $2, result = $3, finished_at = now() WHERE id = $1"
+)
+
+async def submit_job(tg_id: int, chat_id: int, channel: str, post_limit: Optional[int]) -> int:
+    """Поставить загрузку канала в очередь"""
+    pool = await db_pool.get_pool()
+    return await pool.fetchval(SQL_SUBMIT_JOB, tg_id, chat_id, channel, post_limit)
+
+async def list_user_jobs(tg_id: int, limit: int = 10) -> List[Dict]:
+    """Последние задачи пользователя"""
+    pool = await db_pool.get_pool()
+    rows = await pool.fetch(SQL_USER_JOBS, tg_id, limit)
+    return [dict(row) for row in rows]
+
+async def cancel_job(tg_id: int, job_id: int) -> bool:
+    """Отменить задачу: ожидающую — сразу, выполняющуюся — через флаг для воркера"""
+    pool = await db_pool.get_pool()
+    if await pool.fetchval(SQL_CANCEL_QUEUED, job_id, tg_id):
+        return True
+    return bool(await pool.fetchval(SQL_REQUEST_CANCEL, job_id, tg_id))
+
+async def claim_job() -> Optional[Dict]:
+    """Забрать следующую задачу (в том числе брошенную упавшим воркером)"""
+    pool = await db_pool.get_pool()
+    row = await pool.fetchrow(SQL_CLAIM_JOB)
+    return dict(row) if row else None
+
+async def heartbeat(job_id: int) -> bool:
+    """Отметить, что воркер жив; возвращает флаг запрошенной отмены"""
+    pool = await db_pool.get_pool()
+    return bool(await pool.fetchval(SQL_HEARTBEAT, job_id))
+
+async def set_start_position(job_id: int, min_post_id: int):
+    """Зафиксировать нижнюю границу загрузки при первом запуске задачи"""
+    pool = await db_pool.get_pool()
+    await pool.execute(SQL_START_POSITION, job_id, min_post_id)
+
+async def save_checkpoint(
+    job_id: int,
+    checkpoint_post_id: int,
+    processed: int,
+    newest_post_id: int,
+    indexed: int,
+    failed: int
+):
+    """Сохранить прогресс: все посты новее checkpoint_post_id уже записаны"""
+    pool = await db_pool.get_pool()
+    await pool.execute(SQL_CHECKPOINT, job_id, checkpoint_post_id, processed, newest_post_id, indexed, failed)
+
+async def requeue_job(job_id: int):
+    """Вернуть задачу в очередь при остановке воркера — продолжится с чекпоинта"""
+    pool = await db_pool.get_pool()
+    await pool.execute(SQL_REQUEUE_JOB, job_id)
+
+async def jobs_available() -> bool:
+    """Очередь задач работает только поверх Postgres"""
+    return await db_pool.get_pool() is not None
+
+async def finish_job(job_id: int, status: str, result: str):
+    pool = await db_pool.get_pool()
+    await pool.execute(SQL_FINISH_JOB, job_id, status, result)
@@ -0,0 +1,53 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from metrics import HANDLER_SECONDS, HANDLER_ERRORS, TELEGRAM_REQUEST_SECONDS
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Полное время каждого обработчика (по имени функции) и число исключений в нём"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+
+
+class TelegramRequestTimer(BaseRequestMiddleware):
+    """Длительность каждого запроса к Bot API (sendMessage, sendChatAction, ...)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started, method=type(method).__name__)
+
+
+def setup_instrumentation(dp):
+    """Подключить замеры обработчиков к диспетчеру"""
+    dp.message.middleware(HandlerTimingMiddleware())
+    dp.callback_query.middleware(HandlerTimingMiddleware())
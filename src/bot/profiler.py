@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 120
+# Модули горячего пути, по которым строится отчёт
+FOCUS_MODULES = ("rag_database", "rag_integration", "session_context")
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class ProfileReport:
+    def __init__(self, path: Path, samples: int, stacks: Counter, seconds: float):
+        self.path = path
+        self.samples = samples
+        self.stacks = stacks
+        self.seconds = seconds
+
+    def top_functions(self, modules=FOCUS_MODULES, limit: int = 10) -> List[Tuple[str, int, int]]:
+        """(функция, сэмплов в стеке, сэмплов на вершине стека) для функций из modules"""
+        inclusive: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            for label in set(frames):
+                module = label.rsplit(".", 1)[0]
+                if module.rsplit(".", 1)[-1] in modules:
+                    inclusive[label] += count
+            if frames:
+                own[frames[-1]] += count
+        return [(label, count, own[label]) for label, count in inclusive.most_common(limit)]
+
+    def format(self) -> str:
+        lines = [
+            f"🔬 Профиль за {self.seconds:.0f} с: {self.samples} сэмплов",
+            f"📄 Стеки: {self.path}",
+            "",
+            "Горячие функции (в стеке / на вершине, % сэмплов):"
+        ]
+        top = self.top_functions()
+        if not top:
+            lines.append("  — функции rag_database, rag_integration, session_context в сэмплах не встретились")
+        for label, inclusive, own in top:
+            lines.append(
+                f"  • {label}: {100 * inclusive / max(self.samples, 1):.1f}% / {100 * own / max(self.samples, 1):.1f}%"
+            )
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер живого процесса: отдельный поток раз в interval снимает
+    стеки всех потоков (event loop, потоки asyncio.to_thread, воркеры пулов) через
+    sys._current_frames. Результат — collapsed stacks (формат flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, directory: str = PROFILE_DIR):
+        self.interval = interval
+        self.directory = Path(directory)
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, seconds: float) -> Tuple[Counter, int]:
+        stacks: Counter = Counter()
+        samples = 0
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+    def _write(self, stacks: Counter) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    async def profile(self, seconds: float) -> Optional[ProfileReport]:
+        """Снять профиль за seconds секунд; None, если профилирование уже идёт"""
+        if self.running:
+            return None
+        seconds = min(max(seconds, 1.0), MAX_PROFILE_SECONDS)
+        async with self._lock:
+            # Поток сэмплера сам себя не сэмплирует, event loop продолжает работать как обычно
+            stacks, samples = await asyncio.to_thread(self._sample, seconds)
+            path = await asyncio.to_thread(self._write, stacks)
+        return ProfileReport(path, samples, stacks, seconds)
+
+
+profiler = SamplingProfiler()
@@ -1,9 +1,10 @@
 import asyncio
+import functools
 import os
 import sys
 from pathlib import Path
-from datetime import datetime
-from typing import Optional, List, Dict
+from datetime import datetime, timezone
+from typing import Callable, Optional, List, Dict
 
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -16,12 +17,21 @@ try:
         from langchain.prompts import PromptTemplate
 
     from download_tg import TelegramPostsParser
+    from channel_sync import ChannelCursorStore, channel_key
+    from ingest_pipeline import IndexingSink
+    from query_batcher import QueryBatcher
+    from query_vectors import DialogVectors
+    from ingest_scheduler import ChannelIngestScheduler
+    import telegram_client_manager
+    from metrics import STAGE_SECONDS
 
     RAG_AVAILABLE = True
 except ImportError as e:
     print(f"[DEBUG] RAG компоненты недоступны: {e}")
     RAG_AVAILABLE = False
 
+# Период фонового обновления зарегистрированных каналов в секундах (0 — отключено)
+CHANNEL_REFRESH_INTERVAL = int(os.getenv("CHANNEL_REFRESH_INTERVAL", "1800"))
 
 RAG_SYSTEM_PROMPT = """
 Ты — интеллектуальный помощник, который отвечает на вопросы пользователей только по материалам спарсенных ими Telegram-каналов.
@@ -30,6 +40,18 @@ RAG_SYSTEM_PROMPT = """
 Работай только на русском и английском языках. Если вопрос на другом языке — скажи, что ты поддерживаешь только русский и английский.
 """
 
+DIALOG_SUMMARY_PROMPT = """Ты ведёшь краткое резюме диалога пользователя с ассистентом.
+Обнови резюме, добавив в него новые реплики. Сохрани темы, факты и договорённости, которые могут понадобиться дальше, убери детали.
+Ответь только текстом обновлённого резюме, не длиннее 600 символов.
+
+Текущее резюме:
+{summary}
+
+Новые реплики:
+{dialog}
+
+Обновлённое резюме:"""
+
 
 class RealRAGBot:
     """Реальная RAG система на основе ChromaDB"""
@@ -41,8 +63,14 @@ class RealRAGBot:
         self.db = rag_database.RagDB(
             db="./chroma_db",
             name="telegram_channels",
-            model="paraphrase-multilingual-MiniLM-L12-v2"
+            model="paraphrase-multilingual-MiniLM-L12-v2",
+            host=os.getenv("CHROMA_HOST"),
+            port=int(os.getenv("CHROMA_PORT", "8000"))
         )
+        self.cursors = ChannelCursorStore(os.path.join(self.db.path, "channel_cursors.json"))
+        self.query_batcher = QueryBatcher(self.db)
+        # Тема диалога каждого пользователя как вектор — вместо склейки вопроса с прошлыми репликами
+        self.dialog_vectors = DialogVectors()
 
         mistral_key = os.getenv("MISTRAL_API_KEY")
         if mistral_key:
@@ -120,30 +148,67 @@ class RealRAGBot:
                 "safe_to_proceed": True
             }
 
-    def _adaptive_sleep(self, batch_index: int, memory_mb: float, logger) -> None:
-        """Адаптивная пауза между операциями в зависимости от состояния памяти"""
-        import asyncio
-        import time
-
-        sleep_time = 2.0
-
-        if memory_mb > 1400:
-            sleep_time = 5.0
-            logger.info(f"Увеличенная пауза {sleep_time}s из-за высокого потребления памяти")
-        elif memory_mb > 1100:
-            sleep_time = 4.0
-            logger.info(f"Увеличенная пауза {sleep_time}s из-за умеренного потребления памяти")
-        elif memory_mb > 800:
-            sleep_time = 3.0
-            logger.info(f"Увеличенная пауза {sleep_time}s из-за потребления памяти")
-        else:
-            logger.info(f"Стандартная пауза {sleep_time}s между документами")
-
-        logger.info(f"Пауза {sleep_time}s после обработки документа {batch_index}")
-        time.sleep(sleep_time)
-
-    async def parse_and_add_channel(self, channel_link: str, limit: int = 30) -> str:
-        """Парсинг канала и добавление в векторную БД с улучшенной обработкой ошибок"""
+    async def stream_channel(
+        self,
+        channel_link: str,
+        limit: Optional[int],
+        sink,
+        min_id: Optional[int] = None,
+        max_id: int = 0,
+        group=None,
+        on_post: Optional[Callable[[str, int, int], None]] = None
+    ) -> Dict:
+        """
+        Производитель конвейера: посты канала (от новых к старым) уходят в общую стадию индексации.
+        По умолчанию загружаются посты новее курсора канала; min_id/max_id задают интервал явно.
+        on_post(id документа, post_id, номер сообщения) вызывается перед передачей поста в стадию.
+        """
+        cursor = self.cursors.get(channel_link)
+        if min_id is None:
+            min_id = cursor["last_post_id"] if cursor else 0
+        group = channel_link if group is None else group
+        result = {"seen": 0, "min_id": min_id, "last_post_id": min_id, "had_cursor": bool(cursor)}
+
+        parser = TelegramPostsParser()
+        async for post_id, doc in parser.iter_channel_documents(
+            channel_link, limit=limit, min_id=min_id, max_id=max_id
+        ):
+            result["seen"] += 1
+            result["last_post_id"] = max(result["last_post_id"], post_id)
+            if doc is None or not doc.page_content.strip():
+                continue
+            text, metadata, id_ = self._document_record(doc, channel_link)
+            if on_post is not None:
+                on_post(id_, post_id, result["seen"])
+            await sink.put(text, metadata, id_, group=group)
+
+        return result
+
+    def _finish_channel(self, channel_link: str, result: Dict, sink) -> str:
+        """Сдвинуть курсор канала после записи всех пачек и сформировать итог"""
+        indexed = sink.indexed_by_group.get(channel_link, 0)
+        failed = sink.failed_by_group.get(channel_link, 0)
+
+        if not result["seen"]:
+            if result["had_cursor"]:
+                return f"✅ Канал {channel_link} уже загружен, новых постов нет."
+            return f"❌ Не удалось загрузить посты из канала {channel_link}. Проверьте ссылку и доступность канала."
+
+        if not indexed + failed:
+            return f"❌ В канале {channel_link} не найдено постов с текстом."
+
+        # При пропущенных пачках курсор не двигаем: повторная загрузка их догрузит (id стабильны)
+        if not failed and result["last_post_id"] > result["min_id"]:
+            self.cursors.update(channel_link, result["last_post_id"])
+
+        return f"✅ Канал {channel_link} успешно проанализирован!\n📊 Загружено {indexed} из {indexed + failed} постов."
+
+    async def parse_and_add_channel(self, channel_link: str, limit: Optional[int] = 30) -> str:
+        """
+        Потоковый парсинг канала и добавление в векторную БД.
+        Страницы сообщений скачиваются, пока предыдущие уже эмбеддятся и пишутся в ChromaDB,
+        в памяти одновременно не больше одной очереди документов.
+        """
         import logging
         import gc
 
@@ -152,139 +217,146 @@ class RealRAGBot:
         try:
             logger.info(f"Начинаем обработку канала {channel_link} с лимитом {limit}")
 
-            if limit > 100:
-                limit = 100
-                logger.warning(f"Лимит ограничен до {limit} сообщений для безопасности")
-
-            parser = TelegramPostsParser()
-
-            if limit > 50:
-                parser.batch_size = 5
-
-            logger.info("Запуск парсинга канала...")
-            documents = await parser.fetch_channel_posts(channel_link, limit)
-
-            if not documents:
-                return f"❌ Не удалось загрузить посты из канала {channel_link}. Проверьте ссылку и доступность канала."
-
-            logger.info(f"Получено {len(documents)} документов, подготовка к добавлению в БД")
-
-            texts = []
-            metadatas = []
-
-            print(documents)
-
-            for doc in documents:
-                if doc.page_content.strip():
-                    text = doc.page_content
-                    if len(text) > 50000:
-                        text = text[:50000] + "... [обрезано для ChromaDB]"
-                        logger.warning(f"Текст поста {doc.metadata.get('post_id', 'unknown')} обрезан для ChromaDB")
-
-                    texts.append(text)
-
-                    metadata = {
-                        "source": channel_link,
-                        "source_type": "telegram_channel",
-                        "post_id": str(doc.metadata.get("post_id", "unknown")),
-                        "date": doc.metadata.get("date", datetime.now().isoformat()),
-                        "channel": channel_link,
-                        "text_length": doc.metadata.get("text_length", len(text))
-                    }
-                    metadatas.append(metadata)
-
-            if not texts:
-                return f"❌ В канале {channel_link} не найдено постов с текстом."
-
-            logger.info(f"Добавление {len(texts)} текстов в векторную БД...")
-
             memory_check = self._check_memory_before_db("DB_START", logger)
 
             if not memory_check["safe_to_proceed"]:
                 logger.error("Критическое состояние памяти! Операция прервана.")
                 return f"❌ Критическая нехватка памяти для обработки канала {channel_link}. Попробуйте уменьшить лимит сообщений."
 
-            logger.info(f"Обрабатываю {len(texts)} документов строго по одному для максимальной стабильности")
-
-            added_count = 0
-            max_retries = 3
-
-            try:
-                for i, (text, metadata) in enumerate(zip(texts, metadatas), 1):
-                    retry_count = 0
-                    success = False
+            async with IndexingSink(self.db, name="channels") as sink:
+                result = await self.stream_channel(channel_link, limit, sink)
 
-                    while retry_count < max_retries and not success:
-                        try:
-                            doc_memory_check = self._check_memory_before_db(f"DOC_{i}", logger)
+            gc.collect()
+            final_memory_check = self._check_memory_before_db("DB_COMPLETE", logger)
+            logger.info(
+                f"Добавление завершено: {sink.indexed_chunks} чанков, {sink.chunks_per_second():.1f} чанков/с. "
+                f"Итоговая память: {final_memory_check['current_memory_mb']:.1f} MB"
+            )
 
-                            if doc_memory_check["is_critical"]:
-                                logger.error(f"Критическое состояние памяти перед документом {i}!")
-                                raise Exception("Критическая нехватка памяти")
+            return self._finish_channel(channel_link, result, sink)
 
-                            if doc_memory_check["available_memory_mb"] < 100:
-                                logger.error(f"Недостаточно доступной памяти для документа {i}!")
-                                raise Exception("Недостаточно памяти")
+        except Exception as e:
+            logger.error(f"Критическая ошибка при обработке канала {channel_link}: {e}")
+            gc.collect()
+            raise Exception(f"Ошибка при обработке канала {channel_link}: {str(e)}")
 
-                            logger.info(f"Добавление документа {i}/{len(texts)} | Память: {doc_memory_check['current_memory_mb']:.1f} MB")
-                            logger.info(f"Добавление документа: {texts}")
+    async def parse_and_add_channels(self, channel_links: List[str], limit: Optional[int] = 30) -> str:
+        """Параллельная загрузка нескольких каналов с общей стадией эмбеддинга"""
+        import logging
 
-                            self.db.add_texts(
-                                texts=[text],
-                                metadatas=[metadata],
-                                source_name=f"{channel_link}_doc_{i}"
-                            )
+        logger = logging.getLogger(__name__)
 
-                            added_count += 1
-                            logger.info(f"✅ Документ {i} добавлен успешно ({added_count}/{len(texts)})")
+        memory_check = self._check_memory_before_db("DB_START", logger)
+        if not memory_check["safe_to_proceed"]:
+            return "❌ Критическая нехватка памяти для обработки каналов. Попробуйте позже."
 
-                            gc.collect()
+        channel_links = list(dict.fromkeys(channel_links))
+        scheduler = ChannelIngestScheduler(TelegramPostsParser().manager)
 
-                            self._adaptive_sleep(i, doc_memory_check["current_memory_mb"], logger)
+        async with IndexingSink(self.db, name="channels") as sink:
+            results = await scheduler.run({
+                link: functools.partial(self.stream_channel, link, limit, sink)
+                for link in channel_links
+            })
 
-                            success = True
+        logger.info(
+            f"Загружено {len(channel_links)} каналов: {sink.indexed_chunks} чанков, "
+            f"{sink.chunks_per_second():.1f} чанков/с"
+        )
 
-                        except Exception as doc_error:
-                            retry_count += 1
-                            logger.error(f"Ошибка добавления документа {i}, попытка {retry_count}: {doc_error}")
+        report = []
+        for link in channel_links:
+            result = results[link]
+            if isinstance(result, Exception):
+                report.append(f"❌ {link}: {result}")
+            else:
+                report.append(self._finish_channel(link, result, sink))
+        return "\n\n".join(report)
+
+    def _document_record(self, doc, channel_link: str):
+        """Текст, метаданные и стабильный id поста для записи в векторную БД"""
+        text = doc.page_content
+        if len(text) > 50000:
+            text = text[:50000] + "... [обрезано для ChromaDB]"
+        post_id = str(doc.metadata.get("post_id", "unknown"))
+        metadata = {
+            "source": channel_link,
+            "source_type": "telegram_channel",
+            "post_id": post_id,
+            "date": doc.metadata.get("date", datetime.now().isoformat()),
+            "channel": channel_link,
+            "text_length": doc.metadata.get("text_length", len(text))
+        }
+        return text, metadata, f"{channel_key(channel_link)}_{post_id}"
+
+    def _documents_to_texts(self, documents, channel_link: str):
+        """Тексты, метаданные и id постов для записи в векторную БД"""
+        records = [self._document_record(doc, channel_link) for doc in documents if doc.page_content.strip()]
+        texts = [text for text, _, _ in records]
+        metadatas = [metadata for _, metadata, _ in records]
+        ids = [id_ for _, _, id_ in records]
+        return texts, metadatas, ids
+
+    async def sync_channel(self, channel_link: str) -> int:
+        """Догрузить новые и переиндексировать отредактированные посты канала по курсору"""
+        import logging
 
-                            if retry_count < max_retries:
-                                gc.collect()
+        logger = logging.getLogger(__name__)
 
-                                import time
-                                time.sleep(3.0)
-                                logger.info(f"Повторная попытка добавления документа {i}")
-                            else:
-                                logger.error(f"Не удалось добавить документ {i} после {max_retries} попыток")
-                                break
+        cursor = self.cursors.get(channel_link)
+        if not cursor:
+            return 0
+
+        channel = cursor["channel"]
+        synced_at = datetime.now(timezone.utc)
+        parser = TelegramPostsParser()
+        new_docs, edited_docs, last_post_id = await parser.fetch_channel_updates(
+            channel,
+            min_id=cursor["last_post_id"],
+            edited_since=datetime.fromisoformat(cursor["synced_at"]) if cursor.get("synced_at") else None
+        )
 
-                    if not success:
-                        logger.warning(f"Пропуск документа {i} из-за критических ошибок")
+        for doc in edited_docs:
+            await asyncio.to_thread(self.db.delete_where, {"$and": [
+                {"channel": channel},
+                {"post_id": str(doc.metadata.get("post_id"))}
+            ]})
 
-                final_memory_check = self._check_memory_before_db("DB_COMPLETE", logger)
-                logger.info(f"Добавление завершено. Итоговая память: {final_memory_check['current_memory_mb']:.1f} MB")
+        texts, metadatas, ids = self._documents_to_texts(new_docs + edited_docs, channel)
+        if texts:
+            await asyncio.to_thread(self.db.add_texts, texts, metadatas, source_name=channel, ids=ids)
 
-                return f"✅ Канал {channel_link} успешно проанализирован!\n📊 Загружено {added_count} из {len(texts)} постов."
+        self.cursors.update(channel, last_post_id, synced_at=synced_at)
+        logger.info(f"Канал {channel} синхронизирован: {len(texts)} постов проиндексировано")
+        return len(texts)
 
-            except Exception as db_error:
-                logger.error(f"Критическая ошибка при добавлении в БД: {db_error}")
-                gc.collect()
-                raise Exception(f"Ошибка при сохранении в векторную БД: {str(db_error)}")
+    async def sync_all_channels(self) -> Dict[str, int]:
+        """Синхронизировать все зарегистрированные каналы"""
+        import logging
 
-        except Exception as e:
-            logger.error(f"Критическая ошибка при обработке канала {channel_link}: {e}")
-            gc.collect()
-            raise Exception(f"Ошибка при обработке канала {channel_link}: {str(e)}")
+        logger = logging.getLogger(__name__)
+        result = {}
+        for channel in self.cursors.channels():
+            try:
+                result[channel] = await self.sync_channel(channel)
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления канала {channel}: {e}")
+        return result
 
     async def query_rag(self, question: str, user_id: int, dialog_context: str = "", topk: int = 5) -> str:
         """Запрос к RAG системе с учетом контекста диалога"""
         try:
-            # Формируем улучшенный запрос с учетом контекста диалога
-            enhanced_query = self._create_enhanced_query(question, dialog_context)
+            if not dialog_context:
+                # Новая или очищенная сессия — прошлая тема больше не действует
+                self.dialog_vectors.reset(user_id)
 
             print(dialog_context)
 
-            docs = self.db.query(enhanced_query, topk=topk)
+            # Тема диалога обновляется в remember_question, когда ответ зафиксирован:
+            # вытесненная новым сообщением генерация не должна сдвигать её
+            docs = await self.query_batcher.query(
+                question, topk=topk, context_vector=self.dialog_vectors.get(user_id)
+            )
 
             if not docs:
                 return (
@@ -309,7 +381,8 @@ class RealRAGBot:
                         question, dialog_context, rag_context
                     )
 
-                    result = self.llm.invoke(full_prompt)
+                    with STAGE_SECONDS.time(stage="llm"):
+                        result = await self.llm.ainvoke(full_prompt)
                     llm_response = getattr(result, "content", None) or getattr(result, "text", None) or str(result)
 
                     return llm_response
@@ -338,30 +411,12 @@ class RealRAGBot:
         except Exception as e:
             return f"❌ Ошибка при поиске: {str(e)}"
 
-    def _create_enhanced_query(self, question: str, dialog_context: str) -> str:
-        """Создать улучшенный запрос с учетом контекста диалога"""
-        if not dialog_context:
-            return question
-
-        # Извлекаем ключевые термины из контекста
-        context_lines = dialog_context.split('\n')
-        recent_topics = []
-
-        for line in context_lines[-5:]:  # Последние 5 строк контекста
-            if 'Пользователь:' in line:
-                user_text = line.split('Пользователь:')[-1].strip()
-                if user_text and len(user_text) > 10:
-                    # Берем первые несколько слов как тему
-                    words = user_text.split()[:5]
-                    if len(words) >= 2:
-                        recent_topics.append(' '.join(words))
-
-        if recent_topics:
-            enhanced_query = f"{question} {' '.join(recent_topics[-2:])}"  # Добавляем последние 2 темы
-        else:
-            enhanced_query = question
-
-        return enhanced_query[:500]  # Ограничиваем длину запроса
+    def remember_question(self, user_id: int, question: str):
+        """Учесть вопрос в теме диалога пользователя после того, как ответ на него зафиксирован"""
+        # Эмбеддинг вопроса уже в кэше после поиска — тема обновляется без обращения к модели
+        question_vector = self.db.cached_query_vector(question)
+        if question_vector is not None:
+            self.dialog_vectors.update(user_id, question_vector)
 
     def _create_context_aware_prompt(self, question: str, dialog_context: str, rag_context: str) -> str:
         """Создать промпт с учетом диалогового контекста"""
@@ -393,6 +448,16 @@ class RealRAGBot:
 
         return prompt
 
+    async def summarize_dialog(self, previous_summary: str, dialog: str) -> Optional[str]:
+        """Свернуть вытесненные реплики диалога в накопительное резюме"""
+        if not self.llm_available:
+            return None
+
+        prompt = DIALOG_SUMMARY_PROMPT.format(summary=previous_summary or "(пусто)", dialog=dialog)
+        with STAGE_SECONDS.time(stage="summary_llm"):
+            result = await self.llm.ainvoke(prompt)
+        return getattr(result, "content", None) or getattr(result, "text", None) or str(result)
+
     def get_stats(self) -> str:
         """Статистика RAG базы данных"""
         try:
@@ -442,6 +507,11 @@ class MockRAGBot:
 
         return f"⚠️ Заглушка: канал {channel_link} 'добавлен' ({limit} постов)\n🔧 Для полной функциональности установите зависимости RAG"
 
+    async def parse_and_add_channels(self, channel_links: List[str], limit: int = 30) -> str:
+        """Парсинг нескольких каналов (заглушка)"""
+        results = await asyncio.gather(*(self.parse_and_add_channel(link, limit) for link in channel_links))
+        return "\n\n".join(results)
+
     async def query_rag(self, question: str, user_id: int, dialog_context: str = "") -> str:
         """Запрос к RAG системе (заглушка)"""
         await asyncio.sleep(0.5)
@@ -462,6 +532,14 @@ class MockRAGBot:
             f"В полной версии здесь был бы реальный ответ на основе анализа {len(self.channels_data)} каналов."
         )
 
+    async def sync_all_channels(self) -> Dict[str, int]:
+        """Фоновое обновление каналов (заглушка)"""
+        return {}
+
+    async def summarize_dialog(self, previous_summary: str, dialog: str) -> Optional[str]:
+        """Резюмирование диалога (заглушка) — используется простое резюме"""
+        return None
+
     def get_stats(self) -> str:
         """Статистика (заглушка)"""
         if not self.channels_data:
@@ -491,11 +569,72 @@ async def parse_telegram_channel(channel_link: str, limit: int = 30) -> str:
     return await rag_system.parse_and_add_channel(channel_link, limit)
 
 
+async def parse_telegram_channels(channel_links: List[str], limit: int = 30) -> str:
+    """Параллельный парсинг нескольких telegram каналов"""
+    return await rag_system.parse_and_add_channels(channel_links, limit)
+
+
 async def query_rag_system(question: str, user_id: int, dialog_context: str = "") -> str:
     """Запрос к RAG системе с учетом контекста диалога"""
     return await rag_system.query_rag(question, user_id, dialog_context)
 
 
+def remember_dialog_question(user_id: int, question: str):
+    """Обновить тему диалога вопросом, ответ на который уже отправляется пользователю"""
+    remember_question = getattr(rag_system, "remember_question", None)
+    if remember_question is not None:
+        remember_question(user_id, question)
+
+
+async def summarize_dialog(previous_summary: str, dialog: str) -> Optional[str]:
+    """Фоновое резюмирование вытесненной части диалога"""
+    return await rag_system.summarize_dialog(previous_summary, dialog)
+
+
 def get_rag_stats() -> str:
     """Получить статистику RAG системы"""
     return rag_system.get_stats()
+
+
+_channel_refresh_task: Optional[asyncio.Task] = None
+
+
+async def _channel_refresh_loop(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        synced = await rag_system.sync_all_channels()
+        if synced:
+            print(f"🔄 Фоновое обновление каналов: {synced}")
+
+
+def start_channel_refresh(interval: int = CHANNEL_REFRESH_INTERVAL):
+    """Запустить периодическую догрузку новых постов всех загруженных каналов"""
+    global _channel_refresh_task
+    if interval <= 0 or (_channel_refresh_task and not _channel_refresh_task.done()):
+        return
+    _channel_refresh_task = asyncio.get_running_loop().create_task(_channel_refresh_loop(interval))
+
+
+async def stop_channel_refresh():
+    global _channel_refresh_task
+    if _channel_refresh_task:
+        _channel_refresh_task.cancel()
+        try:
+            await _channel_refresh_task
+        except asyncio.CancelledError:
+            pass
+        _channel_refresh_task = None
+
+
+
+async def drain_queries():
+    """Дождаться поиска, уже переданного в QueryBatcher"""
+    query_batcher = getattr(rag_system, "query_batcher", None)
+    if query_batcher is not None:
+        await query_batcher.drain()
+
+
+async def close_telegram_clients():
+    """Закрыть общие соединения с Telegram при остановке бота"""
+    if RAG_AVAILABLE:
+        await telegram_client_manager.disconnect_all()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# (ключ пользователя, накопленные элементы) -> обработка одной объединённой генерации
+BatchHandler = Callable[[Hashable, List[Any]], Awaitable[None]]
+
+
+@dataclass
+class _UserSlot:
+    pending: List[Any] = field(default_factory=list)
+    inflight: List[Any] = field(default_factory=list)
+    debounce_task: Optional[asyncio.Task] = None
+    generation_task: Optional[asyncio.Task] = None
+
+
+class RequestCoalescer:
+    """
+    Диспетчер запросов по пользователям.
+    Серия сообщений, пришедших с паузами меньше debounce, объединяется в одну генерацию.
+    Новое сообщение отменяет ещё не отправленный ответ на предыдущие — их текст
+    присоединяется к следующей генерации. Когда обработчик вызвал commit (ответ готов и
+    сохраняется), генерация уже не отменяется: следующая ждёт её и не повторяет её вопросы.
+    На пользователя — не больше одной активной генерации.
+    """
+
+    def __init__(self, handler: BatchHandler, debounce: float = 0.8):
+        self.handler = handler
+        self.debounce = debounce
+        self.superseded = 0
+        self._slots: Dict[Hashable, _UserSlot] = {}
+
+    def submit(self, key: Hashable, item: Any):
+        """Добавить сообщение пользователя; генерация стартует после паузы debounce"""
+        slot = self._slots.setdefault(key, _UserSlot())
+        slot.pending.append(item)
+
+        if slot.debounce_task and not slot.debounce_task.done():
+            slot.debounce_task.cancel()
+        slot.debounce_task = asyncio.get_running_loop().create_task(self._debounce(key, slot))
+
+    async def drain(self):
+        """Дождаться отложенных и идущих генераций (при остановке процесса)"""
+        while True:
+            tasks = [
+                task
+                for slot in self._slots.values()
+                for task in (slot.debounce_task, slot.generation_task)
+                if task is not None and not task.done()
+            ]
+            if not tasks:
+                return
+            # Отложенная пачка по истечении паузы запускает генерацию — поэтому проверяем снова
+            await asyncio.wait(tasks)
+
+    def commit(self, key: Hashable, items: List[Any]):
+        """Ответ на items готов: дальше генерация не отменяется, а её сообщения не переносятся в следующую"""
+        slot = self._slots.get(key)
+        if slot is not None and slot.inflight is items:
+            slot.inflight = []
+
+    def active_generations(self) -> int:
+        return sum(1 for s in self._slots.values() if s.generation_task and not s.generation_task.done())
+
+    async def _debounce(self, key: Hashable, slot: _UserSlot):
+        await asyncio.sleep(self.debounce)
+
+        previous = slot.generation_task
+        if previous and not previous.done():
+            if slot.inflight:
+                # Ответ на прошлую серию устарел — его вопросы уйдут в новую генерацию
+                slot.pending = slot.inflight + slot.pending
+                slot.inflight = []
+                previous.cancel()
+                self.superseded += 1
+            # Иначе ответ уже зафиксирован (commit) и отправляется — просто дожидаемся его.
+            # wait, а не await previous: отмена самого _debounce (пришло ещё сообщение) не должна
+            # теряться вместе с CancelledError отменённой генерации
+            await asyncio.wait({previous})
+
+        items, slot.pending = slot.pending, []
+        slot.inflight = items
+        slot.generation_task = asyncio.get_running_loop().create_task(self._generate(key, slot, items))
+
+    async def _generate(self, key: Hashable, slot: _UserSlot, items: List[Any]):
+        try:
+            await self.handler(key, items)
+        except Exception as e:
+            logger.error(f"Ошибка обработки запроса пользователя {key}: {e}")
+        finally:
+            if slot.inflight is items:
+                slot.inflight = []
+            idle = not slot.pending and not slot.inflight and (
+                slot.debounce_task is None or slot.debounce_task.done()
+            )
+            if idle and self._slots.get(key) is slot:
+                del self._slots[key]
@@ -1,8 +1,13 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable, Awaitable
 from datetime import datetime
+import asyncio
 import json
+import logging
 from dataclasses import dataclass, asdict
 
+logger = logging.getLogger(__name__)
+
+CONTEXT_HEADER = "--- Текущий контекст диалога ---"
 
 @dataclass
 class Message:
@@ -12,17 +17,48 @@ class Message:
     message_id: Optional[int] = None
 
 
+# (предыдущее резюме, вытесненные реплики) -> новое резюме или None при неудаче
+Summarizer = Callable[[str, str], Awaitable[Optional[str]]]
+
+
 class SessionContextManager:
-    def __init__(self, max_recent_messages: int = 6, max_context_length: int = 3000):
+    def __init__(
+        self,
+        max_recent_messages: int = 6,
+        max_context_length: int = 3000,
+        summarizer: Optional[Summarizer] = None
+    ):
         """
         Args:
             max_recent_messages: Количество последних сообщений для полного хранения
             max_context_length: Максимальная длина итогового контекста в символах
+            summarizer: Асинхронная LLM-функция для фонового сворачивания вытесненных
+                сообщений в накопительное резюме. Без неё используется _create_summary
         """
         self.messages: List[Message] = []
         self.max_recent_messages = max_recent_messages
         self.max_context_length = max_context_length
-        self.session_summary = ""
+        self.summarizer = summarizer
+        self._session_summary = ""
+
+        # Вытесненные сообщения, ещё не свёрнутые LLM в резюме
+        self._unsummarized: List[Message] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+        # Отрендеренные строки сообщений (параллельно self.messages) и их суммарная длина
+        self._lines: List[str] = []
+        self._lines_length = 0
+        # Готовый контекст для LLM; None — нужно перерендерить после изменения
+        self._rendered: Optional[str] = None
+
+    @property
+    def session_summary(self) -> str:
+        return self._session_summary
+
+    @session_summary.setter
+    def session_summary(self, value: str):
+        self._session_summary = value
+        self._rendered = None
 
     def add_message(self, role: str, content: str, message_id: Optional[int] = None):
         """Добавить сообщение в контекст"""
@@ -33,10 +69,23 @@ class SessionContextManager:
             message_id=message_id
         )
 
-        self.messages.append(message)
+        self._append(message)
 
         self._manage_context_size()
 
+    def _append(self, message: Message):
+        """Добавить сообщение вместе с его отрендеренной строкой"""
+        line = self._render_line(message)
+        self.messages.append(message)
+        self._lines.append(line)
+        self._lines_length += len(line)
+        self._rendered = None
+
+    @staticmethod
+    def _render_line(message: Message) -> str:
+        role_name = "Пользователь" if message.role == "user" else "Ассистент"
+        return f"{role_name}: {message.content}"
+
     def _manage_context_size(self):
         """Умное управление размером контекста"""
         if len(self.messages) <= self.max_recent_messages:
@@ -46,9 +95,66 @@ class SessionContextManager:
         recent_messages = self.messages[-self.max_recent_messages:]
 
         if old_messages:
-            self.session_summary = self._create_summary(old_messages)
+            if self.summarizer:
+                self._unsummarized.extend(old_messages)
+                self._schedule_summary()
+            else:
+                self.session_summary = self._create_summary(old_messages)
 
         self.messages = recent_messages
+        self._lines = self._lines[-self.max_recent_messages:]
+        self._lines_length = sum(len(line) for line in self._lines)
+        self._rendered = None
+
+    def _schedule_summary(self):
+        """Запустить фоновое резюмирование, не блокируя текущий запрос"""
+        if self._summary_task and not self._summary_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._summary_task = loop.create_task(self._summarize_pending())
+
+    async def _summarize_pending(self):
+        """Инкрементально свернуть вытесненные сообщения в накопительное резюме"""
+        while self._unsummarized:
+            batch = list(self._unsummarized)
+            dialog = "\n".join(self._render_line(m) for m in batch)
+
+            try:
+                summary = await self.summarizer(self._session_summary, dialog)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка фонового резюмирования диалога: {e}")
+                summary = None
+
+            if summary and summary.strip():
+                self._session_summary = self._clip_summary(summary.strip())
+            else:
+                # Без ответа LLM пачка не теряется: её грубое резюме дописывается к накопленному,
+                # а самое старое обрезается, чтобы резюме не вытеснило из контекста сами сообщения
+                rough = self._create_summary(batch)
+                combined = f"{self._session_summary}. {rough}" if self._session_summary else rough
+                self._session_summary = self._clip_summary(combined)
+            del self._unsummarized[:len(batch)]
+            self._rendered = None
+
+    def _clip_summary(self, summary: str) -> str:
+        """Резюме не длиннее трети контекста; обрезается начало — самые старые темы"""
+        limit = self.max_context_length // 3
+        if len(summary) <= limit:
+            return summary
+        return "…" + summary[-(limit - 1):]
+
+    def _display_summary(self) -> str:
+        """Резюме для контекста: накопительное плюс грубое по ещё не свёрнутым сообщениям"""
+        if not self._unsummarized:
+            return self._session_summary
+
+        pending = self._create_summary(self._unsummarized)
+        return f"{self._session_summary}. {pending}" if self._session_summary else pending
 
     def _create_summary(self, messages: List[Message]) -> str:
         """Создать краткое резюме сообщений"""
@@ -76,38 +182,46 @@ class SessionContextManager:
 
     def get_context_for_llm(self) -> str:
         """Получить контекст для отправки в LLM"""
-        context_parts = []
-
-        if self.session_summary:
-            context_parts.append(f"[Ранее в диалоге: {self.session_summary}]")
-
-        if self.messages:
-            context_parts.append("\n--- Текущий контекст диалога ---")
-            for msg in self.messages:
-                role_name = "Пользователь" if msg.role == "user" else "Ассистент"
-                context_parts.append(f"{role_name}: {msg.content}")
-
-        full_context = "\n".join(context_parts)
-
-        if len(full_context) > self.max_context_length:
-            if self.session_summary:
-                summary_part = f"[Ранее в диалоге: {self.session_summary}]\n"
-                available_length = self.max_context_length - len(summary_part) - 100
-            else:
-                summary_part = ""
-                available_length = self.max_context_length - 100
-
-            recent_context = ""
-            for msg in reversed(self.messages):
-                role_name = "Пользователь" if msg.role == "user" else "Ассистент"
-                msg_text = f"{role_name}: {msg.content}\n"
-                if len(recent_context) + len(msg_text) > available_length:
-                    break
-                recent_context = msg_text + recent_context
-
-            full_context = summary_part + "--- Текущий контекст диалога ---\n" + recent_context
-
-        return full_context.strip()
+        if self._rendered is None:
+            self._rendered = self._render_context()
+        return self._rendered
+
+    def _render_context(self) -> str:
+        """Собрать контекст из готовых строк, укладываясь в max_context_length"""
+        summary = self._display_summary()
+        summary_part = f"[Ранее в диалоге: {summary}]" if summary else ""
+
+        if not self._lines:
+            return summary_part
+
+        # Длина полного контекста: резюме, "\n" + заголовок и строки сообщений через "\n"
+        full_length = 1 + len(CONTEXT_HEADER) + self._lines_length + len(self._lines)
+        if summary_part:
+            full_length += len(summary_part) + 1
+
+        if full_length <= self.max_context_length:
+            parts = [summary_part] if summary_part else []
+            parts.append("\n" + CONTEXT_HEADER)
+            parts.extend(self._lines)
+            return "\n".join(parts).strip()
+
+        if summary_part:
+            available_length = max(0, self.max_context_length - len(summary_part) - 1 - 100)
+        else:
+            available_length = self.max_context_length - 100
+
+        used_length = 0
+        start = len(self._lines)
+        for line in reversed(self._lines):
+            if used_length + len(line) + 1 > available_length:
+                break
+            used_length += len(line) + 1
+            start -= 1
+
+        parts = [summary_part] if summary_part else []
+        parts.append(CONTEXT_HEADER)
+        parts.extend(self._lines[start:])
+        return "\n".join(parts).strip()
 
     def get_recent_user_messages(self, count: int = 3) -> List[str]:
         """Получить последние сообщения пользователя для формирования запроса"""
@@ -119,8 +233,16 @@ class SessionContextManager:
 
     def clear_session(self):
         """Очистить сессию"""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+        self._unsummarized.clear()
+
         self.messages.clear()
         self.session_summary = ""
+        self._lines.clear()
+        self._lines_length = 0
+        self._rendered = None
 
     def get_session_stats(self) -> Dict:
         """Получить статистику сессии"""
@@ -131,7 +253,7 @@ class SessionContextManager:
             "total_messages": len(self.messages),
             "user_messages": user_count,
             "assistant_messages": assistant_count,
-            "has_summary": bool(self.session_summary),
+            "has_summary": bool(self._display_summary()),
             "context_length": len(self.get_context_for_llm())
         }
 
@@ -139,7 +261,7 @@ class SessionContextManager:
         """Сериализация для хранения в FSMContext"""
         return {
             "messages": [asdict(msg) for msg in self.messages],
-            "session_summary": self.session_summary,
+            "session_summary": self._display_summary(),
             "max_recent_messages": self.max_recent_messages,
             "max_context_length": self.max_context_length
         }
@@ -161,6 +283,6 @@ class SessionContextManager:
                 timestamp=datetime.fromisoformat(msg_data["timestamp"]),
                 message_id=msg_data.get("message_id")
             )
-            instance.messages.append(msg)
+            instance._append(msg)
 
         return instance
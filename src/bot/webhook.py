@@ -0,0 +1,286 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram.types import Update
+
+from bot.bot_instance import get_bot
+from bot.command_menu import set_bot_commands
+from bot.config import (
+    DATABASE_URL,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_WORKER_BASE_PORT,
+    WEBHOOK_WORKER_TOKEN,
+    WEBHOOK_WORKER_URLS
+)
+
+logger = logging.getLogger(__name__)
+
+WORKER_UPDATE_PATH = "/update"
+# Заголовок, которым приёмник подтверждает воркеру, что обновление пришло от Telegram
+WORKER_TOKEN_HEADER = "X-Worker-Token"
+# Сколько воркер ждёт завершения начатых обновлений при остановке
+WORKER_DRAIN_TIMEOUT = 30.0
+FORWARD_TIMEOUT = 10.0
+
+# Разделы обновления, в которых может быть отправитель
+UPDATE_SECTIONS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "channel_post", "edited_channel_post"
+)
+
+
+def update_user_id(update: Dict[str, Any]) -> int:
+    """Id пользователя (или чата) из сырого обновления — по нему выбирается воркер"""
+    for section in UPDATE_SECTIONS:
+        payload = update.get(section)
+        if not payload:
+            continue
+        sender = payload.get("from") or payload.get("user")
+        if sender:
+            return sender["id"]
+        chat = payload.get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+async def _wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
+class UserOrderedFeeder:
+    """
+    Приём обновлений в воркере: ответ отдаётся сразу, а обработка идёт в фоне.
+    Обновления одного пользователя обрабатываются строго по очереди (asyncio.Lock
+    выдаётся в порядке ожидания), разные пользователи — параллельно.
+    Принимаются только обновления с токеном приёмника: иначе любой, кто дотянулся до порта воркера,
+    мог бы прислать обновление от имени администратора.
+    """
+
+    def __init__(self, dp, bot, token: str):
+        self.dp = dp
+        self.bot = bot
+        self.token = token
+        # user_id -> [lock, сколько обновлений пользователя ждут или обрабатываются]
+        self._locks: Dict[int, list] = {}
+        self._tasks = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(WORKER_TOKEN_HEADER, ""), self.token):
+            return web.Response(status=401)
+        data = await request.json()
+        task = asyncio.create_task(self._process(update_user_id(data), data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, user_id: int, data: Dict[str, Any]):
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                update = Update.model_validate(data, context={"bot": self.bot})
+                await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления {data.get('update_id')}: {e}")
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    async def drain(self, timeout: float = WORKER_DRAIN_TIMEOUT):
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+
+
+async def serve_worker(index: int, port: int, host: str = "127.0.0.1", token: Optional[str] = WEBHOOK_WORKER_TOKEN):
+    """Воркер: свой Dispatcher, пул БД и LLM-сессии; получает обновления своих пользователей от приёмника"""
+    if not token:
+        raise SystemExit("Для воркера обновлений задайте WEBHOOK_WORKER_TOKEN (или WEBHOOK_SECRET) — тот же, что у приёмника")
+
+    # Тяжёлые модули (RAG, модели) грузятся только в процессах-воркерах, не в приёмнике
+    from bot.bot import register_handlers
+    from bot.db_pool import create_db_pool, close_db_pool, get_pool
+    from bot.dialog_writer import dialog_writer
+    from bot.dispatcher import get_dispatcher
+    from bot.handlers.llm_session import drain_llm_requests
+    from rag_integration import start_channel_refresh, stop_channel_refresh, close_telegram_clients
+    from metrics import metrics_handler
+
+    async def on_worker_startup():
+        dialog_writer.start()
+        if index == 0 and await get_pool() is None:
+            # Без Postgres воркер один (см. run_webhook) — он и обновляет каналы
+            start_channel_refresh()
+
+    async def on_worker_shutdown():
+        await stop_channel_refresh()
+        await close_telegram_clients()
+        await dialog_writer.stop()
+        await close_db_pool()
+
+    await create_db_pool()
+    dp = get_dispatcher()
+    register_handlers(dp)
+    dp.startup.register(on_worker_startup)
+    dp.shutdown.register(on_worker_shutdown)
+
+    bot = get_bot()
+    feeder = UserOrderedFeeder(dp, bot, token)
+    app = web.Application()
+    app.router.add_post(WORKER_UPDATE_PATH, feeder.handle)
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    await dp.emit_startup(bot=bot)
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Воркер обновлений #{index} слушает {host}:{port}")
+    try:
+        await _wait_for_stop_signal()
+    finally:
+        # Сначала перестаём принимать обновления, потом дорабатываем начатые
+        await runner.cleanup()
+        await feeder.drain()
+        # Обработчик вопроса только ставит его в RequestCoalescer — ответы дожидаемся отдельно
+        await drain_llm_requests(WORKER_DRAIN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+
+def run_update_worker(index: int, port: int, host: str, token: str):
+    asyncio.run(serve_worker(index, port, host, token))
+
+
+class UpdateRouter:
+    """
+    Приёмник webhook: проверяет секрет и пересылает обновление воркеру по user_id % N.
+    Пересылка в каждый воркер идёт по очереди, поэтому порядок обновлений пользователя
+    сохраняется; Telegram получает 200 только после того, как воркер принял обновление,
+    иначе 503 — и Telegram повторит доставку.
+    """
+
+    def __init__(self, worker_urls: List[str], worker_token: str, secret: Optional[str] = None):
+        self.worker_urls = worker_urls
+        self.worker_token = worker_token
+        self.secret = secret
+        self._locks = [asyncio.Lock() for _ in worker_urls]
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret:
+            return web.Response(status=401)
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        index = update_user_id(update) % len(self.worker_urls)
+        url = self.worker_urls[index] + WORKER_UPDATE_PATH
+        async with self._locks[index]:
+            try:
+                headers = {"Content-Type": "application/json", WORKER_TOKEN_HEADER: self.worker_token}
+                async with self._session.post(url, data=body, headers=headers) as resp:
+                    return web.Response(status=200 if resp.status == 200 else 503)
+            except Exception as e:
+                logger.error(f"Воркер {url} недоступен: {e}")
+                return web.Response(status=503)
+
+
+def _start_local_workers(count: int, token: str) -> List[multiprocessing.Process]:
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        process = context.Process(
+            target=run_update_worker,
+            args=(index, WEBHOOK_WORKER_BASE_PORT + index, "127.0.0.1", token),
+            name=f"update-worker-{index}"
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def _stop_local_workers(processes: List[multiprocessing.Process]):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(WORKER_DRAIN_TIMEOUT)
+
+
+async def run_webhook():
+    """Режим webhook: приёмник обновлений + воркеры (локальные процессы или WEBHOOK_WORKER_URLS)"""
+    if not WEBHOOK_BASE_URL:
+        raise SystemExit("Для режима webhook задайте WEBHOOK_BASE_URL")
+
+    worker_count = len(WEBHOOK_WORKER_URLS) or WEBHOOK_WORKERS
+    if worker_count > 1:
+        # Локальная папка ChromaDB не рассчитана на несколько пишущих процессов, а загрузка каналов
+        # через Telethon (одна сессия на аккаунт) должна идти в одном процессе — в worker.py через очередь в Postgres
+        if not os.getenv("CHROMA_HOST"):
+            raise SystemExit("Для webhook с несколькими воркерами нужен сервер ChromaDB: задайте CHROMA_HOST или WEBHOOK_WORKERS=1")
+        if not DATABASE_URL:
+            raise SystemExit(
+                "Для webhook с несколькими воркерами нужен Postgres (DATABASE_URL) и процесс worker.py: "
+                "каналы загружаются в одном процессе. Или задайте WEBHOOK_WORKERS=1"
+            )
+
+    processes = []
+    worker_urls = WEBHOOK_WORKER_URLS
+    worker_token = WEBHOOK_WORKER_TOKEN
+    if worker_urls and not worker_token:
+        raise SystemExit("Для удалённых воркеров (WEBHOOK_WORKER_URLS) задайте общий WEBHOOK_WORKER_TOKEN или WEBHOOK_SECRET")
+    if not worker_urls:
+        # Локальным воркерам токен передаётся при запуске, задавать его необязательно
+        worker_token = worker_token or secrets.token_urlsafe(32)
+        processes = _start_local_workers(WEBHOOK_WORKERS, worker_token)
+        worker_urls = [f"http://127.0.0.1:{WEBHOOK_WORKER_BASE_PORT + i}" for i in range(WEBHOOK_WORKERS)]
+
+    router = UpdateRouter(worker_urls, worker_token, WEBHOOK_SECRET)
+    await router.start()
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, router.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    bot = get_bot()
+    try:
+        await set_bot_commands()
+        await bot.set_webhook(WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+        logger.info(f"Webhook принимает обновления на {WEBHOOK_HOST}:{WEBHOOK_PORT}, воркеров: {len(worker_urls)}")
+        await _wait_for_stop_signal()
+    finally:
+        await runner.cleanup()
+        await router.close()
+        await bot.session.close()
+        # Webhook не снимается: при перезапуске или в другой реплике обновления продолжат приходить
+        await asyncio.to_thread(_stop_local_workers, processes)
@@ -1,8 +1,16 @@
 import asyncio
-from bot.bot import start as bot_start
+from bot.config import BOT_MODE, WEBHOOK_WORKER_INDEX, WEBHOOK_WORKER_BASE_PORT, WEBHOOK_WORKER_HOST
 
 async def main():
-    await bot_start()
+    if BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
+        await run_webhook()
+    elif BOT_MODE == "webhook_worker":
+        from bot.webhook import serve_worker
+        await serve_worker(WEBHOOK_WORKER_INDEX, WEBHOOK_WORKER_BASE_PORT, host=WEBHOOK_WORKER_HOST)
+    else:
+        from bot.bot import start as bot_start
+        await bot_start()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def channel_key(channel_link: str) -> str:
+    """Нормализованный ключ канала: https://t.me/Name/ и t.me/name — один канал"""
+    key = channel_link.strip().rstrip("/").lower()
+    for prefix in ("https://", "http://"):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    return key
+
+
+class ChannelCursorStore:
+    """
+    Курсоры синхронизации каналов: максимальный загруженный post_id и время последней синхронизации.
+    Хранятся JSON-файлом в каталоге RagDB (./chroma_db) — и при сервере ChromaDB тоже, поэтому общими для
+    бота, воркера и webhook-воркеров они будут, только если этот каталог у них общий (в docker-compose —
+    том worker_data у bot и worker; воркерам на других машинах каталог нужно смонтировать так же).
+    Запись идёт под файловой блокировкой: файл перечитывается и курсоры сливаются, а не затираются.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, Dict] = {}
+        self._mtime_ns: Optional[int] = None
+        self._reload()
+
+    def _reload(self):
+        """Перечитать файл, если его изменил другой процесс"""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns != self._mtime_ns:
+            self._cursors = json.loads(self.path.read_text(encoding="utf-8"))
+            self._mtime_ns = mtime_ns
+
+    @contextmanager
+    def _file_lock(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, channel_link: str) -> Optional[Dict]:
+        with self._lock:
+            self._reload()
+            return self._cursors.get(channel_key(channel_link))
+
+    def channels(self) -> List[str]:
+        """Ссылки всех каналов, у которых есть курсор"""
+        with self._lock:
+            self._reload()
+            return [cursor["channel"] for cursor in self._cursors.values()]
+
+    def update(self, channel_link: str, last_post_id: int, synced_at: Optional[datetime] = None):
+        """Сдвинуть курсор канала (post_id никогда не уменьшается)"""
+        synced_at = synced_at or datetime.now(timezone.utc)
+        with self._lock, self._file_lock():
+            self._reload()
+            key = channel_key(channel_link)
+            cursor = dict(self._cursors.get(key, {"channel": channel_link, "last_post_id": 0}))
+            cursor["last_post_id"] = max(cursor["last_post_id"], last_post_id)
+            cursor["synced_at"] = synced_at.isoformat()
+            self._cursors[key] = cursor
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self._cursors, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._mtime_ns = self.path.stat().st_mtime_ns
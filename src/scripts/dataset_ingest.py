@@ -0,0 +1,168 @@
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = 512
+EMBED_BATCH_SIZE = 32
+
+
+def dataset_key(source: str) -> str:
+    """Ключ датасета: edgar9810_dating_parsed для hf://datasets/edgar9810/dating_parsed/..."""
+    match = re.search(r'datasets/([^/]+/[^/]+)', source)
+    if match:
+        return match.group(1).replace('/', '_')
+    return Path(source).stem
+
+
+def _metadata_value(value: Any) -> Any:
+    """ChromaDB хранит в метаданных только скаляры — вложенные значения сохраняются JSON-строкой"""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class DatasetCheckpoints:
+    """Сколько строк каждого датасета уже записано (JSON рядом с коллекцией ChromaDB)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, Dict] = {}
+        if self.path.exists():
+            self._offsets = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def get(self, key: str) -> int:
+        return self._offsets.get(key, {}).get("offset", 0)
+
+    def update(self, key: str, source: str, offset: int, total: Optional[int] = None):
+        with self._lock:
+            self._offsets[key] = {"source": source, "offset": offset, "rows": total}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._offsets, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+
+
+class DatasetIngestor:
+    """
+    Загрузка табличного датасета (parquet/CSV, в т.ч. hf://) прямо в RagDB без промежуточного CSV.
+    Источник читается одним потоковым проходом (polars collect_batches), только нужные колонки;
+    следующая пачка читается, пока текущая индексируется. После каждой пачки сохраняется смещение,
+    так что прерванная загрузка продолжается с него, а id строк стабильны и повтор не создаёт дублей.
+    """
+
+    def __init__(
+        self,
+        db,
+        source: str,
+        text_column: str,
+        metadata_columns: Optional[List[str]] = None,
+        batch_rows: int = BATCH_ROWS
+    ):
+        self.db = db
+        self.source = source
+        self.key = dataset_key(source)
+        self.text_column = text_column
+        self.metadata_columns = metadata_columns or []
+        self.batch_rows = batch_rows
+        self.checkpoints = DatasetCheckpoints(os.path.join(db.path, "dataset_offsets.json"))
+        self.frame = self._scan().select([text_column, *self.metadata_columns])
+
+    def _scan(self) -> pl.LazyFrame:
+        if self._is_csv():
+            return pl.scan_csv(self.source, separator="\t" if self.source.lower().endswith(".tsv") else ",")
+        return pl.scan_parquet(self.source)
+
+    def _is_csv(self) -> bool:
+        return self.source.lower().endswith((".csv", ".tsv"))
+
+    def _batches(self, offset: int) -> Iterator[pl.DataFrame]:
+        """Один потоковый проход по источнику с пропуском первых offset строк"""
+        return iter(self.frame.slice(offset).collect_batches(chunk_size=self.batch_rows))
+
+    def _total_rows(self) -> Optional[int]:
+        # У parquet число строк есть в метаданных; CSV ради него пришлось бы прочитать целиком
+        if self._is_csv():
+            return None
+        return self.frame.select(pl.len()).collect().item()
+
+    def _records(self, batch: pl.DataFrame, offset: int):
+        texts, metadatas, ids = [], [], []
+        for i, row in enumerate(batch.iter_rows(named=True)):
+            value = row[self.text_column]
+            if value is None:
+                continue
+            text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+            if not text.strip():
+                continue
+            meta = {
+                column: _metadata_value(row[column])
+                for column in self.metadata_columns
+                if row[column] is not None
+            }
+            meta.update({"source": self.key, "type": "dataset", "row": offset + i})
+            texts.append(text)
+            metadatas.append(meta)
+            ids.append(f"{self.key}_{offset + i}")
+        return texts, metadatas, ids
+
+    def run(self, restart: bool = False) -> int:
+        """Проиндексировать датасет с последнего чекпоинта; возвращает число записанных строк"""
+        offset = 0 if restart else self.checkpoints.get(self.key)
+        total = self._total_rows()
+        if offset:
+            logger.info(f"{self.key}: продолжение с строки {offset} из {total or '?'}")
+        written = 0
+
+        batches = self._batches(offset)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            pending = reader.submit(next, batches, None)
+            while True:
+                batch = pending.result()
+                if batch is None:
+                    break
+                pending = reader.submit(next, batches, None)
+                if batch.height == 0:
+                    continue
+
+                texts, metadatas, ids = self._records(batch, offset)
+                if texts:
+                    self.db.add_texts(texts, metadatas, ids=ids, batch_size=EMBED_BATCH_SIZE)
+                    written += len(texts)
+                offset += batch.height
+                self.checkpoints.update(self.key, self.source, offset, total)
+                logger.info(f"{self.key}: {offset}/{total or '?'} строк")
+
+        return written
+
+
+if __name__ == "__main__":
+    import rag_database
+
+    arg_parser = argparse.ArgumentParser(description="Загрузка parquet/CSV датасета в RAG базу")
+    arg_parser.add_argument("source", help="Путь или hf:// URL parquet/CSV файла (допускается glob)")
+    arg_parser.add_argument("--text", required=True, help="Колонка с текстом")
+    arg_parser.add_argument("--meta", nargs="*", default=[], help="Колонки для метаданных")
+    arg_parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    arg_parser.add_argument("--restart", action="store_true", help="Начать заново, игнорируя чекпоинт")
+    arg_parser.add_argument("--collection", default="telegram_channels")
+    args = arg_parser.parse_args()
+
+    rag_db = rag_database.RagDB(
+        db="./chroma_db",
+        name=args.collection,
+        host=os.getenv("CHROMA_HOST"),
+        port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    ingestor = DatasetIngestor(rag_db, args.source, args.text, args.meta, batch_rows=args.batch_rows)
+    print(f"Записано строк: {ingestor.run(restart=args.restart)}")
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import sys
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from pypdf import PdfReader
+
+from ingest_pipeline import IndexingSink
+
+logger = logging.getLogger(__name__)
+
+BOOKS_DIR = "BooksForRAG"
+LOADER_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Сколько извлечённых разделов может ждать индексации, прежде чем процесс-извлекатель встанет
+SECTION_QUEUE_SIZE = 64
+# Разделы длиннее режутся: IndexingSink обрезает документы длиннее MAX_TEXT_LENGTH
+SECTION_CHARS = 20000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+CONTAINER_NS = "{urn:oasis:names:tc:opendocument:xmlns:container}"
+OPF_NS = "{http://www.idpf.org/2007/opf}"
+
+# Раздел книги: (заголовок или номер страницы, текст)
+Section = Tuple[str, str]
+
+
+def _split_section(title: str, text: str) -> Iterator[Section]:
+    for start in range(0, len(text), SECTION_CHARS):
+        yield title, text[start:start + SECTION_CHARS]
+
+
+def _iter_pdf(path: str) -> Iterator[Section]:
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages, start=1):
+        yield f"стр. {number}", page.extract_text() or ""
+
+
+def _docx_heading_styles(archive: zipfile.ZipFile) -> set:
+    """Id стилей заголовков: в документе абзац ссылается на id, а «heading N» — это имя стиля"""
+    try:
+        root = ET.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return set()
+    headings = set()
+    for style in root.iter(f"{WORD_NS}style"):
+        name = style.find(f"{WORD_NS}name")
+        if name is not None and name.get(f"{WORD_NS}val", "").lower().startswith("heading"):
+            headings.add(style.get(f"{WORD_NS}styleId"))
+    return headings
+
+
+def _iter_docx(path: str) -> Iterator[Section]:
+    """
+    Разделы DOCX — текст между заголовками (стили Heading*).
+    word/document.xml читается из архива потоково (iterparse), абзацы освобождаются сразу после разбора
+    """
+    title, parts, size = "", [], 0
+    with zipfile.ZipFile(path) as archive:
+        headings = _docx_heading_styles(archive)
+        with archive.open("word/document.xml") as document:
+            for _, element in ET.iterparse(document, events=("end",)):
+                if element.tag != f"{WORD_NS}p":
+                    continue
+                text = "".join(node.text or "" for node in element.iter(f"{WORD_NS}t"))
+                style = element.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+                is_heading = style is not None and style.get(f"{WORD_NS}val") in headings
+                element.clear()
+                if parts and (is_heading or size >= SECTION_CHARS):
+                    yield title, "\n".join(parts)
+                    parts, size = [], 0
+                if is_heading:
+                    title = text.strip()
+                if text.strip():
+                    parts.append(text)
+                    size += len(text)
+    if parts:
+        yield title, "\n".join(parts)
+
+
+def _iter_epub(path: str) -> Iterator[Section]:
+    """Главы EPUB в порядке spine; из архива читается по одной главе за раз"""
+    with zipfile.ZipFile(path) as archive:
+        container = ET.fromstring(archive.read("META-INF/container.xml"))
+        opf_path = container.find(f".//{CONTAINER_NS}rootfile").get("full-path")
+        opf = ET.fromstring(archive.read(opf_path))
+        base = posixpath.dirname(opf_path)
+
+        manifest = {
+            item.get("id"): item
+            for item in opf.iter(f"{OPF_NS}item")
+        }
+        for itemref in opf.iter(f"{OPF_NS}itemref"):
+            item = manifest.get(itemref.get("idref"))
+            if item is None or "html" not in (item.get("media-type") or ""):
+                continue
+            name = posixpath.normpath(posixpath.join(base, item.get("href")))
+            try:
+                content = archive.read(name)
+            except KeyError:
+                logger.warning(f"{path}: в архиве нет главы {name}")
+                continue
+            yield name, BeautifulSoup(content, "lxml").get_text(separator=" ", strip=True)
+
+
+def _iter_fb2(path: str) -> Iterator[Section]:
+    """FB2 читается потоково (iterparse): абзацы копятся до конца <section> и сразу освобождаются"""
+    parts, size, number = [], 0, 0
+    for _, element in ET.iterparse(path, events=("end",)):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "binary":
+            element.clear()
+        elif tag in ("p", "v", "subtitle"):
+            text = "".join(element.itertext()).strip()
+            if text:
+                parts.append(text)
+                size += len(text)
+            element.clear()
+        if parts and (tag == "section" or size >= SECTION_CHARS):
+            number += 1
+            yield f"раздел {number}", "\n".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield f"раздел {number + 1}", "\n".join(parts)
+
+
+def _iter_text(path: str) -> Iterator[Section]:
+    parts, size, number = [], 0, 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parts.append(line)
+            size += len(line)
+            if size >= SECTION_CHARS:
+                number += 1
+                yield f"часть {number}", "".join(parts)
+                parts, size = [], 0
+    if parts:
+        yield f"часть {number + 1}", "".join(parts)
+
+
+EXTRACTORS = {
+    ".pdf": _iter_pdf,
+    ".docx": _iter_docx,
+    ".epub": _iter_epub,
+    ".fb2": _iter_fb2,
+    ".txt": _iter_text,
+    ".md": _iter_text,
+}
+
+
+def extract_to_queue(path: str, queue) -> int:
+    """
+    Выполняется в процессе пула: извлекает разделы файла по одному и кладёт их в очередь.
+    Очередь ограничена, поэтому извлечение идёт не быстрее индексации и книга целиком
+    в памяти не оказывается. В конце всегда кладётся None.
+    """
+    count = 0
+    try:
+        for title, text in EXTRACTORS[Path(path).suffix.lower()](path):
+            for section in _split_section(title, text):
+                if section[1].strip():
+                    queue.put(section)
+                    count += 1
+    finally:
+        queue.put(None)
+    return count
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class IndexedFilesStore:
+    """Хэши уже проиндексированных файлов (JSON рядом с коллекцией ChromaDB)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict] = {}
+        if self.path.exists():
+            self._files = json.loads(self.path.read_text(encoding="utf-8"))
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._files
+
+    def add(self, digest: str, name: str, sections: int):
+        with self._lock:
+            self._files[digest] = {"file": name, "sections": sections}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._files, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+
+
+class DocumentLoader:
+    """
+    Загрузка книг (PDF/DOCX/EPUB/FB2/TXT/MD) в RagDB.
+    Текст извлекается по страницам/разделам в пуле процессов и потоком идёт
+    через IndexingSink (разбиение на чанки и эмбеддинги пачками).
+    Файлы, уже проиндексированные с тем же содержимым, пропускаются.
+    """
+
+    def __init__(self, db, workers: int = LOADER_WORKERS):
+        self.db = db
+        self.workers = workers
+        self.indexed = IndexedFilesStore(os.path.join(db.path, "indexed_files.json"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._manager = multiprocessing.Manager()
+
+    async def load_file(self, path: Path, sink: IndexingSink) -> int:
+        """Проиндексировать один файл; возвращает число разделов (0, если файл пропущен)"""
+        digest = await asyncio.to_thread(file_sha256, path)
+        if digest in self.indexed:
+            logger.info(f"{path.name} уже проиндексирован, пропуск")
+            return 0
+
+        self._ensure_pool()
+        queue = self._manager.Queue(maxsize=SECTION_QUEUE_SIZE)
+        loop = asyncio.get_running_loop()
+        extraction = loop.run_in_executor(self._pool, extract_to_queue, str(path), queue)
+
+        number = 0
+        while True:
+            try:
+                section = await asyncio.to_thread(queue.get, True, 1.0)
+            except queue_module.Empty:
+                if extraction.done():
+                    # Процесс пула упал, не положив None
+                    break
+                continue
+            if section is None:
+                break
+            title, text = section
+            meta = {"source": path.name, "type": "book", "section": title, "sha256": digest}
+            await sink.put(text, meta, f"book_{digest[:16]}_{number}", group=digest)
+            number += 1
+
+        try:
+            await extraction
+        finally:
+            await sink.drain(digest)
+        if sink.failed_by_group.pop(digest, 0):
+            logger.warning(f"{path.name}: часть разделов не записана, файл будет загружен повторно")
+        else:
+            self.indexed.add(digest, path.name, number)
+        sink.indexed_by_group.pop(digest, None)
+        logger.info(f"{path.name}: проиндексировано разделов: {number}")
+        return number
+
+    async def load_folder(self, folder: str = BOOKS_DIR) -> Dict[str, int]:
+        """Проиндексировать все книги каталога; одновременно обрабатывается до workers файлов"""
+        files = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in EXTRACTORS)
+        semaphore = asyncio.Semaphore(self.workers)
+        results: Dict[str, int] = {}
+
+        async def load(path: Path, sink: IndexingSink):
+            async with semaphore:
+                try:
+                    results[path.name] = await self.load_file(path, sink)
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки {path.name}: {e}")
+
+        try:
+            async with IndexingSink(self.db, name="books") as sink:
+                await asyncio.gather(*(load(path, sink) for path in files))
+        finally:
+            self.close()
+        return results
+
+
+if __name__ == "__main__":
+    import rag_database
+
+    rag_db = rag_database.RagDB(
+        db="./chroma_db",
+        name="telegram_channels",
+        host=os.getenv("CHROMA_HOST"),
+        port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    folder = sys.argv[1] if len(sys.argv) > 1 else BOOKS_DIR
+    print(asyncio.run(DocumentLoader(rag_db).load_folder(folder)))
@@ -1,12 +1,14 @@
 import os
 import asyncio
 import logging
-from typing import List, Optional
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
 from langchain_core.documents import Document
-from telethon import TelegramClient
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
+from telegram_client_manager import get_client_manager
+
 load_dotenv()
 API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
@@ -23,16 +25,12 @@ class TelegramPostsParser:
         self.api_hash = api_hash
         self.session = session
         self.max_text_length = 100000
+        self.manager = get_client_manager(api_id, api_hash, session)
 
     @asynccontextmanager
     async def client(self):
-        """Простое создание и управление клиентом Telegram"""
-        client = TelegramClient(self.session, self.api_id, self.api_hash)
-        try:
-            await client.start()
-            yield client
-        finally:
-            await client.disconnect()
+        """Общий для процесса клиент Telegram; соединение не закрывается после запроса"""
+        yield await self.manager.get_client()
 
     def _msg_document(self, message, channel_link) -> Optional[Document]:
         """Создание документа из сообщения"""
@@ -55,25 +53,26 @@ class TelegramPostsParser:
                     "date": str(message.date),
                     "post_id": message.id,
                     "text_length": len(txt),
-                    "has_media": bool(message.media)
+                    "has_media": bool(message.media),
+                    "edit_date": str(message.edit_date) if getattr(message, "edit_date", None) else ""
                 }
             )
         except Exception as e:
             logger.error(f"Ошибка обработки сообщения {getattr(message, 'id', 'unknown')}: {e}")
             return None
 
-    async def fetch_channel_posts(self, channel_link: str, limit: int = 30) -> List[Document]:
-        """Простая загрузка постов из канала"""
+    async def fetch_channel_posts(self, channel_link: str, limit: int = 30, min_id: int = 0) -> List[Document]:
+        """Простая загрузка постов из канала (только посты с id > min_id)"""
         docs = []
 
         try:
             logger.info(f"Парсинг канала: {channel_link}, лимит: {limit}")
 
             async with self.client() as client:
-                channel = await client.get_entity(channel_link)
+                channel = await self.manager.get_entity(channel_link)
                 logger.info(f"Канал найден: {getattr(channel, 'title', 'неизвестный')}")
 
-                messages = await client.get_messages(channel, limit=limit)
+                messages = await self.manager.request(client.get_messages, channel, limit=limit, min_id=min_id)
 
                 if not messages:
                     logger.warning("Сообщений не найдено")
@@ -83,7 +82,6 @@ class TelegramPostsParser:
 
                 for i, message in enumerate(messages, 1):
                     doc = self._msg_document(message, channel_link)
-                    print(message, doc)
                     if doc:
                         docs.append(doc)
                         logger.debug(f"Обработано сообщение {i}/{len(messages)}")
@@ -95,3 +93,72 @@ class TelegramPostsParser:
             raise Exception(f"Ошибка парсинга канала {channel_link}: {str(e)}")
 
         return docs
+
+    async def iter_channel_documents(
+        self,
+        channel_link: str,
+        limit: Optional[int] = None,
+        min_id: int = 0,
+        max_id: int = 0,
+        reverse: bool = False
+    ) -> AsyncIterator[Tuple[int, Optional[Document]]]:
+        """
+        Потоковая загрузка постов канала страницами через iter_messages (id в интервале (min_id, max_id)).
+        Отдаёт пары (id сообщения, документ или None для постов без текста),
+        чтобы вызывающий мог вести курсор и по пустым сообщениям.
+        """
+        logger.info(f"Потоковый парсинг канала: {channel_link}, лимит: {limit or 'без лимита'}, после id {min_id}")
+        channel = await self.manager.get_entity(channel_link)
+        logger.info(f"Канал найден: {getattr(channel, 'title', 'неизвестный')}")
+
+        async for message in self.manager.iter_messages(
+            channel, limit=limit, min_id=min_id, max_id=max_id, reverse=reverse
+        ):
+            yield message.id, self._msg_document(message, channel_link)
+
+    async def fetch_channel_updates(
+        self,
+        channel_link: str,
+        min_id: int,
+        edited_since: Optional[datetime] = None,
+        edit_window: int = 50,
+        max_new: Optional[int] = 1000
+    ) -> Tuple[List[Document], List[Document], int]:
+        """
+        Загрузка новых постов (id > min_id) и отредактированных после edited_since
+        среди последних edit_window уже загруженных постов.
+        Возвращает новые документы, отредактированные документы и максимальный увиденный id.
+        Новых постов берётся не больше max_new — самых старых после min_id.
+        """
+        new_docs, edited_docs = [], []
+        last_post_id = min_id
+
+        try:
+            async with self.client() as client:
+                channel = await self.manager.get_entity(channel_link)
+
+                # От старых к новым: при лимите курсор сдвигается только по непрерывному диапазону
+                # сразу за min_id, а остаток догружается следующей синхронизацией
+                async for message in self.manager.iter_messages(channel, limit=max_new, min_id=min_id, reverse=True):
+                    last_post_id = max(last_post_id, message.id)
+                    doc = self._msg_document(message, channel_link)
+                    if doc:
+                        new_docs.append(doc)
+
+                if edited_since and min_id:
+                    recent = await self.manager.request(
+                        client.get_messages, channel, limit=edit_window, max_id=min_id + 1
+                    )
+                    for message in recent:
+                        if message.edit_date and message.edit_date > edited_since:
+                            doc = self._msg_document(message, channel_link)
+                            if doc:
+                                edited_docs.append(doc)
+
+            logger.info(f"Синхронизация {channel_link}: новых {len(new_docs)}, отредактированных {len(edited_docs)}")
+
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации {channel_link}: {e}")
+            raise Exception(f"Ошибка синхронизации канала {channel_link}: {str(e)}")
+
+        return new_docs, edited_docs, last_post_id
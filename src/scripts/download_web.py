@@ -1,36 +1,266 @@
 import aiohttp
 from langchain_core.documents import Document
 from bs4 import BeautifulSoup
-from typing import List, Optional, Dict
-from urllib.parse import urlparse
+from lxml import etree, html as lxml_html
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Dict, Tuple
+from pathlib import Path
 import asyncio
+import codecs
+import hashlib
+import json
+import os
+import re
+import time
+
+MAX_CONCURRENCY = 20
+PER_HOST_LIMIT = 4
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 15
+HTTP_CACHE_DIR = ".http_cache"
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Страницы меньше этого размера разбираются в основном процессе: пересылка в пул дороже самого разбора
+INLINE_PARSE_BYTES = 64 * 1024
+# Кодировку из <meta charset> / http-equiv ищем только в начале документа, как браузер
+META_CHARSET_BYTES = 4096
+META_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([a-zA-Z0-9_\-:.]+)", re.IGNORECASE)
+
+
+def detect_charset(header_charset: Optional[str], body: bytes) -> str:
+    """Кодировка ответа: из Content-Type, иначе из <meta charset> страницы, иначе utf-8"""
+    candidates = [header_charset]
+    match = META_CHARSET_RE.search(body[:META_CHARSET_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def _classes_xpath(class_name: str) -> str:
+    return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+def _element_text(element) -> str:
+    return " ".join(part.strip() for part in element.itertext() if part.strip())
+
+
+def _lxml_tree(html: str):
+    try:
+        tree = lxml_html.fromstring(html)
+    except ValueError:
+        # XHTML с <?xml encoding=...?> lxml принимает только байтами
+        tree = lxml_html.fromstring(html.encode("utf-8"))
+    except etree.ParserError:
+        return None
+    etree.strip_elements(tree, "script", "style", etree.Comment, with_tail=False)
+    return tree
+
+
+def _extract_text(html: str, tree, parse_classes: Optional[List[str]]) -> str:
+    if not parse_classes:
+        return BeautifulSoup(html, "lxml").get_text(separator=" ", strip=True)
+    if tree is None:
+        return ""
+    return "\n".join(
+        _element_text(element)
+        for c in parse_classes
+        for element in tree.xpath(_classes_xpath(c))
+    )
+
+
+def html_to_text(html: str, parse_classes: Optional[List[str]] = None) -> Tuple[str, float]:
+    """
+    Извлечение текста из HTML. Выполняется в процессе пула, поэтому функция модульная.
+    Если заданы parse_classes — быстрый путь через lxml: разбираются только нужные поддеревья.
+    Возвращает текст и время разбора в секундах.
+    """
+    started = time.perf_counter()
+    tree = _lxml_tree(html) if parse_classes else None
+    return _extract_text(html, tree, parse_classes), time.perf_counter() - started
+
+
+def html_to_page(html: str, url: str, parse_classes: Optional[List[str]] = None) -> Tuple[str, List[str], float]:
+    """То же, что html_to_text, плюс абсолютные ссылки страницы (для обхода сайта)"""
+    started = time.perf_counter()
+    tree = _lxml_tree(html)
+    links = []
+    if tree is not None:
+        tree.make_links_absolute(url, handle_failures="discard")
+        links = [a.get("href") for a in tree.xpath("//a[@href]")]
+    return _extract_text(html, tree, parse_classes), links, time.perf_counter() - started
+
+
+class HttpCache:
+    """
+    Дисковый кэш для условных GET-запросов.
+    Для каждого URL хранятся валидаторы (ETag / Last-Modified) и тело последнего ответа,
+    чтобы на 304 Not Modified отдать страницу без повторной загрузки.
+    """
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """Заголовки If-None-Match / If-Modified-Since для URL, если он уже в кэше"""
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return {}
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, url: str) -> Optional[str]:
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        return body_path.read_bytes().decode(meta.get("charset") or "utf-8", errors="replace")
+
+    def store(self, url: str, body: bytes, charset: str, etag: Optional[str], last_modified: Optional[str]):
+        if not etag and not last_modified:
+            return
+        meta_path, body_path = self._paths(url)
+        tmp_body = body_path.with_suffix(".tmp")
+        tmp_body.write_bytes(body)
+        os.replace(tmp_body, body_path)
+        meta_path.write_text(json.dumps({
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "charset": charset
+        }), encoding="utf-8")
 
 
 class SiteParser:
-    def __init__(self, user_agent: str = "Mozilla/5.0"):
+    def __init__(
+        self,
+        user_agent: str = "Mozilla/5.0",
+        max_concurrency: int = MAX_CONCURRENCY,
+        per_host_limit: int = PER_HOST_LIMIT,
+        max_bytes: int = MAX_RESPONSE_BYTES,
+        cache_dir: Optional[str] = HTTP_CACHE_DIR,
+        parse_workers: int = PARSE_WORKERS
+    ):
+        """
+        Args:
+            max_concurrency: Сколько страниц скачивается одновременно
+            per_host_limit: Сколько соединений одновременно открыто к одному хосту
+            max_bytes: Ответ читается потоково и обрезается на этом размере
+            cache_dir: Каталог кэша условных GET (None — без кэша)
+            parse_workers: Размер пула процессов для разбора HTML (0 — разбор в основном процессе)
+        """
         self.user_agent = user_agent
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.max_bytes = max_bytes
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.stats = {"fetched": 0, "not_modified": 0, "errors": 0, "truncated": 0, "bytes": 0}
+        self.parse_stats = {"pages": 0, "bytes": 0, "seconds": 0.0}
+        self.parse_workers = parse_workers
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def __aenter__(self) -> "SiteParser":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом соединений на все запросы парсера"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"User-Agent": self.user_agent},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def parse_throughput(self) -> Dict[str, float]:
+        """Пропускная способность стадии разбора отдельно от скачивания"""
+        seconds = self.parse_stats["seconds"]
+        return {
+            "pages_per_second": self.parse_stats["pages"] / seconds if seconds else 0.0,
+            "mb_per_second": self.parse_stats["bytes"] / seconds / (1024 * 1024) if seconds else 0.0
+        }
+
+    async def _read_capped(self, resp: aiohttp.ClientResponse, url: str) -> Tuple[bytes, bool]:
+        """Потоковое чтение тела ответа не больше max_bytes; второй элемент — был ли ответ обрезан"""
+        chunks = []
+        size = 0
+        truncated = False
+        async for chunk in resp.content.iter_chunked(READ_CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                self.stats["truncated"] += 1
+                truncated = True
+                print(f"Ответ {url} обрезан до {self.max_bytes} байт")
+                break
+        self.stats["bytes"] += min(size, self.max_bytes)
+        return b"".join(chunks)[:self.max_bytes], truncated
 
     async def fetch_html(self, url: str) -> Optional[str]:
-        headers = {"User-Agent": self.user_agent}
-        async with aiohttp.ClientSession() as session:
+        html, _ = await self.fetch_page(url)
+        return html
+
+    async def fetch_page(self, url: str) -> Tuple[Optional[str], str]:
+        """HTML страницы и её итоговый URL после редиректов (для 304 из кэша — исходный)"""
+        session = self._get_session()
+        headers = self.cache.validators(url) if self.cache else {}
+        async with self._semaphore:
             try:
-                async with session.get(url, headers=headers, timeout=15) as resp:
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status == 304 and self.cache:
+                        self.stats["not_modified"] += 1
+                        return self.cache.load(url), url
                     if resp.status == 200:
-                        return await resp.text()
+                        body, truncated = await self._read_capped(resp, url)
+                        charset = detect_charset(resp.charset, body)
+                        # Обрезанное тело под валидаторами полного ответа отдавалось бы на 304 как целое
+                        if self.cache and not truncated:
+                            self.cache.store(
+                                url, body, charset,
+                                resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+                            )
+                        self.stats["fetched"] += 1
+                        return body.decode(charset, errors="replace"), str(resp.url)
             except Exception as ex:
+                self.stats["errors"] += 1
                 print(f"Ошибка скачивания {url}: {ex}")
-                return None
-
-    def _html_to_document(self, html: str, url: str, parse_classes: List[str] = None) -> Optional[Document]:
-        soup = BeautifulSoup(html, "lxml")
-        if parse_classes:
-            content = "\n".join(
-                tag.get_text(separator=" ", strip=True)
-                for c in parse_classes
-                for tag in soup.find_all(class_=c)
-            )
-        else:
-            content = soup.get_text(separator=" ", strip=True)
+                return None, url
+        return None, url
+
+    def _make_document(self, content: str, url: str, parse_classes: List[str] = None) -> Optional[Document]:
         if not content.strip():
             return None
         return Document(
@@ -38,10 +268,36 @@ class SiteParser:
             metadata={"source": url, "parsed_classes": parse_classes or []}
         )
 
+    def _record_parse(self, html: str, elapsed: float):
+        self.parse_stats["pages"] += 1
+        self.parse_stats["bytes"] += len(html)
+        self.parse_stats["seconds"] += elapsed
+
+    async def _run_parse(self, func, html: str, *args):
+        """Разбор страницы в пуле процессов, чтобы не блокировать event loop и параллельные загрузки"""
+        if self.parse_workers <= 0 or len(html) < INLINE_PARSE_BYTES:
+            result = func(html, *args)
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool, func, html, *args)
+        self._record_parse(html, result[-1])
+        return result
+
+    async def parse_html(self, html: str, url: str, parse_classes: List[str] = None) -> Optional[Document]:
+        content, _ = await self._run_parse(html_to_text, html, parse_classes)
+        return self._make_document(content, url, parse_classes)
+
+    async def parse_page(self, html: str, url: str, parse_classes: List[str] = None) -> Tuple[Optional[Document], List[str]]:
+        """Документ страницы и ссылки с неё за один разбор"""
+        content, links, _ = await self._run_parse(html_to_page, html, url, parse_classes)
+        return self._make_document(content, url, parse_classes), links
+
     async def fetch_site(self, url: str, parse_classes: List[str] = None) -> Optional[Document]:
         html = await self.fetch_html(url)
         if html:
-            return self._html_to_document(html, url, parse_classes=parse_classes)
+            return await self.parse_html(html, url, parse_classes=parse_classes)
         return None
 
     async def fetch_sites(self, urls: List[str], parse_classes: List[str] = None) -> List[Document]:
@@ -52,12 +308,13 @@ class SiteParser:
 
 if __name__ == "__main__":
     async def main():
-        parser = SiteParser()
         urls = [
             "https://ru.wikipedia.org/wiki/Тест",
             "https://lilianweng.github.io/posts/2023-06-23-agent/"
         ]
-        docs = await parser.fetch_sites(urls, parse_classes=["post-content", "post-header"])
+        async with SiteParser() as parser:
+            docs = await parser.fetch_sites(urls, parse_classes=["post-content", "post-header"])
+            print(parser.stats, parser.parse_throughput())
         for doc in docs:
             print("---", doc.metadata)
             print(doc.page_content[:800])
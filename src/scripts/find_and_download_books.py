@@ -1,8 +1,14 @@
+import asyncio
+import hashlib
+import json
 import os
 import re
 import time
 from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlparse
 
+import aiohttp
 import requests
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
@@ -11,6 +17,11 @@ from fake_useragent import UserAgent
 TARGET_FORMATS = ('.txt', '.pdf', '.docx', '.fb2', '.epub', '.md')
 BOOKS_DIR = 'BooksForRAG'
 MAX_LINKS = 10
+DOWNLOAD_CONCURRENCY = 6
+PER_HOST_LIMIT = 2
+HOST_DELAY = 1.0
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+INDEX_FILE = '.downloads.json'
 
 os.makedirs(BOOKS_DIR, exist_ok=True)
 
@@ -35,41 +46,215 @@ def get_yandex_links(query, max_links=20):
                 break
     return results
 
-def extract_book_links(main_url):
+def book_links_from_html(main_url, html):
+    soup = BeautifulSoup(html, "html.parser")
+    links = []
+    for a in soup.find_all("a", href=True):
+        url = a['href']
+        if is_book_url(url):
+            if not url.startswith("http"):
+                url = urljoin(main_url, url)
+            links.append(url)
+    return links
+
+async def extract_book_links(session, main_url):
     try:
-        headers = {"User-Agent": UserAgent().firefox}
-        r = requests.get(main_url, headers=headers, timeout=15)
-        if not r.ok: return []
-        soup = BeautifulSoup(r.text, "html.parser")
-        links = []
-        for a in soup.find_all("a", href=True):
-            url = a['href']
-            if is_book_url(url):
-                if not url.startswith("http"):
-                    url = requests.compat.urljoin(main_url, url)
-                links.append(url)
-        return links
+        async with session.get(main_url) as r:
+            if r.status != 200:
+                return []
+            html = await r.text(errors="replace")
+        return await asyncio.to_thread(book_links_from_html, main_url, html)
     except Exception:
         return []
 
+async def discover_book_links(pages, limit):
+    """Ссылки на книги со страниц выдачи: страницы скачиваются параллельно, порядок выдачи сохраняется"""
+    connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY, limit_per_host=PER_HOST_LIMIT)
+    timeout = aiohttp.ClientTimeout(total=15)
+    headers = {"User-Agent": UserAgent().firefox}
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+        results = await asyncio.gather(*(extract_book_links(session, url) for url in pages))
+    found = []
+    for links in results:
+        for url in links:
+            if url not in found:
+                found.append(url)
+    return found[:limit]
+
 def sanitize_fn(s):
     return re.sub(r'[\\/:*?"<>|]+', "_", s)
 
-def download(url, folder):
-    try:
-        fname = url.split('/')[-1].split('?')[0]
-        fname = sanitize_fn(fname)
-        path = Path(folder) / fname
-        if path.exists():
-            print(f"{fname} — уже сохранено.")
-            return
-        resp = requests.get(url, timeout=30, stream=True)
-        with open(path, 'wb') as f:
-            for chunk in resp.iter_content(8192):
-                f.write(chunk)
-        print(f"{fname} — скачано.")
-    except Exception as e:
-        print(f"Ошибка скачивания {url}: {e}")
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h
+
+def resume_validator(headers):
+    """Значение для If-Range: сильный ETag, иначе Last-Modified (слабый ETag для Range не годится)"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+def content_range_start(value):
+    """Первый байт ответа 206 из Content-Range ("bytes 100-199/1234")"""
+    match = re.match(r'\s*bytes\s+(\d+)-', value or '')
+    return int(match.group(1)) if match else None
+
+def content_range_total(value):
+    """Полный размер файла из Content-Range ("bytes */1234" или "bytes 0-99/1234")"""
+    match = re.search(r'/(\d+)\s*$', value or '')
+    return int(match.group(1)) if match else None
+
+
+class BookDownloader:
+    """
+    Асинхронная загрузка книг: несколько файлов параллельно, но к одному хосту —
+    не больше PER_HOST_LIMIT соединений и с паузой HOST_DELAY между запросами.
+    Файл качается во временный .part и переименовывается только целиком;
+    оборванная загрузка продолжается запросом Range с If-Range, поэтому изменившийся
+    на сервере файл качается заново, а не склеивается из двух версий. Одинаковые книги под разными
+    именами (зеркала) распознаются по sha256 и сохраняются один раз.
+    """
+
+    def __init__(self, folder=BOOKS_DIR, concurrency=DOWNLOAD_CONCURRENCY,
+                 per_host_limit=PER_HOST_LIMIT, host_delay=HOST_DELAY):
+        self.folder = Path(folder)
+        self.concurrency = concurrency
+        self.per_host_limit = per_host_limit
+        self.host_delay = host_delay
+        self.index_path = self.folder / INDEX_FILE
+        self.index = self._load_index()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_last_request: Dict[str, float] = {}
+
+    def _load_index(self):
+        """Индекс {"hashes": sha256 -> файл, "urls": url -> файл}; без него — пересчёт по каталогу"""
+        if self.index_path.exists():
+            return json.loads(self.index_path.read_text(encoding='utf-8'))
+        index = {"hashes": {}, "urls": {}}
+        for path in self.folder.iterdir():
+            if path.is_file() and path.name.lower().endswith(TARGET_FORMATS):
+                index["hashes"].setdefault(file_sha256(path).hexdigest(), path.name)
+        return index
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.index, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.index_path)
+
+    def _target_path(self, fname):
+        """Свободное имя: разные книги с одинаковым именем не перезаписывают друг друга"""
+        path = self.folder / fname
+        n = 1
+        while path.exists():
+            path = self.folder / f"{Path(fname).stem} ({n}){Path(fname).suffix}"
+            n += 1
+        return path
+
+    async def _wait_host(self, url):
+        host = urlparse(url).netloc
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._host_last_request.get(host, 0.0) + self.host_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._host_last_request[host] = time.monotonic()
+
+    async def download(self, session, url) -> Optional[Path]:
+        fname = sanitize_fn(url.split('/')[-1].split('?')[0]) or 'book'
+        known = self.index["urls"].get(url)
+        if known and (self.folder / known).exists():
+            print(f"{known} — уже сохранено.")
+            return self.folder / known
+
+        part = self.folder / f".{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.part"
+        # Валидатор версии файла, с которой начата загрузка .part
+        validator_path = part.with_suffix('.validator')
+        restart = False
+        async with self._semaphore:
+            await self._wait_host(url)
+            try:
+                offset = part.stat().st_size if part.exists() else 0
+                validator = validator_path.read_text(encoding='utf-8') if validator_path.exists() else None
+                if offset and not validator:
+                    # Без ETag/Last-Modified нельзя проверить, что на сервере та же версия файла
+                    offset = 0
+                headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+                async with session.get(url, headers=headers) as resp:
+                    if resp.status == 416:
+                        total = content_range_total(resp.headers.get("Content-Range"))
+                        if not offset:
+                            print(f"Ошибка скачивания {url}: HTTP 416")
+                            return None
+                        if total != offset:
+                            print(f"{fname}: на сервере {total} байт, а в .part {offset} — качаю заново")
+                            restart = True
+                        else:
+                            # Всё уже скачано в прошлый раз, осталось только переименовать
+                            hasher = await asyncio.to_thread(file_sha256, part)
+                    elif resp.status == 206 and content_range_start(resp.headers.get("Content-Range")) != offset:
+                        # Сервер прислал не тот диапазон: дописать его к .part — испортить файл
+                        print(f"{fname}: ответ 206 не с {offset} байта ({resp.headers.get('Content-Range')}) — качаю заново")
+                        restart = True
+                    elif resp.status in (200, 206):
+                        if resp.status == 206 and offset:
+                            hasher = await asyncio.to_thread(file_sha256, part)
+                            mode = 'ab'
+                        else:
+                            # 200 на запрос с If-Range — файл изменился, старый .part не годится
+                            hasher = hashlib.sha256()
+                            mode = 'wb'
+                            validator = resume_validator(resp.headers)
+                            if validator:
+                                validator_path.write_text(validator, encoding='utf-8')
+                            else:
+                                validator_path.unlink(missing_ok=True)
+                        with open(part, mode) as f:
+                            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                                f.write(chunk)
+                                hasher.update(chunk)
+                    else:
+                        print(f"Ошибка скачивания {url}: HTTP {resp.status}")
+                        return None
+            except Exception as e:
+                print(f"Ошибка скачивания {url}: {e} (продолжится с {part.stat().st_size if part.exists() else 0} байт)")
+                return None
+
+        if restart:
+            part.unlink(missing_ok=True)
+            validator_path.unlink(missing_ok=True)
+            return await self.download(session, url)
+
+        validator_path.unlink(missing_ok=True)
+        digest = hasher.hexdigest()
+        existing = self.index["hashes"].get(digest)
+        if existing and (self.folder / existing).exists():
+            part.unlink()
+            self.index["urls"][url] = existing
+            self._save_index()
+            print(f"{fname} — копия уже сохранённого {existing}.")
+            return self.folder / existing
+
+        path = self._target_path(fname)
+        os.replace(part, path)
+        self.index["hashes"][digest] = path.name
+        self.index["urls"][url] = path.name
+        self._save_index()
+        print(f"{path.name} — скачано.")
+        return path
+
+    async def download_all(self, urls: List[str]) -> List[Path]:
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=20, sock_read=60)
+        headers = {"User-Agent": UserAgent().firefox}
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            results = await asyncio.gather(*(self.download(session, url) for url in urls))
+        return list({path for path in results if path is not None})
+
 
 def main():
     yandex_links = get_yandex_links("меланхолия", max_links=20)
@@ -82,22 +267,18 @@ def main():
             if len(found) >= MAX_LINKS: break
 
     if len(found) < MAX_LINKS:
-        for main_url in yandex_links:
-            print(f"Парсю: {main_url}")
-            links = extract_book_links(main_url)
-            for url in links:
-                found.add(url)
-                if len(found) >= MAX_LINKS: break
+        print(f"Парсю страниц: {len(yandex_links)}")
+        for url in asyncio.run(discover_book_links(yandex_links, MAX_LINKS)):
+            found.add(url)
             if len(found) >= MAX_LINKS: break
-            time.sleep(1)
 
     if not found:
         print("Ничего не найдено")
         return
     print(f"Итого найдено ссылок на книги: {len(found)}\nКачаю...\n")
-    for url in list(found)[:MAX_LINKS]:
-        download(url, BOOKS_DIR)
-        time.sleep(2)
+    downloader = BookDownloader(BOOKS_DIR)
+    saved = asyncio.run(downloader.download_all(list(found)[:MAX_LINKS]))
+    print(f"Сохранено книг: {len(saved)}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,213 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import INGEST_CHUNKS_PER_SECOND, INGEST_DOCUMENTS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = 32
+INGEST_QUEUE_SIZE = 256
+FLUSH_INTERVAL = 2.0
+MAX_RETRIES = 3
+MAX_TEXT_LENGTH = 50000
+
+_STOP = object()
+# Номера экземпляров стадии: одновременно работающие стадии с одним именем получают разные метки метрик
+_sink_numbers = itertools.count(1)
+
+# Элемент очереди: (текст, метаданные, id, группа)
+SinkItem = Tuple[str, Dict[str, Any], Optional[str], Hashable]
+
+
+class IndexingSink:
+    """
+    Стадия индексации потокового конвейера: документы приходят через ограниченную очередь,
+    собираются в пачки и пишутся в RagDB (эмбеддинги + ChromaDB) в отдельном потоке,
+    пока производитель продолжает скачивать следующие страницы.
+    Очередь ограничена, поэтому память не зависит от размера источника.
+    """
+
+    def __init__(
+        self,
+        db,
+        batch_size: int = INGEST_BATCH_SIZE,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        on_flush: Optional[Callable[[List[SinkItem], bool], Awaitable[None]]] = None,
+        name: str = "ingest"
+    ):
+        """
+        Args:
+            name: Имя стадии в метриках (queue_depth, rag_ingest_chunks_per_second)
+            on_flush: Вызывается после записи каждой пачки (элементы, успех) —
+                например, для сохранения чекпоинта. Пачки пишутся в порядке поступления.
+        """
+        self.db = db
+        self.on_flush = on_flush
+        self.metric_label = f"{name}-{next(_sink_numbers)}"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.indexed_docs = 0
+        self.indexed_chunks = 0
+        self.failed_docs = 0
+        # Счётчики по группам (например, по каналам), когда в стадию пишут несколько источников
+        self.indexed_by_group: Dict[Hashable, int] = defaultdict(int)
+        self.failed_by_group: Dict[Hashable, int] = defaultdict(int)
+        self._pending_by_group: Dict[Hashable, int] = defaultdict(int)
+        self._flushed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+
+    async def __aenter__(self) -> "IndexingSink":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._consume())
+        QUEUE_DEPTH.set_function(self.queue_depth, queue=self.metric_label)
+        INGEST_CHUNKS_PER_SECOND.set_function(self.chunks_per_second, sink=self.metric_label)
+
+    async def put(self, text: str, metadata: Dict[str, Any], id_: Optional[str] = None, group: Hashable = None):
+        """
+        Передать документ на индексацию; ждёт, если очередь заполнена.
+        Ожидающие производители обслуживаются очередью по порядку (FIFO),
+        поэтому несколько источников, пишущих в одну стадию, чередуются поровну.
+        """
+        if self._task is not None and self._task.done():
+            # Потребитель упал — не копим документы, а поднимаем его ошибку
+            self._task.result()
+        if len(text) > MAX_TEXT_LENGTH:
+            text = text[:MAX_TEXT_LENGTH] + "... [обрезано для ChromaDB]"
+        self._pending_by_group[group] += 1
+        try:
+            await self.queue.put((text, metadata, id_, group))
+        except BaseException:
+            # Производителя отменили, пока он ждал места в очереди: документ в стадию не попал
+            self._pending_by_group[group] -= 1
+            asyncio.get_running_loop().create_task(self._notify_flushed())
+            raise
+
+    async def drain(self, group: Hashable = None):
+        """Дождаться записи всех документов группы, уже переданных в стадию"""
+        async with self._flushed:
+            await self._flushed.wait_for(lambda: not self._pending_by_group.get(group))
+
+    async def _notify_flushed(self):
+        async with self._flushed:
+            self._flushed.notify_all()
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def chunks_per_second(self) -> float:
+        elapsed = time.monotonic() - self._started_at
+        return self.indexed_chunks / elapsed if elapsed > 0 else 0.0
+
+    async def close(self) -> int:
+        """Дописать остаток очереди и остановить стадию; возвращает число документов"""
+        if self._task is not None:
+            if not self._task.done():
+                await self.queue.put(_STOP)
+            await self._task
+            self._task = None
+        QUEUE_DEPTH.remove(queue=self.metric_label)
+        INGEST_CHUNKS_PER_SECOND.remove(sink=self.metric_label)
+        return self.indexed_docs
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        batch: List[SinkItem] = []
+        deadline = loop.time() + self.flush_interval
+
+        while True:
+            timeout = max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is _STOP:
+                break
+            if item is not None:
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or item is None):
+                await self._flush(batch)
+                batch = []
+            if item is None or not batch:
+                deadline = loop.time() + self.flush_interval
+
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[SinkItem]):
+        success = await self._write(batch)
+
+        if self.on_flush is not None:
+            try:
+                await self.on_flush(batch, success)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика on_flush: {e}")
+
+        async with self._flushed:
+            for item in batch:
+                self._pending_by_group[item[3]] -= 1
+            self._flushed.notify_all()
+
+    async def _write(self, batch: List[SinkItem]) -> bool:
+        # Документы со стабильными id и без них пишутся отдельно: иначе пришлось бы отбросить id
+        # у всей пачки, и повторная загрузка тех же документов создала бы дубликаты
+        with_ids = [item for item in batch if item[2] is not None]
+        without_ids = [item for item in batch if item[2] is None]
+
+        chunks = 0
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                if with_ids:
+                    chunks += await asyncio.to_thread(
+                        self.db.add_texts,
+                        [item[0] for item in with_ids],
+                        [item[1] for item in with_ids],
+                        ids=[item[2] for item in with_ids],
+                        batch_size=self.batch_size
+                    ) or 0
+                    # Повтор после ошибки во второй части не пишет первую заново
+                    with_ids = []
+                if without_ids:
+                    chunks += await asyncio.to_thread(
+                        self.db.add_texts,
+                        [item[0] for item in without_ids],
+                        [item[1] for item in without_ids],
+                        ids=None,
+                        batch_size=self.batch_size
+                    ) or 0
+                self.indexed_docs += len(batch)
+                INGEST_DOCUMENTS.inc(len(batch), result="indexed")
+                self.indexed_chunks += chunks
+                for item in batch:
+                    self.indexed_by_group[item[3]] += 1
+                logger.info(
+                    f"Проиндексировано документов: {self.indexed_docs} "
+                    f"({self.chunks_per_second():.1f} чанков/с, в очереди {self.queue_depth()})"
+                )
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка записи пачки из {len(batch)} документов, попытка {attempt}: {e}")
+                if attempt < MAX_RETRIES:
+                    await asyncio.sleep(attempt)
+
+        self.failed_docs += len(batch)
+        INGEST_DOCUMENTS.inc(len(batch), result="failed")
+        for item in batch:
+            self.failed_by_group[item[3]] += 1
+        logger.warning(f"Пачка из {len(batch)} документов пропущена после {MAX_RETRIES} попыток")
+        return False
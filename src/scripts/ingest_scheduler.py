@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_CHANNELS = 4
+# Сколько секунд FloodWait аккаунт может «потратить» за один прогон, прежде чем новые каналы откладываются
+FLOOD_WAIT_BUDGET = 600.0
+
+
+class FloodBudgetExceeded(Exception):
+    """Канал не запущен: аккаунт исчерпал бюджет ожидания FloodWait"""
+
+
+class ChannelIngestScheduler:
+    """
+    Параллельная загрузка многих источников в одну общую стадию индексации.
+    Одновременно работает не больше max_concurrency производителей; каждый из них
+    пишет в общий IndexingSink, так что пачки эмбеддингов заполняются постами разных каналов.
+    Перед запуском очередного канала проверяется бюджет FloodWait аккаунта:
+    при его исчерпании оставшиеся каналы откладываются, а не копят паузы.
+    """
+
+    def __init__(
+        self,
+        client_manager=None,
+        max_concurrency: int = MAX_CONCURRENT_CHANNELS,
+        flood_wait_budget: float = FLOOD_WAIT_BUDGET
+    ):
+        self.client_manager = client_manager
+        self.max_concurrency = max_concurrency
+        self.flood_wait_budget = flood_wait_budget
+
+    def _budget_exceeded(self, flood_wait_start: float) -> bool:
+        if self.client_manager is None:
+            return False
+        return self.client_manager.flood_wait_total - flood_wait_start > self.flood_wait_budget
+
+    async def run(self, jobs: Dict[Hashable, Callable[[], Awaitable[Any]]]) -> Dict[Hashable, Any]:
+        """
+        Выполнить задания (ключ -> фабрика корутины) с ограничением параллелизма.
+        Результат по ключу — значение корутины или исключение, с которым она завершилась.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        flood_wait_start = self.client_manager.flood_wait_total if self.client_manager else 0.0
+        results: Dict[Hashable, Any] = {}
+
+        async def run_job(key: Hashable, job: Callable[[], Awaitable[Any]]):
+            async with semaphore:
+                if self._budget_exceeded(flood_wait_start):
+                    results[key] = FloodBudgetExceeded(f"{key}: отложен из-за ограничений Telegram (FloodWait)")
+                    return
+                remaining = self.client_manager.flood_wait_remaining() if self.client_manager else 0.0
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                try:
+                    results[key] = await job()
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки {key}: {e}")
+                    results[key] = e
+
+        await asyncio.gather(*(run_job(key, job) for key, job in jobs.items()))
+        return results
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from metrics import QUERY_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+QUERY_MAX_BATCH = 32
+QUERY_MAX_WAIT = 0.005
+QUERY_MAX_INFLIGHT = 2
+
+# Ожидающий запрос: (текст, вектор темы диалога или None, future с результатом для вызывающего)
+PendingQuery = Tuple[str, Optional[Any], asyncio.Future]
+
+
+class QueryBatcher:
+    """
+    Микробатчинг поиска: одновременные запросы разных пользователей копятся до max_wait секунд
+    (или до max_batch штук) и уходят в RagDB.query_batch одной пачкой — один проход модели
+    эмбеддингов и один запрос к Chroma вместо десятков пачек из одного текста.
+    Пока заняты max_inflight пачек, новые запросы продолжают копиться, поэтому под нагрузкой
+    пачки растут сами.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_batch: int = QUERY_MAX_BATCH,
+        max_wait: float = QUERY_MAX_WAIT,
+        max_inflight: int = QUERY_MAX_INFLIGHT
+    ):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_inflight = max_inflight
+        # Запросы с разным topk ищутся разными пачками
+        self._pending: Dict[int, List[PendingQuery]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._inflight = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def query(self, text: str, topk: int = 5, context_vector=None) -> List[Dict[str, Any]]:
+        """То же, что RagDB.query, но в общей пачке с одновременными запросами"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(topk, [])
+        pending.append((text, context_vector, future))
+
+        if len(pending) >= self.max_batch:
+            self._flush(topk)
+        elif topk not in self._timers:
+            self._timers[topk] = loop.call_later(self.max_wait, self._flush, topk)
+        return await future
+
+    async def drain(self):
+        """Дождаться поиска по всем уже принятым запросам"""
+        while self._pending or self._tasks:
+            for topk in list(self._pending):
+                self._flush(topk)
+            if self._tasks:
+                await asyncio.wait(set(self._tasks))
+            else:
+                await asyncio.sleep(self.max_wait)
+
+    def _flush(self, topk: int):
+        timer = self._timers.pop(topk, None)
+        if timer is not None:
+            timer.cancel()
+
+        pending = self._pending.get(topk)
+        if not pending or self._inflight >= self.max_inflight:
+            # Пачку заберёт _run, когда освободится место
+            return
+
+        batch, rest = pending[:self.max_batch], pending[self.max_batch:]
+        loop = asyncio.get_running_loop()
+        if rest:
+            self._pending[topk] = rest
+            self._timers[topk] = loop.call_later(self.max_wait, self._flush, topk)
+        else:
+            del self._pending[topk]
+
+        self._inflight += 1
+        task = loop.create_task(self._run(batch, topk))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[PendingQuery], topk: int):
+        try:
+            # Отменённые запросы (пользователь уже прислал новое сообщение) не ищем
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                return
+            QUERY_BATCH_SIZE.observe(len(batch))
+            texts = [text for text, _, _ in batch]
+            context_vectors = [vector for _, vector, _ in batch]
+            if all(vector is None for vector in context_vectors):
+                context_vectors = None
+            try:
+                results = await asyncio.to_thread(self.db.query_batch, texts, topk, context_vectors)
+            except Exception as e:
+                logger.error(f"Ошибка поиска пачкой из {len(batch)} запросов: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, _, future), docs in zip(batch, results):
+                if not future.done():
+                    future.set_result(docs)
+        finally:
+            self._inflight -= 1
+            for pending_topk in list(self._pending):
+                self._flush(pending_topk)
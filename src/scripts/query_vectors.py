@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import numpy as np
+
+QUERY_CACHE_SIZE = 4096
+DIALOG_DECAY = 0.6
+DIALOG_WEIGHT = 0.35
+MAX_DIALOG_SESSIONS = 10000
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def mix_query_vector(query: np.ndarray, dialog: Optional[np.ndarray], weight: float = DIALOG_WEIGHT) -> np.ndarray:
+    """
+    Сместить эмбеддинг вопроса к теме диалога. Длина исходного вектора сохраняется,
+    чтобы расстояния в коллекции оставались в привычном масштабе.
+    """
+    if dialog is None:
+        return query
+    mixed = _normalize(_normalize(query) + weight * dialog)
+    return mixed * np.linalg.norm(query)
+
+
+class QueryEmbeddingCache:
+    """LRU-кэш эмбеддингов запросов; работает из потоков asyncio.to_thread"""
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._items.get(text)
+            if vector is not None:
+                self._items.move_to_end(text)
+            return vector
+
+    def put(self, text: str, vector: np.ndarray):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[text] = vector
+            self._items.move_to_end(text)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DialogVectors:
+    """
+    Бегущий вектор диалога на сессию: экспоненциальное скользящее среднее нормированных
+    эмбеддингов вопросов. Обновляется за O(dim) на реплику, без повторного кодирования истории.
+    """
+
+    def __init__(self, decay: float = DIALOG_DECAY, max_sessions: int = MAX_DIALOG_SESSIONS):
+        self.decay = decay
+        self.max_sessions = max_sessions
+        self._vectors: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Нормированный вектор темы диалога или None, если реплик ещё не было"""
+        vector = self._vectors.get(key)
+        return None if vector is None else _normalize(vector)
+
+    def update(self, key: Hashable, query: np.ndarray):
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        previous = self._vectors.get(key)
+        self._vectors[key] = query if previous is None else self.decay * previous + (1 - self.decay) * query
+        self._vectors.move_to_end(key)
+        while len(self._vectors) > self.max_sessions:
+            self._vectors.popitem(last=False)
+
+    def reset(self, key: Hashable):
+        self._vectors.pop(key, None)
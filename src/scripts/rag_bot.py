@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from langchain_mistralai.chat_models import ChatMistralAI
 try:
     from langchain_core.prompts import PromptTemplate
@@ -6,11 +8,15 @@ except ImportError:
 
 import rag_database
 
+FULL_SUMMARY_CHUNKS = 100
+
 
 class RAGBot:
     def __init__(self, api_key, db, mistral_model="mistral-small"):
         self.llm = ChatMistralAI(model=mistral_model, mistral_api_key=api_key)
         self.db = db
+        # session_id -> последний выданный seq; при первом обращении берётся максимум из коллекции
+        self._session_seq = {}
         self.prompt = PromptTemplate.from_template(
             "Контекст:\n{context}\n\nВопрос: {question}\n\nОтвет:"
         )
@@ -22,34 +28,76 @@ class RAGBot:
         result = self.llm.invoke(prompt_message)
         return getattr(result, "content", None) or getattr(result, "text", None) or str(result)
 
+    def _next_seq(self, session_id):
+        """
+        Следующий номер чанка в сессии: счётчик, а не время — часы могут уйти назад,
+        и чанк с меньшим seq навсегда выпал бы из инкрементальных резюме
+        """
+        if session_id not in self._session_seq:
+            existing = self.db.col.get(where={"session_id": session_id}, include=["metadatas"])
+            self._session_seq[session_id] = max(
+                (meta.get("seq", 0) for meta in existing["metadatas"] if meta.get("source_type") != "summary"),
+                default=0
+            )
+        self._session_seq[session_id] += 1
+        return self._session_seq[session_id]
+
     def add_session_chunk(self, text, session_id, source_type, source, username, tags=None, **kwargs):
         meta = {
             "session_id": session_id,
             "source_type": source_type,
             "source": source,
             "username": username,
-            "tags": tags or []
+            "tags": tags or [],
+            # Возрастающий номер чанка внутри сессии — по нему ведётся high-water mark резюме
+            "seq": self._next_seq(session_id)
         }
         meta.update(kwargs)
         self.db.add_texts([text], metadatas=[meta])
 
-    def summarize_session(self, session_id, username, tags=None):
-        session_docs = self.db.query(
-            text="", topk=100,
-            session_id=session_id,
-            tags=tags,
-            username=username
+    def summarize_session(self, session_id, username, tags=None, incremental=True):
+        """
+        Обновляет резюме сессии на месте.
+        В инкрементальном режиме в LLM уходят только чанки новее последнего резюме
+        (по high-water mark `summarized_seq`) вместе с предыдущим резюме,
+        поэтому стоимость вызова не растёт с длиной сессии.
+        """
+        summary_id = f"summary_{session_id}"
+        previous_summary, summarized_seq = "", 0
+
+        if incremental:
+            previous = self.db.col.get(ids=[summary_id], include=["documents", "metadatas"])
+            if previous["ids"]:
+                previous_summary = previous["documents"][0]
+                summarized_seq = previous["metadatas"][0].get("summarized_seq", 0)
+
+        conditions = [{"session_id": session_id}, {"source_type": {"$ne": "summary"}}]
+        if incremental:
+            conditions.append({"seq": {"$gt": summarized_seq}})
+        new_chunks = self.db.col.get(where={"$and": conditions}, include=["documents", "metadatas"])
+        # Chroma не сортирует выдачу, поэтому лимит полной пересборки применяется после сортировки по seq
+        chunks = sorted(
+            zip(new_chunks["documents"], new_chunks["metadatas"]),
+            key=lambda item: (item[1].get("seq", 0), item[1].get("chunk_id", 0))
         )
-        self.db.col.delete(where={"session_id": session_id, "source_type": "summary"})
-        context = "\n".join(doc["doc"] for doc in session_docs if doc["meta"].get("source_type") != "summary")
+        if not incremental:
+            chunks = chunks[:FULL_SUMMARY_CHUNKS]
+        context = "\n".join(doc for doc, _ in chunks)
 
         if not context.strip():
-            return
+            return previous_summary or None
 
-        summary_prompt = (
-            "Суммируй следующую переписку или сообщения (оставь главное, убери детали):\n"
-            f"{context}\n\nИтоговое резюме:"
-        )
+        if previous_summary:
+            summary_prompt = (
+                "Обнови резюме переписки с учетом новых сообщений (оставь главное, убери детали).\n"
+                f"Текущее резюме:\n{previous_summary}\n\n"
+                f"Новые сообщения:\n{context}\n\nОбновленное резюме:"
+            )
+        else:
+            summary_prompt = (
+                "Суммируй следующую переписку или сообщения (оставь главное, убери детали):\n"
+                f"{context}\n\nИтоговое резюме:"
+            )
         summary_text = self.llm.invoke(summary_prompt)
         summary_text = getattr(summary_text, "content", None) or getattr(summary_text, "text", None) or str(summary_text)
 
@@ -59,9 +107,11 @@ class RAGBot:
             "source": "summary_bot",
             "tags": tags or [],
             "username": username,
+            "summarized_seq": max(meta.get("seq", 0) for _, meta in chunks),
             "updated_at": datetime.now().isoformat()
         }
-        self.db.add_texts([summary_text], metadatas=[summary_meta])
+        self.db.upsert_text(summary_id, summary_text, summary_meta)
+        return summary_text
 
 if __name__ == "__main__":
     db = rag_database.RagDB(db="./chroma_db", name="papers")
@@ -1,17 +1,23 @@
 import logging
 import re
 import time
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterator, Optional
 
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from metrics import STAGE_SECONDS, INGEST_CHUNKS, QUERY_CACHE_REQUESTS
+from query_vectors import QUERY_CACHE_SIZE, QueryEmbeddingCache, mix_query_vector
+
 CHUNK_SIZE = 5000
 CHUNK_OVERLAP = 180
 BATCH_SIZE = 1
 MIN_CHUNK_LEN = 50
 MAX_CHUNK_LEN = 2048
 MAX_TOTAL_CHUNKS = 500
+COPY_PAGE_SIZE = 2000
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("unidb")
@@ -35,35 +41,99 @@ def split_chunks(text: str, sz=CHUNK_SIZE, ovl=CHUNK_OVERLAP, min_chunk=MIN_CHUN
         p = end-ovl if end < n else end
     return res
 
+@dataclass(frozen=True)
+class HnswParams:
+    """Параметры индекса HNSW коллекции Chroma (по умолчанию — как в самой Chroma)"""
+    space: str = "l2"
+    construction_ef: int = 100
+    search_ef: int = 10
+    m: int = 16
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "hnsw:space": self.space,
+            "hnsw:construction_ef": self.construction_ef,
+            "hnsw:search_ef": self.search_ef,
+            "hnsw:M": self.m,
+        }
+
+    @classmethod
+    def from_metadata(cls, metadata: Optional[Dict[str, Any]]) -> "HnswParams":
+        metadata = metadata or {}
+        default = cls()
+        return cls(
+            space=metadata.get("hnsw:space", default.space),
+            construction_ef=int(metadata.get("hnsw:construction_ef", default.construction_ef)),
+            search_ef=int(metadata.get("hnsw:search_ef", default.search_ef)),
+            m=int(metadata.get("hnsw:M", default.m)),
+        )
+
 class RagDB:
     def __init__(
         self,
         db: str = "./chroma_db",
         name: str = "papers",
-        model: str = "paraphrase-multilingual-MiniLM-L12-v2"
+        model: str = "paraphrase-multilingual-MiniLM-L12-v2",
+        host: Optional[str] = None,
+        port: int = 8000,
+        embedder=None,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+        hnsw: Optional[HnswParams] = None
     ):
-        self.vec = SentenceTransformer(model, device='cpu')
-        self.chroma = chromadb.PersistentClient(path=db)
+        """
+        Если задан host, используется сервер ChromaDB (нужно, когда в коллекцию пишет
+        отдельный процесс, например воркер загрузки), иначе — локальная база в каталоге db.
+        embedder — готовый объект с методом encode как у SentenceTransformer
+        (например, детерминированная заглушка в бенчмарках) вместо загрузки model.
+        query_cache_size — размер LRU-кэша эмбеддингов запросов (0 — без кэша).
+        hnsw — параметры индекса новой коллекции; у существующей они не меняются
+        (для этого есть rebuild_collection и tune_index.py).
+        """
+        self.vec = embedder if embedder is not None else SentenceTransformer(model, device='cpu')
+        self.query_cache = QueryEmbeddingCache(query_cache_size)
+        self.path = db
+        self.name = name
+        if host:
+            self.chroma = chromadb.HttpClient(host=host, port=port)
+        else:
+            self.chroma = chromadb.PersistentClient(path=db)
         try:
             self.col = self.chroma.get_collection(name)
         except Exception:
-            self.col = self.chroma.create_collection(name=name, metadata={"description": "Universal RAG DB"})
-        log.info(f"Embedding: {model}, Collection: {name}")
+            self.col = self.chroma.create_collection(name=name, metadata=self._collection_metadata(hnsw or HnswParams()))
+        if hnsw is not None and hnsw != self.hnsw:
+            log.warning(f"Коллекция {name} создана с {self.hnsw}, а не {hnsw}: параметры меняются только пересборкой")
+        log.info(f"Embedding: {model}, Collection: {name}, {self.hnsw}")
+
+    @staticmethod
+    def _collection_metadata(hnsw: HnswParams) -> Dict[str, Any]:
+        return {"description": "Universal RAG DB", **hnsw.to_metadata()}
+
+    @property
+    def hnsw(self) -> HnswParams:
+        return HnswParams.from_metadata(self.col.metadata)
 
     def add_texts(
         self,
         texts: List[str],
         metadatas: Optional[List[Dict[str, Any]]] = None,
-        source_name: Optional[str] = None
-    ):
+        source_name: Optional[str] = None,
+        ids: Optional[List[str]] = None,
+        batch_size: int = BATCH_SIZE
+    ) -> int:
         """
         Сохраняет ВСЮ информацию из постов в бд — каждый пост делится на оптимальные чанки.
         В памяти никогда не держится больше одного батча.
+        Если переданы ids (по одному на текст), чанки получают стабильные id вида "<id>_<chunk>"
+        и записываются через upsert — повторная загрузка того же текста не создаёт дублей.
+        Возвращает число проиндексированных чанков.
         """
         start = time.time()
         if metadatas is None:
             metadatas = [{} for _ in range(len(texts))]
         assert len(texts) == len(metadatas), "texts and metadatas should have same length"
+        assert ids is None or len(ids) == len(texts), "texts and ids should have same length"
+        write = self.col.upsert if ids is not None else self.col.add
         log.info(f"Добавляется {len(texts)} элементов...")
 
         def chunk_generator(texts, metadatas):
@@ -73,9 +143,12 @@ class RagDB:
                 if not chunks:
                     log.warning(f"Пустой результат split_chunks для {idx}!")
                 for i, chunk in enumerate(chunks):
-                    log.info(f"chunklen={len(chunk)} (orig text len: {len(cln)}) [idx={idx}]")
+                    log.debug(f"chunklen={len(chunk)} (orig text len: {len(cln)}) [idx={idx}]")
 
-                    id_ = f"{source_name or 'external'}_{idx}_{i}_{int(time.time()*1000)%100000}"
+                    if ids is not None:
+                        id_ = f"{ids[idx]}_{i}"
+                    else:
+                        id_ = f"{source_name or 'external'}_{idx}_{i}_{int(time.time()*1000)%100000}"
                     m = dict(meta)
                     m["source"] = source_name or meta.get('source', 'external')
                     m["orig_id"] = idx
@@ -92,33 +165,39 @@ class RagDB:
             docs_buffer.append(doc)
             metas_buffer.append(meta)
             total_chunks += 1
-            if len(docs_buffer) >= BATCH_SIZE:
-                embeds = self.vec.encode(
-                    docs_buffer, convert_to_numpy=True, show_progress_bar=False
-                )
-                self.col.add(
-                    embeddings=embeds.tolist(),
-                    documents=docs_buffer,
-                    metadatas=metas_buffer,
-                    ids=ids_buffer
-                )
+            if len(docs_buffer) >= batch_size:
+                self._write_batch(write, ids_buffer, docs_buffer, metas_buffer)
                 indexed_count += len(docs_buffer)
-                log.info(f"    Индексировано чанков: {indexed_count}/{total_chunks}")
+                log.debug(f"    Индексировано чанков: {indexed_count}/{total_chunks}")
                 ids_buffer, docs_buffer, metas_buffer = [], [], []
         if docs_buffer:
-            embeds = self.vec.encode(
-                docs_buffer, convert_to_numpy=True, show_progress_bar=False
-            )
-            self.col.add(
-                embeddings=embeds.tolist(),
-                documents=docs_buffer,
-                metadatas=metas_buffer,
-                ids=ids_buffer
-            )
+            self._write_batch(write, ids_buffer, docs_buffer, metas_buffer)
             indexed_count += len(docs_buffer)
-            log.info(f"    Индексировано чанков: {indexed_count}/{total_chunks}")
+            log.debug(f"    Индексировано чанков: {indexed_count}/{total_chunks}")
         log.info(f"Всего чанков к индексации: {total_chunks}")
         log.info(f"Загрузка завершена за {time.time()-start:.2f} сек.")
+        return indexed_count
+
+    def _write_batch(self, write, ids, docs, metas):
+        with STAGE_SECONDS.time(stage="ingest_embed"):
+            embeds = self.vec.encode(docs, convert_to_numpy=True, show_progress_bar=False)
+        with STAGE_SECONDS.time(stage="ingest_write"):
+            write(embeddings=embeds.tolist(), documents=docs, metadatas=metas, ids=ids)
+        INGEST_CHUNKS.inc(len(docs))
+
+    def upsert_text(self, id_: str, text: str, metadata: Dict[str, Any]):
+        """Записать (или перезаписать) один документ под фиксированным id без разбиения на чанки"""
+        embeds = self.vec.encode([text], convert_to_numpy=True, show_progress_bar=False)
+        self.col.upsert(
+            embeddings=embeds.tolist(),
+            documents=[text],
+            metadatas=[metadata],
+            ids=[id_]
+        )
+
+    def delete_where(self, where: Dict[str, Any]):
+        """Удалить все чанки, подходящие под фильтр метаданных"""
+        self.col.delete(where=where)
 
     def add_documents(self, docs: List[Dict[str, Any]], text_key: str = "text"):
         texts = [d[text_key] for d in docs]
@@ -126,14 +205,102 @@ class RagDB:
         self.add_texts(texts, metadatas)
 
     def query(self, text: str, topk: int = 5):
-        e = self.vec.encode([text])
-        r = self.col.query(query_embeddings=e.tolist(), n_results=topk)
-        return [{
-            "doc": r['documents'][0][i],
-            "meta": r['metadatas'][0][i],
-            "score": r['distances'][0][i] if 'distances' in r else None,
-            "id": r['ids'][0][i]
-        } for i in range(len(r['documents'][0]))]
+        return self.query_batch([text], topk=topk)[0]
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Эмбеддинги запросов через LRU-кэш: модель считает только новые тексты, одной пачкой"""
+        vectors = [self.query_cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        QUERY_CACHE_REQUESTS.inc(len(texts) - len(missing), result="hit")
+        if missing:
+            QUERY_CACHE_REQUESTS.inc(len(missing), result="miss")
+            encoded = dict(zip(missing, self.vec.encode(missing)))
+            for text, vector in encoded.items():
+                self.query_cache.put(text, vector.copy())
+            vectors = [encoded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.stack(vectors)
+
+    def cached_query_vector(self, text: str) -> Optional[np.ndarray]:
+        """Эмбеддинг уже искавшегося запроса без обращения к модели"""
+        return self.query_cache.get(text)
+
+    def query_batch(
+        self,
+        texts: List[str],
+        topk: int = 5,
+        context_vectors: Optional[List[Optional[np.ndarray]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Поиск по нескольким запросам сразу: один проход модели и один запрос к Chroma.
+        context_vectors — векторы темы диалога (или None) для каждого запроса,
+        к которым смещается эмбеддинг вопроса.
+        """
+        with STAGE_SECONDS.time(stage="embed"):
+            e = self.embed_queries(texts)
+        if context_vectors is not None:
+            e = np.stack([mix_query_vector(q, c) for q, c in zip(e, context_vectors)])
+        with STAGE_SECONDS.time(stage="chroma_query"):
+            r = self.col.query(query_embeddings=e.tolist(), n_results=topk)
+        return [[{
+            "doc": r['documents'][q][i],
+            "meta": r['metadatas'][q][i],
+            "score": r['distances'][q][i] if 'distances' in r else None,
+            "id": r['ids'][q][i]
+        } for i in range(len(r['documents'][q]))] for q in range(len(texts))]
+
+    def iter_items(self, include: List[str], page_size: int = COPY_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+        """Постраничное чтение всей коллекции (ids всегда включены)"""
+        offset = 0
+        while True:
+            page = self.col.get(include=include, limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+
+    def rebuild_collection(self, hnsw: HnswParams, drop_backup: bool = False) -> Optional[str]:
+        """
+        Пересобрать коллекцию с новыми параметрами HNSW: записи копируются вместе с готовыми
+        эмбеддингами (модель не нужна) в новую коллекцию, которая затем получает имя старой.
+        Старая остаётся под именем <name>_backup_<время>, если не drop_backup; возвращает это имя.
+        Писать в коллекцию во время пересборки нельзя — остановите бота и воркер.
+        """
+        started = time.time()
+        temp_name = f"{self.name}_rebuild"
+        try:
+            self.chroma.delete_collection(temp_name)  # остаток прерванной пересборки
+        except Exception:
+            pass
+        metadata = {**(self.col.metadata or {}), **hnsw.to_metadata()}
+        rebuilt = self.chroma.create_collection(name=temp_name, metadata=metadata)
+
+        copied = 0
+        for page in self.iter_items(include=["embeddings", "documents", "metadatas"]):
+            rebuilt.add(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"]
+            )
+            copied += len(page["ids"])
+            log.info(f"Пересборка {self.name}: скопировано {copied}")
+
+        backup_name = f"{self.name}_backup_{int(started)}"
+        # Два переименования не атомарны: если второе не удалось, возвращаем старой коллекции её имя
+        self.col.modify(name=backup_name)
+        try:
+            rebuilt.modify(name=self.name)
+        except Exception:
+            log.error(f"Не удалось переименовать {temp_name} в {self.name}, возвращаю исходную коллекцию")
+            self.col.modify(name=self.name)
+            raise
+        self.col = rebuilt
+        log.info(f"Коллекция {self.name} пересобрана с {hnsw} за {time.time() - started:.1f} сек. ({copied} записей)")
+
+        if drop_backup:
+            self.chroma.delete_collection(backup_name)
+            return None
+        return backup_name
 
     def stats(self):
         docs = self.col.get()
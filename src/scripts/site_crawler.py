@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urlparse
+from urllib.robotparser import RobotFileParser
+
+from download_web import SiteParser
+from ingest_pipeline import IndexingSink
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 2
+MAX_PAGES = 200
+MAX_FRONTIER = 5000
+MAX_SEEN = 100000
+CRAWL_DELAY = 1.0
+CRAWL_CONCURRENCY = 4
+SKIP_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".tar", ".rar", ".7z", ".exe", ".dmg",
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico",
+    ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".xml", ".json"
+)
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """URL без якоря и с хостом в нижнем регистре; None для не-HTTP ссылок"""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return None
+    if parsed.path.lower().endswith(SKIP_EXTENSIONS):
+        return None
+    return parsed._replace(netloc=parsed.netloc.lower(), path=parsed.path or "/").geturl()
+
+
+def page_id(url: str) -> str:
+    return "web_" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+
+
+class SiteCrawler:
+    """
+    Обход сайта от стартовых URL по ссылкам того же домена с записью страниц в RagDB.
+    Фронтир ограничен max_frontier, а множество уже виденных URL — max_seen и очищается
+    в начале каждого обхода, поэтому память не растёт с размером сайта;
+    страницы идут в IndexingSink и пишутся в базу пачками по мере обхода.
+    Учитывается robots.txt (в т.ч. Crawl-delay), между запросами к одному хосту — пауза delay.
+    Страница, редирект которой увёл на другой домен, не индексируется.
+    """
+
+    def __init__(
+        self,
+        parser: SiteParser,
+        sink: IndexingSink,
+        max_depth: int = MAX_DEPTH,
+        max_pages: int = MAX_PAGES,
+        max_frontier: int = MAX_FRONTIER,
+        max_seen: int = MAX_SEEN,
+        delay: float = CRAWL_DELAY,
+        concurrency: int = CRAWL_CONCURRENCY,
+        parse_classes: Optional[List[str]] = None
+    ):
+        self.parser = parser
+        self.sink = sink
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_frontier = max_frontier
+        self.max_seen = max_seen
+        self.delay = delay
+        self.concurrency = concurrency
+        self.parse_classes = parse_classes
+        self.stats = {"pages": 0, "indexed": 0, "skipped_robots": 0, "skipped_redirects": 0, "dropped_links": 0}
+        self._frontier: Deque[Tuple[str, int]] = deque()
+        self._seen: Set[str] = set()
+        self._domains: Set[str] = set()
+        # Future на хост: параллельные воркеры ждут одну загрузку robots.txt
+        self._robots: Dict[str, "asyncio.Future[Optional[RobotFileParser]]"] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_last_request: Dict[str, float] = {}
+        self._in_progress = 0
+        self._wakeup = asyncio.Condition()
+
+    def _enqueue(self, url: str, depth: int):
+        url = normalize_url(url)
+        if url is None or url in self._seen:
+            return
+        if urlparse(url).netloc not in self._domains:
+            return
+        if len(self._frontier) >= self.max_frontier or len(self._seen) >= self.max_seen:
+            self.stats["dropped_links"] += 1
+            return
+        self._seen.add(url)
+        self._frontier.append((url, depth))
+
+    async def _load_robots(self, robots_url: str) -> Optional[RobotFileParser]:
+        try:
+            text = await self.parser.fetch_html(robots_url)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить {robots_url}: {e}")
+            return None
+        if text is None:
+            return None
+        robots = RobotFileParser(robots_url)
+        robots.parse(text.splitlines())
+        return robots
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parsed = urlparse(url)
+        host = parsed.netloc
+        future = self._robots.get(host)
+        if future is None:
+            future = asyncio.ensure_future(self._load_robots(f"{parsed.scheme}://{host}/robots.txt"))
+            self._robots[host] = future
+        # Отмена одного воркера не должна отменять загрузку, которую ждут остальные
+        return await asyncio.shield(future)
+
+    async def _polite_fetch(self, url: str, robots: Optional[RobotFileParser]) -> Tuple[Optional[str], str]:
+        """Скачать страницу, выдержав паузу с прошлого запроса к тому же хосту; HTML и итоговый URL"""
+        host = urlparse(url).netloc
+        delay = self.delay
+        if robots is not None:
+            delay = max(delay, float(robots.crawl_delay(self.parser.user_agent) or 0))
+
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._host_last_request.get(host, 0.0) + delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._host_last_request[host] = time.monotonic()
+        return await self.parser.fetch_page(url)
+
+    async def _process(self, url: str, depth: int):
+        robots = await self._robots_for(url)
+        if robots is not None and not robots.can_fetch(self.parser.user_agent, url):
+            self.stats["skipped_robots"] += 1
+            return
+
+        html, final_url = await self._polite_fetch(url, robots)
+        if not html:
+            return
+        if final_url != url:
+            # Домен и robots.txt проверяются по адресу, с которого страница реально получена
+            final_url = normalize_url(final_url) or final_url
+            final_host = urlparse(final_url).netloc
+            if final_host not in self._domains:
+                self.stats["skipped_redirects"] += 1
+                return
+            if final_host != urlparse(url).netloc:
+                robots = await self._robots_for(final_url)
+            if robots is not None and not robots.can_fetch(self.parser.user_agent, final_url):
+                self.stats["skipped_redirects"] += 1
+                return
+            self._seen.add(final_url)
+            url = final_url
+        self.stats["pages"] += 1
+
+        doc, links = await self.parser.parse_page(html, url, self.parse_classes)
+        if doc is not None:
+            meta = dict(doc.metadata, type="web", depth=depth)
+            meta["parsed_classes"] = ",".join(meta["parsed_classes"])
+            await self.sink.put(doc.page_content, meta, page_id(url))
+            self.stats["indexed"] += 1
+
+        if depth < self.max_depth:
+            for link in links:
+                self._enqueue(link, depth + 1)
+
+    def _can_take(self) -> bool:
+        return bool(self._frontier) and self.stats["pages"] + self._in_progress < self.max_pages
+
+    def _finished(self) -> bool:
+        if self.stats["pages"] >= self.max_pages:
+            return True
+        return self._in_progress == 0 and not self._frontier
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._can_take() or self._finished())
+                if not self._can_take():
+                    self._wakeup.notify_all()
+                    return
+                url, depth = self._frontier.popleft()
+                self._in_progress += 1
+
+            try:
+                await self._process(url, depth)
+            except Exception as e:
+                logger.error(f"Ошибка обработки {url}: {e}")
+            finally:
+                async with self._wakeup:
+                    self._in_progress -= 1
+                    self._wakeup.notify_all()
+
+    async def crawl(self, seeds: List[str]) -> Dict[str, int]:
+        """Обойти сайт от seeds; возвращает счётчики обхода"""
+        self._seen.clear()
+        self._frontier.clear()
+        self._domains.clear()
+        for seed in seeds:
+            url = normalize_url(seed)
+            if url is not None:
+                self._domains.add(urlparse(url).netloc)
+                self._enqueue(url, 0)
+
+        await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        logger.info(f"Обход завершён: {self.stats}, разбор: {self.parser.parse_throughput()}")
+        return self.stats
+
+
+async def crawl_to_rag(
+    seeds: List[str],
+    db,
+    parse_classes: Optional[List[str]] = None,
+    **crawler_options
+) -> Dict[str, int]:
+    """Обойти сайт и проиндексировать страницы в RagDB одной командой"""
+    async with SiteParser() as parser, IndexingSink(db, name="crawler") as sink:
+        crawler = SiteCrawler(parser, sink, parse_classes=parse_classes, **crawler_options)
+        stats = await crawler.crawl(seeds)
+    stats["indexed_chunks"] = sink.indexed_chunks
+    stats["failed"] = sink.failed_docs
+    return stats
+
+
+if __name__ == "__main__":
+    import rag_database
+
+    arg_parser = argparse.ArgumentParser(description="Обход сайта и загрузка страниц в RAG базу")
+    arg_parser.add_argument("seeds", nargs="+", help="Стартовые URL")
+    arg_parser.add_argument("--depth", type=int, default=MAX_DEPTH)
+    arg_parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    arg_parser.add_argument("--delay", type=float, default=CRAWL_DELAY)
+    arg_parser.add_argument("--classes", nargs="*", help="CSS-классы блоков с основным текстом")
+    arg_parser.add_argument("--collection", default="telegram_channels")
+    args = arg_parser.parse_args()
+
+    rag_db = rag_database.RagDB(
+        db="./chroma_db",
+        name=args.collection,
+        host=os.getenv("CHROMA_HOST"),
+        port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    result = asyncio.run(crawl_to_rag(
+        args.seeds,
+        rag_db,
+        parse_classes=args.classes,
+        max_depth=args.depth,
+        max_pages=args.max_pages,
+        delay=args.delay
+    ))
+    print(result)
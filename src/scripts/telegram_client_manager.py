@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from channel_sync import channel_key
+
+logger = logging.getLogger(__name__)
+
+MIN_REQUEST_INTERVAL = 0.5
+MAX_FLOOD_WAIT = 300
+ENTITY_TTL = 3600
+MAX_RETRIES = 3
+
+
+class TelegramClientManager:
+    """
+    Долгоживущий TelegramClient, общий для всего процесса бота.
+    Переподключается при обрыве, выдерживает паузы FloodWait для всех запросов аккаунта
+    и кэширует результаты get_entity.
+    """
+
+    def __init__(
+        self,
+        api_id: str,
+        api_hash: str,
+        session: str,
+        min_request_interval: float = MIN_REQUEST_INTERVAL,
+        max_flood_wait: int = MAX_FLOOD_WAIT,
+        entity_ttl: float = ENTITY_TTL
+    ):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.session = session
+        self.min_request_interval = min_request_interval
+        self.max_flood_wait = max_flood_wait
+        self.entity_ttl = entity_ttl
+
+        self._client: Optional[TelegramClient] = None
+        self._connect_lock = asyncio.Lock()
+        self._pace_lock = asyncio.Lock()
+        self._next_request_at = 0.0
+        self._entities: Dict[str, Tuple[Any, float]] = {}
+        self.flood_wait_total = 0.0
+
+    async def get_client(self) -> TelegramClient:
+        """Подключённый и авторизованный клиент; соединение создаётся один раз"""
+        async with self._connect_lock:
+            if self._client is None:
+                # FloodWait обрабатываем сами, чтобы пауза распространялась на все запросы аккаунта
+                self._client = TelegramClient(
+                    self.session, self.api_id, self.api_hash, flood_sleep_threshold=0
+                )
+            if not self._client.is_connected():
+                logger.info(f"Подключение к Telegram (сессия {self.session})")
+                await self._client.start()
+            return self._client
+
+    async def _pace(self):
+        """Выдержать минимальный интервал между запросами и текущую паузу FloodWait"""
+        async with self._pace_lock:
+            delay = self._next_request_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request_at = time.monotonic() + self.min_request_interval
+
+    def flood_wait_remaining(self) -> float:
+        """Сколько секунд осталось до снятия ограничения по запросам"""
+        return max(0.0, self._next_request_at - time.monotonic())
+
+    async def request(self, method: Callable[..., Awaitable], *args, **kwargs):
+        """Выполнить запрос клиента с учётом пауз FloodWait и переподключения"""
+        for attempt in range(1, MAX_RETRIES + 1):
+            await self._pace()
+            try:
+                return await method(*args, **kwargs)
+            except FloodWaitError as e:
+                if e.seconds > self.max_flood_wait or attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"FloodWait {e.seconds}s, запросы аккаунта приостановлены")
+                self.flood_wait_total += e.seconds
+                self._next_request_at = max(self._next_request_at, time.monotonic() + e.seconds)
+            except ConnectionError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"Соединение с Telegram потеряно ({e}), переподключение")
+                await self.get_client()
+
+    async def iter_messages(
+        self,
+        entity,
+        limit: Optional[int] = None,
+        min_id: int = 0,
+        max_id: int = 0,
+        reverse: bool = False
+    ):
+        """
+        Постраничный обход сообщений (iter_messages) с паузами между страницами.
+        После FloodWait обход продолжается с последнего полученного сообщения.
+        """
+        client = await self.get_client()
+        yielded = 0
+        last_id = None
+
+        while limit is None or yielded < limit:
+            kwargs = {"min_id": min_id, "max_id": max_id, "reverse": reverse}
+            if last_id is not None:
+                if reverse:
+                    kwargs["min_id"] = last_id
+                else:
+                    kwargs["max_id"] = last_id
+
+            await self._pace()
+            try:
+                async for message in client.iter_messages(
+                    entity,
+                    limit=None if limit is None else limit - yielded,
+                    wait_time=self.min_request_interval,
+                    **kwargs
+                ):
+                    yielded += 1
+                    last_id = message.id
+                    yield message
+                return
+            except FloodWaitError as e:
+                if e.seconds > self.max_flood_wait:
+                    raise
+                logger.warning(f"FloodWait {e.seconds}s при обходе сообщений, продолжим с id {last_id}")
+                self.flood_wait_total += e.seconds
+                self._next_request_at = max(self._next_request_at, time.monotonic() + e.seconds)
+
+    async def get_entity(self, channel_link: str):
+        """get_entity с кэшем: повторные обращения к каналу не тратят запрос на резолв"""
+        key = channel_key(channel_link)
+        cached = self._entities.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        client = await self.get_client()
+        entity = await self.request(client.get_entity, channel_link)
+        self._entities[key] = (entity, time.monotonic() + self.entity_ttl)
+        return entity
+
+    async def disconnect(self):
+        async with self._connect_lock:
+            if self._client is not None and self._client.is_connected():
+                await self._client.disconnect()
+
+
+_managers: Dict[str, TelegramClientManager] = {}
+
+
+def get_client_manager(api_id: str, api_hash: str, session: str) -> TelegramClientManager:
+    """Общий менеджер клиента для сессии (один на процесс)"""
+    if session not in _managers:
+        _managers[session] = TelegramClientManager(api_id, api_hash, session)
+    return _managers[session]
+
+
+async def disconnect_all():
+    for manager in _managers.values():
+        await manager.disconnect()
@@ -0,0 +1,246 @@
+"""
+Подбор параметров HNSW для коллекции RAG базы.
+
+    python tune_index.py                          # замерить сетку параметров и вывести рекомендацию
+    python tune_index.py --m 16 32 48 --search-ef 32 64 128 --target-recall 0.98
+    python tune_index.py --apply                  # пересобрать коллекцию с рекомендованными параметрами
+
+Выборка векторов коллекции индексируется во временных коллекциях в памяти с каждым набором
+параметров. Для каждого набора замеряются recall@k относительно точного поиска перебором
+и задержка запроса. Запросы — фрагменты случайных документов коллекции (или строки --queries-file),
+закодированные той же моделью, что и при работе бота.
+"""
+import argparse
+import itertools
+import logging
+import os
+import random
+import statistics
+import time
+from typing import Dict, List, Sequence, Set
+
+import chromadb
+import numpy as np
+
+import rag_database
+from rag_database import HnswParams
+
+DEFAULT_M = (16, 32)
+DEFAULT_CONSTRUCTION_EF = (100, 200)
+DEFAULT_SEARCH_EF = (10, 32, 64, 128)
+TARGET_RECALL = 0.95
+QUERY_COUNT = 200
+TOPK = 5
+SAMPLE_SIZE = 20000
+QUERY_WORDS = 12
+INSERT_BATCH = 2000
+EXACT_QUERY_BATCH = 64
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_sample(db: rag_database.RagDB, sample_size: int, seed: int):
+    """
+    ids и эмбеддинги всей коллекции или случайной выборки из sample_size записей.
+    Выборка ids собирается reservoir sampling по страницам без эмбеддингов, а эмбеддинги
+    запрашиваются только для выбранных — память зависит от sample_size, а не от размера коллекции
+    """
+    rng = random.Random(seed)
+    ids: List[str] = []
+    seen = 0
+    for page in db.iter_items(include=[]):
+        for id_ in page["ids"]:
+            seen += 1
+            if not sample_size or len(ids) < sample_size:
+                ids.append(id_)
+            else:
+                slot = rng.randrange(seen)
+                if slot < sample_size:
+                    ids[slot] = id_
+
+    sampled: List[str] = []
+    vectors = []
+    for start in range(0, len(ids), INSERT_BATCH):
+        page = db.col.get(ids=ids[start:start + INSERT_BATCH], include=["embeddings"])
+        # Chroma не гарантирует порядок выдачи get(ids=...) и пропускает удалённые за это время записи
+        sampled.extend(page["ids"])
+        vectors.extend(np.asarray(vector, dtype=np.float32) for vector in page["embeddings"])
+    return sampled, np.asarray(vectors, dtype=np.float32)
+
+
+def sample_queries(db: rag_database.RagDB, ids: List[str], count: int, seed: int) -> List[str]:
+    """Запросы из фрагментов случайных документов: несколько подряд идущих слов"""
+    rng = random.Random(seed)
+    chosen = rng.sample(ids, min(count, len(ids)))
+    documents = db.col.get(ids=chosen, include=["documents"])["documents"]
+    queries = []
+    for document in documents:
+        words = (document or "").split()
+        if not words:
+            continue
+        start = rng.randrange(max(1, len(words) - QUERY_WORDS))
+        queries.append(" ".join(words[start:start + QUERY_WORDS]))
+    return queries
+
+
+def exact_topk(vectors: np.ndarray, queries: np.ndarray, space: str, topk: int) -> List[List[int]]:
+    """Точный поиск перебором в той же метрике, что и индекс"""
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    squared_norms = (vectors ** 2).sum(axis=1) if space == "l2" else None
+    k = min(topk, len(vectors))
+
+    result = []
+    for start in range(0, len(queries), EXACT_QUERY_BATCH):
+        block = queries[start:start + EXACT_QUERY_BATCH]
+        # Для l2 слагаемое |q|^2 одинаково для всех кандидатов и на порядок не влияет
+        distances = -2 * block @ vectors.T + squared_norms if space == "l2" else -(block @ vectors.T)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        result.extend(nearest.tolist())
+    return result
+
+
+def evaluate(
+    client,
+    params: HnswParams,
+    ids: List[str],
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: List[Set[str]],
+    topk: int
+) -> Dict[str, float]:
+    """Построить временный индекс с params и замерить recall@topk и задержку запросов"""
+    name = f"hnsw_tune_{params.space}_{params.m}_{params.construction_ef}_{params.search_ef}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    collection = client.create_collection(name=name, metadata=params.to_metadata())
+    try:
+        started = time.perf_counter()
+        for start in range(0, len(ids), INSERT_BATCH):
+            collection.add(ids=ids[start:start + INSERT_BATCH], embeddings=vectors[start:start + INSERT_BATCH].tolist())
+        build_seconds = time.perf_counter() - started
+
+        collection.query(query_embeddings=[queries[0].tolist()], n_results=topk)  # прогрев
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = collection.query(query_embeddings=[query.tolist()], n_results=topk)["ids"][0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(expected.intersection(found)) / len(expected))
+    finally:
+        client.delete_collection(name)
+
+    return {
+        "recall": statistics.fmean(recalls),
+        "p50_ms": _percentile(latencies, 50),
+        "p99_ms": _percentile(latencies, 99),
+        "build_seconds": build_seconds,
+    }
+
+
+def recommend(results: List[tuple], target_recall: float) -> tuple:
+    """Самый быстрый набор с recall не ниже цели; если таких нет — с наибольшим recall"""
+    good = [item for item in results if item[1]["recall"] >= target_recall]
+    if good:
+        return min(good, key=lambda item: (item[1]["p50_ms"], item[1]["build_seconds"]))
+    return max(results, key=lambda item: (item[1]["recall"], -item[1]["p50_ms"]))
+
+
+def candidate_params(
+    current: HnswParams,
+    space: str,
+    m_values: Sequence[int],
+    construction_values: Sequence[int],
+    search_values: Sequence[int]
+) -> List[HnswParams]:
+    candidates = [
+        HnswParams(space=space, construction_ef=construction_ef, search_ef=search_ef, m=m)
+        for m, construction_ef, search_ef in itertools.product(m_values, construction_values, search_values)
+    ]
+    if current.space == space and current not in candidates:
+        candidates.insert(0, current)  # текущие параметры — точка отсчёта
+    return candidates
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("unidb").setLevel(logging.WARNING)
+
+    arg_parser = argparse.ArgumentParser(description="Подбор параметров HNSW по recall и задержке")
+    arg_parser.add_argument("--collection", default="telegram_channels")
+    arg_parser.add_argument("--space", choices=("l2", "cosine", "ip"), help="Метрика (по умолчанию — текущая)")
+    arg_parser.add_argument("--m", type=int, nargs="+", default=list(DEFAULT_M))
+    arg_parser.add_argument("--construction-ef", type=int, nargs="+", default=list(DEFAULT_CONSTRUCTION_EF))
+    arg_parser.add_argument("--search-ef", type=int, nargs="+", default=list(DEFAULT_SEARCH_EF))
+    arg_parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    arg_parser.add_argument("--topk", type=int, default=TOPK)
+    arg_parser.add_argument("--queries", type=int, default=QUERY_COUNT)
+    arg_parser.add_argument("--queries-file", help="Файл с запросами, по одному на строку")
+    arg_parser.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="Размер выборки векторов (0 — вся коллекция)")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--apply", action="store_true", help="Пересобрать коллекцию с рекомендованными параметрами")
+    arg_parser.add_argument("--drop-backup", action="store_true", help="Удалить старую коллекцию после пересборки")
+    args = arg_parser.parse_args()
+
+    db = rag_database.RagDB(
+        db="./chroma_db",
+        name=args.collection,
+        host=os.getenv("CHROMA_HOST"),
+        port=int(os.getenv("CHROMA_PORT", "8000"))
+    )
+    current = db.hnsw
+    space = args.space or current.space
+
+    ids, vectors = load_sample(db, args.sample, args.seed)
+    if len(ids) <= args.topk:
+        print(f"В коллекции {args.collection} слишком мало записей для подбора: {len(ids)}")
+        return
+
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            query_texts = [line.strip() for line in f if line.strip()][:args.queries]
+    else:
+        query_texts = sample_queries(db, ids, args.queries, args.seed)
+    if not query_texts:
+        print("Нет запросов для замера")
+        return
+    queries = np.asarray(db.vec.encode(query_texts), dtype=np.float32)
+    truth = [{ids[i] for i in row} for row in exact_topk(vectors, queries, space, args.topk)]
+    print(f"Коллекция {args.collection}: выборка {len(ids)} векторов, {len(queries)} запросов, текущие параметры {current}")
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for params in candidate_params(current, space, args.m, args.construction_ef, args.search_ef):
+        result = evaluate(client, params, ids, vectors, queries, truth, args.topk)
+        results.append((params, result))
+        print(
+            f"M={params.m:<3} construction_ef={params.construction_ef:<4} search_ef={params.search_ef:<4} "
+            f"recall@{args.topk} {result['recall']:.3f}  p50 {result['p50_ms']:.2f} мс  "
+            f"p99 {result['p99_ms']:.2f} мс  построение {result['build_seconds']:.1f} с"
+        )
+
+    best, best_result = recommend(results, args.target_recall)
+    if best_result["recall"] < args.target_recall:
+        print(f"⚠️ Ни один набор не дал recall {args.target_recall}; лучший по recall:")
+    print(f"Рекомендация: {best} (recall {best_result['recall']:.3f}, p50 {best_result['p50_ms']:.2f} мс)")
+
+    if best == current:
+        print("Коллекция уже использует эти параметры")
+    elif args.apply:
+        backup = db.rebuild_collection(best, drop_backup=args.drop_backup)
+        if backup:
+            print(f"Старая коллекция сохранена как {backup}; удалить её можно после проверки")
+    else:
+        print("Для пересборки коллекции запустите с --apply (бот и воркер на это время нужно остановить)")
+
+
+if __name__ == "__main__":
+    main()
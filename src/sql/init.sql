@@ -0,0 +1,40 @@
+CREATE TABLE IF NOT EXISTS users (
+    tg_id BIGINT PRIMARY KEY,
+    registered_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS dialog_messages (
+    id BIGSERIAL PRIMARY KEY,
+    tg_id BIGINT NOT NULL REFERENCES users (tg_id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    message_id BIGINT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS dialog_messages_tg_id_created_at_idx
+    ON dialog_messages (tg_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    tg_id BIGINT NOT NULL,
+    chat_id BIGINT NOT NULL,
+    channel TEXT NOT NULL,
+    post_limit INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    min_post_id BIGINT,
+    newest_post_id BIGINT NOT NULL DEFAULT 0,
+    checkpoint_post_id BIGINT NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    indexed_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS ingest_jobs_status_idx ON ingest_jobs (status, id);
+CREATE INDEX IF NOT EXISTS ingest_jobs_tg_id_idx ON ingest_jobs (tg_id, id DESC);
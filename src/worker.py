@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import signal
+from collections import defaultdict
+from typing import Dict, Optional
+
+from bot import ingest_jobs
+from bot.bot_instance import get_bot
+from bot.db_pool import create_db_pool, close_db_pool
+from rag_integration import RealRAGBot, rag_system, start_channel_refresh, stop_channel_refresh, close_telegram_clients
+from ingest_pipeline import IndexingSink
+from metrics import start_metrics_server
+
+logger = logging.getLogger("ingest_worker")
+
+WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "4"))
+POLL_INTERVAL = 2.0
+HEARTBEAT_INTERVAL = 10.0
+CANCEL_DRAIN_TIMEOUT = 30.0
+
+
+class JobProgress:
+    """Прогресс одной задачи: какие посты переданы в стадию индексации и под каким номером"""
+
+    def __init__(self, job: Dict):
+        self.job = job
+        self.newest_post_id = job["newest_post_id"]
+        self.processed = job["processed"]
+        self.cancel_requested = False
+        # id документа -> (post_id, номер сообщения с начала задачи)
+        self.inflight: Dict[str, tuple] = {}
+
+    def track(self, id_: str, post_id: int, seen: int):
+        self.newest_post_id = max(self.newest_post_id, post_id)
+        self.inflight[id_] = (post_id, self.job["processed"] + seen)
+
+
+class IngestWorker:
+    """
+    Отдельный процесс загрузки каналов: забирает задачи из очереди в Postgres,
+    гонит посты через общую стадию индексации и после каждой записанной пачки
+    сохраняет чекпоинт. Посты идут от новых к старым, поэтому чекпоинт — самый старый
+    записанный пост: после падения задача продолжается с него (max_id).
+    """
+
+    def __init__(self, rag: RealRAGBot, concurrency: int = WORKER_CONCURRENCY):
+        self.rag = rag
+        self.concurrency = concurrency
+        self.sink: Optional[IndexingSink] = None
+        self._progress: Dict[int, JobProgress] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    async def run(self):
+        self.sink = IndexingSink(self.rag.db, on_flush=self._on_flush, name="worker")
+        self.sink.start()
+        start_channel_refresh()
+        logger.info(f"Воркер загрузки запущен (до {self.concurrency} задач одновременно)")
+
+        while not self._stopping.is_set():
+            job = None
+            if len(self._tasks) < self.concurrency:
+                job = await ingest_jobs.claim_job()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks[job["id"]] = task
+            task.add_done_callback(lambda _, job_id=job["id"]: self._tasks.pop(job_id, None))
+
+        await self._shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _shutdown(self):
+        """Остановить задачи, дописать очередь индексации и вернуть незавершённые задачи в очередь"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        await self.sink.close()
+        for job_id in list(self._progress):
+            await ingest_jobs.requeue_job(job_id)
+        await stop_channel_refresh()
+        await close_telegram_clients()
+
+    async def _on_flush(self, batch, success: bool):
+        """Чекпоинт после записи пачки: все посты задачи новее последнего в пачке уже в базе"""
+        by_job = defaultdict(list)
+        for _, _, id_, job_id in batch:
+            by_job[job_id].append(id_)
+
+        for job_id, ids in by_job.items():
+            progress = self._progress.get(job_id)
+            if progress is None:
+                continue
+            positions = [progress.inflight.pop(id_) for id_ in ids if id_ in progress.inflight]
+            if not positions:
+                continue
+            checkpoint_post_id, processed = min(positions)
+            await ingest_jobs.save_checkpoint(
+                job_id,
+                checkpoint_post_id,
+                processed,
+                progress.newest_post_id,
+                indexed=len(ids) if success else 0,
+                failed=0 if success else len(ids)
+            )
+
+    async def _heartbeat(self, job_id: int, job_task: asyncio.Task):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if await ingest_jobs.heartbeat(job_id):
+                self._progress[job_id].cancel_requested = True
+                job_task.cancel()
+                return
+
+    async def _run_job(self, job: Dict):
+        job_id = job["id"]
+        channel = job["channel"]
+        progress = JobProgress(job)
+        self._progress[job_id] = progress
+
+        min_id = job["min_post_id"]
+        if min_id is None:
+            cursor = self.rag.cursors.get(channel)
+            min_id = cursor["last_post_id"] if cursor else 0
+            await ingest_jobs.set_start_position(job_id, min_id)
+
+        limit = job["post_limit"]
+        if limit is not None:
+            limit = max(0, limit - job["processed"])
+
+        if job["checkpoint_post_id"]:
+            logger.info(f"Задача #{job_id}: продолжение {channel} с поста {job['checkpoint_post_id']}")
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
+        try:
+            if limit != 0:
+                await self.rag.stream_channel(
+                    channel,
+                    limit,
+                    self.sink,
+                    min_id=min_id,
+                    max_id=job["checkpoint_post_id"],
+                    group=job_id,
+                    on_post=progress.track
+                )
+            await self.sink.drain(job_id)
+        except asyncio.CancelledError:
+            if not progress.cancel_requested:
+                # Остановка воркера: задача вернётся в очередь в _shutdown
+                raise
+            try:
+                # Пачка с постами задачи может писаться долго — не ждём её бесконечно
+                await asyncio.wait_for(self.sink.drain(job_id), timeout=CANCEL_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Задача #{job_id}: запись уже переданных постов не завершилась за {CANCEL_DRAIN_TIMEOUT:.0f} с")
+            await self._finish(job, progress, "cancelled", f"🛑 Загрузка канала {channel} отменена (задача #{job_id}).")
+            return
+        except Exception as e:
+            logger.error(f"Задача #{job_id} завершилась ошибкой: {e}")
+            await self._finish(job, progress, "failed", f"❌ Ошибка при загрузке канала {channel}: {e}")
+            return
+        finally:
+            heartbeat.cancel()
+
+        indexed = self.sink.indexed_by_group.pop(job_id, 0)
+        failed = self.sink.failed_by_group.pop(job_id, 0)
+        if not failed and progress.newest_post_id > min_id:
+            self.rag.cursors.update(channel, progress.newest_post_id)
+
+        await self._finish(
+            job, progress, "done",
+            f"✅ Канал {channel} загружен (задача #{job_id}).\n📊 Проиндексировано постов: {indexed + job['indexed_count']}"
+            + (f", пропущено: {failed}" if failed else "")
+        )
+
+    async def _finish(self, job: Dict, progress: JobProgress, status: str, text: str):
+        self._progress.pop(job["id"], None)
+        await ingest_jobs.finish_job(job["id"], status, text)
+        try:
+            await get_bot().send_message(job["chat_id"], text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление по задаче #{job['id']}: {e}")
+
+
+async def main():
+    if not isinstance(rag_system, RealRAGBot):
+        raise SystemExit("Воркеру нужны RAG компоненты (ChromaDB, sentence-transformers, Telethon)")
+    if await create_db_pool() is None:
+        raise SystemExit("Воркеру нужен Postgres: задайте DATABASE_URL")
+
+    worker = IngestWorker(rag_system)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    metrics_runner = await start_metrics_server()
+    try:
+        await worker.run()
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await get_bot().session.close()
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC / "scripts"))
+sys.path.insert(0, str(SRC))
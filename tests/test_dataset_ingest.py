@@ -0,0 +1,89 @@
+import pytest
+
+pl = pytest.importorskip("polars")
+
+from dataset_ingest import DatasetIngestor, dataset_key
+
+ROWS = 1000
+
+
+class FakeDB:
+    """RagDB с записью в словарь; fail_after — упасть после стольких успешных пачек"""
+
+    def __init__(self, path, fail_after=None):
+        self.path = str(path)
+        self.fail_after = fail_after
+        self.calls = 0
+        self.records = {}
+
+    def add_texts(self, texts, metadatas, ids=None, batch_size=32):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise RuntimeError("обрыв загрузки")
+        self.calls += 1
+        for text, meta, id_ in zip(texts, metadatas, ids):
+            self.records[id_] = (text, meta)
+        return len(texts)
+
+
+@pytest.fixture
+def parquet_source(tmp_path):
+    path = tmp_path / "dialogs.parquet"
+    pl.DataFrame({
+        "text": [f"реплика {i}" if i % 97 else None for i in range(ROWS)],
+        "lang": ["ru" if i % 2 else "en" for i in range(ROWS)],
+        "tags": [[f"t{i % 3}"] for i in range(ROWS)],
+    }).write_parquet(path)
+    return str(path)
+
+
+def _expected_ids(key):
+    return {f"{key}_{i}" for i in range(ROWS) if i % 97}
+
+
+def test_full_run_writes_every_text_row(tmp_path, parquet_source):
+    db = FakeDB(tmp_path / "db")
+    written = DatasetIngestor(db, parquet_source, "text", ["lang", "tags"], batch_rows=128).run()
+
+    key = dataset_key(parquet_source)
+    assert written == len(_expected_ids(key))
+    assert set(db.records) == _expected_ids(key)
+    text, meta = db.records[f"{key}_5"]
+    assert text == "реплика 5"
+    assert meta["row"] == 5 and meta["lang"] == "ru" and meta["tags"] == '["t2"]'
+
+
+def test_resume_from_checkpoint_after_failure(tmp_path, parquet_source):
+    failing = FakeDB(tmp_path / "db", fail_after=3)
+    with pytest.raises(RuntimeError):
+        DatasetIngestor(failing, parquet_source, "text", batch_rows=128).run()
+
+    key = dataset_key(parquet_source)
+    ingestor = DatasetIngestor(FakeDB(tmp_path / "db"), parquet_source, "text", batch_rows=128)
+    offset = ingestor.checkpoints.get(key)
+    assert 0 < offset < ROWS
+
+    ingestor.run()
+    # Второй прогон начинается с чекпоинта и не трогает уже записанные строки
+    assert min(meta["row"] for _, meta in ingestor.db.records.values()) >= offset
+    assert set(failing.records) | set(ingestor.db.records) == _expected_ids(key)
+    assert not set(failing.records) & set(ingestor.db.records)
+    assert ingestor.checkpoints.get(key) == ROWS
+
+
+def test_ids_are_stable_across_restart_and_batch_size(tmp_path, parquet_source):
+    first = FakeDB(tmp_path / "db")
+    DatasetIngestor(first, parquet_source, "text", batch_rows=100).run()
+
+    second = FakeDB(tmp_path / "db")
+    DatasetIngestor(second, parquet_source, "text", batch_rows=333).run(restart=True)
+
+    assert first.records == second.records
+
+
+def test_csv_source(tmp_path):
+    path = tmp_path / "posts.csv"
+    pl.DataFrame({"body": [f"пост {i}" for i in range(50)], "author": ["a", "b"] * 25}).write_csv(path)
+
+    db = FakeDB(tmp_path / "db")
+    assert DatasetIngestor(db, str(path), "body", ["author"], batch_rows=16).run() == 50
+    assert db.records["posts_49"] == ("пост 49", {"author": "b", "source": "posts", "type": "dataset", "row": 49})
@@ -0,0 +1,56 @@
+import zipfile
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+pytest.importorskip("pypdf")
+
+from document_loader import _iter_docx, _iter_epub
+
+CONTAINER = (
+    '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+    "</container>"
+)
+OPF = (
+    '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0"><manifest>'
+    '<item id="c2" href="text/c2.xhtml" media-type="application/xhtml+xml"/>'
+    '<item id="c1" href="text/c1.xhtml" media-type="application/xhtml+xml"/>'
+    '<item id="css" href="style.css" media-type="text/css"/>'
+    '</manifest><spine><itemref idref="c1"/><itemref idref="c2"/></spine></package>'
+)
+
+
+def test_epub_chapters_follow_spine(tmp_path):
+    path = tmp_path / "book.epub"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/epub+zip")
+        archive.writestr("META-INF/container.xml", CONTAINER)
+        archive.writestr("OEBPS/content.opf", OPF)
+        archive.writestr("OEBPS/text/c1.xhtml", "<html><body><p>Первая глава</p></body></html>")
+        archive.writestr("OEBPS/text/c2.xhtml", "<html><body><p>Вторая глава</p></body></html>")
+        archive.writestr("OEBPS/style.css", "p {}")
+
+    assert list(_iter_epub(str(path))) == [
+        ("OEBPS/text/c1.xhtml", "Первая глава"),
+        ("OEBPS/text/c2.xhtml", "Вторая глава"),
+    ]
+
+
+def test_docx_sections_split_on_headings(tmp_path):
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    document.add_paragraph("Вступление")
+    document.add_heading("Глава 1", 1)
+    document.add_paragraph("Текст первой главы")
+    document.add_heading("Глава 2", 1)
+    document.add_paragraph("Текст второй главы")
+    path = tmp_path / "book.docx"
+    document.save(path)
+
+    assert list(_iter_docx(str(path))) == [
+        ("", "Вступление"),
+        ("Глава 1", "Глава 1\nТекст первой главы"),
+        ("Глава 2", "Глава 2\nТекст второй главы"),
+    ]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("lxml")
+pytest.importorskip("bs4")
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from download_web import HttpCache, SiteParser
+
+CP1251_PAGE = '<html><head><meta charset="windows-1251"></head><body>Привет</body></html>'.encode("cp1251")
+
+
+async def _fetch(tmp_path, path, **parser_options):
+    async def handler(request):
+        if request.path == "/cp1251":
+            return web.Response(body=CP1251_PAGE, headers={"Content-Type": "text/html", "ETag": '"a"'})
+        return web.Response(body=b"x" * 1000, headers={"Content-Type": "text/html", "ETag": '"big"'})
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    url = f"http://127.0.0.1:{server.port}{path}"
+    try:
+        async with SiteParser(cache_dir=str(tmp_path), parse_workers=0, **parser_options) as parser:
+            return url, await parser.fetch_html(url), parser.stats
+    finally:
+        await server.close()
+
+
+def test_charset_from_meta_tag(tmp_path):
+    url, html, _ = asyncio.run(_fetch(tmp_path, "/cp1251"))
+
+    assert "Привет" in html
+    assert HttpCache(str(tmp_path)).load(url) == html
+
+
+def test_truncated_body_is_not_cached(tmp_path):
+    url, html, stats = asyncio.run(_fetch(tmp_path, "/big", max_bytes=100))
+
+    assert len(html) == 100 and stats["truncated"] == 1
+    cache = HttpCache(str(tmp_path))
+    assert cache.load(url) is None
+    assert cache.validators(url) == {}
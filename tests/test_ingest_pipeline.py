@@ -0,0 +1,46 @@
+import asyncio
+
+from ingest_pipeline import IndexingSink
+from metrics import QUEUE_DEPTH, registry
+
+
+class RecordingDB:
+    def __init__(self):
+        self.calls = []
+
+    def add_texts(self, texts, metadatas, ids=None, batch_size=32):
+        self.calls.append((list(texts), ids))
+        return len(texts)
+
+
+def test_mixed_batch_keeps_stable_ids():
+    async def scenario():
+        db = RecordingDB()
+        async with IndexingSink(db, batch_size=10) as sink:
+            await sink.put("a", {}, "id-a")
+            await sink.put("b", {})
+            await sink.put("c", {}, "id-c")
+        return db.calls, sink
+
+    calls, sink = asyncio.run(scenario())
+    assert (["a", "c"], ["id-a", "id-c"]) in calls
+    assert (["b"], None) in calls
+    assert sink.indexed_docs == 3 and sink.indexed_chunks == 3
+
+
+def test_each_sink_has_its_own_metric_series():
+    async def scenario():
+        first, second = IndexingSink(RecordingDB(), name="bot"), IndexingSink(RecordingDB(), name="bot")
+        first.start()
+        second.start()
+        await first.put("a", {}, "1")
+        rendered = registry.render()
+        await first.close()
+        await second.close()
+        return first, second, rendered, registry.render()
+
+    first, second, running, stopped = asyncio.run(scenario())
+    assert first.metric_label != second.metric_label
+    assert f'queue="{first.metric_label}"' in running and f'queue="{second.metric_label}"' in running
+    assert f'queue="{first.metric_label}"' not in stopped
+    assert QUEUE_DEPTH.name in running
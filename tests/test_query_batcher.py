@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+from query_batcher import QueryBatcher
+
+
+class FakeDB:
+    """query_batch с записью пачек; release задерживает ответ, пока тест его не отпустит"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.release = threading.Event()
+        self.release.set()
+
+    def query_batch(self, texts, topk, context_vectors=None):
+        self.batches.append((list(texts), topk, context_vectors))
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("chroma недоступна")
+        return [[{"doc": f"{text}:{topk}"}] for text in texts]
+
+
+def test_full_batch_flushes_without_waiting_for_timer():
+    async def scenario():
+        db = FakeDB()
+        batcher = QueryBatcher(db, max_batch=3, max_wait=10)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.query(t) for t in "abc")), 1)
+        return db.batches, results
+
+    batches, results = asyncio.run(scenario())
+    assert batches == [(["a", "b", "c"], 5, None)]
+    assert results == [[{"doc": "a:5"}], [{"doc": "b:5"}], [{"doc": "c:5"}]]
+
+
+def test_timer_flushes_partial_batch_and_separates_topk():
+    async def scenario():
+        db = FakeDB()
+        batcher = QueryBatcher(db, max_batch=32, max_wait=0.01)
+        await asyncio.gather(batcher.query("a", topk=3), batcher.query("b", topk=3), batcher.query("c", topk=7))
+        return db.batches
+
+    batches = asyncio.run(scenario())
+    assert sorted((texts, topk) for texts, topk, _ in batches) == [(["a", "b"], 3), (["c"], 7)]
+
+
+def test_backlog_is_flushed_when_inflight_slot_frees():
+    async def scenario():
+        db = FakeDB()
+        db.release.clear()
+        batcher = QueryBatcher(db, max_batch=2, max_wait=0.001, max_inflight=1)
+        first = [asyncio.ensure_future(batcher.query(t)) for t in "ab"]
+        await asyncio.sleep(0.05)
+        backlog = [asyncio.ensure_future(batcher.query(t)) for t in "cde"]
+        await asyncio.sleep(0.05)
+        # Пока занят единственный слот, новые запросы копятся, а не уходят отдельными пачками
+        waiting = len(db.batches)
+        db.release.set()
+        await asyncio.wait_for(asyncio.gather(*first, *backlog), 1)
+        return waiting, db.batches
+
+    waiting, batches = asyncio.run(scenario())
+    assert waiting == 1
+    assert [texts for texts, _, _ in batches] == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_cancelled_queries_are_skipped():
+    async def scenario():
+        db = FakeDB()
+        batcher = QueryBatcher(db, max_batch=32, max_wait=0.02)
+        cancelled = asyncio.ensure_future(batcher.query("stale"))
+        kept = asyncio.ensure_future(batcher.query("fresh"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await batcher.drain()
+        return db.batches, await kept
+
+    batches, result = asyncio.run(scenario())
+    assert batches == [(["fresh"], 5, None)]
+    assert result == [{"doc": "fresh:5"}]
+
+
+def test_error_is_delivered_to_every_query_in_batch():
+    async def scenario():
+        batcher = QueryBatcher(FakeDB(fail=True), max_batch=32, max_wait=0.01)
+        return await asyncio.gather(batcher.query("a"), batcher.query("b"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 2
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_context_vectors_are_passed_only_when_present():
+    async def scenario():
+        db = FakeDB()
+        batcher = QueryBatcher(db, max_batch=2, max_wait=10)
+        await asyncio.gather(batcher.query("a", context_vector=[1.0]), batcher.query("b"))
+        return db.batches
+
+    assert asyncio.run(scenario())[0][2] == [[1.0], None]
+
+
+def test_drain_waits_for_pending_queries():
+    async def scenario():
+        db = FakeDB()
+        batcher = QueryBatcher(db, max_batch=32, max_wait=10)
+        future = asyncio.ensure_future(batcher.query("a"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(batcher.drain(), 1)
+        return future.done(), db.batches
+
+    done, batches = asyncio.run(scenario())
+    assert done and batches == [(["a"], 5, None)]
@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from query_vectors import DialogVectors, QueryEmbeddingCache, mix_query_vector
+
+
+def test_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("a", np.array([1.0]))
+    cache.put("b", np.array([2.0]))
+    assert cache.get("a") is not None  # «a» становится самым свежим
+    cache.put("c", np.array([3.0]))
+
+    assert cache.get("b") is None
+    assert cache.get("a")[0] == 1.0 and cache.get("c")[0] == 3.0
+    assert len(cache) == 2
+
+
+def test_cache_with_zero_size_stores_nothing():
+    cache = QueryEmbeddingCache(max_size=0)
+    cache.put("a", np.array([1.0]))
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_mix_keeps_query_norm_and_moves_towards_dialog():
+    query = np.array([3.0, 0.0])
+    dialog = np.array([0.0, 1.0])
+
+    mixed = mix_query_vector(query, dialog, weight=0.5)
+
+    assert np.linalg.norm(mixed) == pytest.approx(3.0)
+    assert 0 < mixed[1] < mixed[0]
+    assert mix_query_vector(query, None) is query
+
+
+def test_dialog_vector_is_running_average():
+    vectors = DialogVectors(decay=0.5)
+    assert vectors.get("user") is None
+
+    vectors.update("user", np.array([2.0, 0.0]))
+    np.testing.assert_allclose(vectors.get("user"), [1.0, 0.0])
+
+    vectors.update("user", np.array([0.0, 5.0]))
+    np.testing.assert_allclose(vectors.get("user"), np.array([1.0, 1.0]) / np.sqrt(2), rtol=1e-6)
+
+    vectors.reset("user")
+    assert vectors.get("user") is None
+
+
+def test_dialog_vectors_are_bounded():
+    vectors = DialogVectors(max_sessions=2)
+    for key in ("a", "b", "c"):
+        vectors.update(key, np.array([1.0, 0.0]))
+
+    assert vectors.get("a") is None
+    assert vectors.get("b") is not None and vectors.get("c") is not None
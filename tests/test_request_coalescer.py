@@ -0,0 +1,99 @@
+import asyncio
+
+from bot.request_coalescer import RequestCoalescer
+
+DEBOUNCE = 0.01
+
+
+def _run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_burst_is_coalesced_into_one_generation():
+    async def scenario():
+        calls = []
+
+        async def handler(key, items):
+            calls.append(list(items))
+
+        coalescer = RequestCoalescer(handler, debounce=DEBOUNCE)
+        for text in ("a", "b", "c"):
+            coalescer.submit(1, text)
+        await coalescer.drain()
+        return calls
+
+    assert _run(scenario) == [["a", "b", "c"]]
+
+
+def test_uncommitted_generation_is_superseded():
+    async def scenario():
+        calls = []
+        answered = []
+
+        async def handler(key, items):
+            calls.append(list(items))
+            await asyncio.sleep(0.2)  # «LLM»
+            coalescer.commit(key, items)
+            answered.append(list(items))
+
+        coalescer = RequestCoalescer(handler, debounce=DEBOUNCE)
+        coalescer.submit(1, "a")
+        await asyncio.sleep(0.05)
+        coalescer.submit(1, "b")
+        await coalescer.drain()
+        return calls, answered, coalescer.superseded
+
+    calls, answered, superseded = _run(scenario)
+    assert calls == [["a"], ["a", "b"]]
+    assert answered == [["a", "b"]]
+    assert superseded == 1
+
+
+def test_committed_generation_is_not_cancelled_or_repeated():
+    async def scenario():
+        calls = []
+        sent = []
+        committed = asyncio.Event()
+
+        async def handler(key, items):
+            calls.append(list(items))
+            coalescer.commit(key, items)
+            committed.set()
+            await asyncio.sleep(0.1)  # сохранение контекста и отправка ответа
+            sent.append(list(items))
+
+        coalescer = RequestCoalescer(handler, debounce=DEBOUNCE)
+        coalescer.submit(1, "a")
+        await committed.wait()
+        coalescer.submit(1, "b")
+        await coalescer.drain()
+        return calls, sent, coalescer.superseded
+
+    calls, sent, superseded = _run(scenario)
+    assert calls == [["a"], ["b"]]
+    assert sent == [["a"], ["b"]]
+    assert superseded == 0
+
+
+def test_debounce_cancellation_is_not_swallowed():
+    async def scenario():
+        async def handler(key, items):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.2)  # отменённая генерация завершается не сразу
+                raise
+
+        coalescer = RequestCoalescer(handler, debounce=DEBOUNCE)
+        coalescer.submit(1, "a")
+        await asyncio.sleep(0.05)
+        coalescer.submit(1, "b")
+        await asyncio.sleep(0.05)
+        debounce = coalescer._slots[1].debounce_task
+        debounce.cancel()
+        await asyncio.sleep(0)
+        cancelled = debounce.cancelled()
+        await asyncio.wait({coalescer._slots[1].generation_task})
+        return cancelled
+
+    assert _run(scenario)
@@ -0,0 +1,99 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("lxml")
+pytest.importorskip("bs4")
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from download_web import SiteParser
+from site_crawler import SiteCrawler
+
+PAGES = {
+    "/": '<a href="/a">a</a> <a href="/b">b</a> <a href="/a#top">a</a> <a href="/private/x">x</a>'
+         ' <a href="{other}/external">внешняя</a>',
+    "/a": '<a href="/">home</a> <a href="/b">b</a> <a href="/a/deep">deep</a>',
+    "/b": '<a href="/a">a</a>',
+    "/a/deep": '<a href="/a/deeper">deeper</a>',
+    "/a/deeper": "слишком глубоко",
+    "/private/x": "закрыто robots.txt",
+    "/external": "другой домен",
+}
+ROBOTS = "User-agent: *\nDisallow: /private\n"
+
+
+class RecordingSink:
+    def __init__(self):
+        self.ids = []
+
+    async def put(self, text, metadata, id_=None, group=None):
+        self.ids.append(id_)
+
+
+async def _crawl(seeds_paths, **options):
+    requests = Counter()
+
+    async def handler(request):
+        requests[(request.host.split(":")[0], request.path)] += 1
+        if request.path == "/robots.txt":
+            await asyncio.sleep(0.05)  # воркеры успевают прийти за robots.txt одновременно
+            return web.Response(text=ROBOTS)
+        if request.path == "/moved":
+            raise web.HTTPFound(f"http://localhost:{request.url.port}/external")
+        if request.path not in PAGES:
+            raise web.HTTPNotFound()
+        other = f"http://localhost:{request.url.port}"
+        body = PAGES[request.path].format(other=other)
+        return web.Response(text=f"<html><body><p>{request.path}</p>{body}</body></html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        sink = RecordingSink()
+        async with SiteParser(cache_dir=None, parse_workers=0) as parser:
+            crawler = SiteCrawler(parser, sink, delay=0, **options)
+            stats = await crawler.crawl([base + path for path in seeds_paths])
+    finally:
+        await server.close()
+    return stats, requests, sink
+
+
+def test_robots_depth_domain_and_dedup():
+    stats, requests, sink = asyncio.run(_crawl(["/"], max_depth=2))
+
+    fetched = {path for (host, path) in requests if host == "127.0.0.1"}
+    assert fetched == {"/robots.txt", "/", "/a", "/b", "/a/deep"}
+    # Каждая страница скачана один раз, несмотря на повторные ссылки и якоря
+    assert all(count == 1 for count in requests.values())
+    assert not any(host == "localhost" for host, _ in requests)
+    assert stats["skipped_robots"] == 1
+    assert stats["pages"] == 4
+    assert len(sink.ids) == len(set(sink.ids)) == 4
+
+
+def test_robots_fetched_once_for_concurrent_workers():
+    stats, requests, _ = asyncio.run(_crawl(["/", "/a", "/b"], max_depth=0, concurrency=4))
+
+    assert requests[("127.0.0.1", "/robots.txt")] == 1
+    assert stats["pages"] == 3
+
+
+def test_seen_is_capped():
+    stats, requests, _ = asyncio.run(_crawl(["/"], max_depth=2, max_seen=2))
+
+    assert stats["pages"] == 2
+    assert stats["dropped_links"] > 0
+
+
+def test_redirect_to_other_domain_is_not_indexed():
+    stats, requests, sink = asyncio.run(_crawl(["/moved"], max_depth=1))
+
+    assert stats["skipped_redirects"] == 1
+    assert stats["pages"] == 0 and sink.ids == []